@@ -0,0 +1,13 @@
+"""
+Ustawienia gunicorna (wczytywane automatycznie z katalogu startu):
+`gunicorn invoice_manager.wsgi` albo z workerami uvicorna dla ASGI.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_manager.settings')
+
+
+def child_exit(server, worker):
+    # plik metryk martwego workera trafia do metrics-dead.json (zob. invoices.metrics)
+    from invoices import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Strumień /invoices/events/ (Server-Sent Events) wymaga serwera ASGI,
+np. `uvicorn invoice_manager.asgi:application --workers 4` - każde otwarte
+połączenie to korutyna, nie wątek. Przy kilku workerach ustaw
+INVOICE_EVENTS_BACKEND=changelog (zob. invoices.events).
 """
 
 import os
@@ -0,0 +1,129 @@
+"""
+Połączenia Relay (edges / pageInfo) ze stronicowaniem po kursorze
+zamiast listy całej tabeli.
+
+Kursor to zakodowane wartości pól sortowania ostatniego wiersza, więc
+`after` zamienia się w warunek WHERE (f1 > v1) OR (f1 = v1 AND pk > v2)
+na indeksie, a nie w OFFSET - kolejne strony kosztują tyle samo co
+pierwsza. `first` jest ograniczone przez
+GRAPHENE['RELAY_CONNECTION_MAX_LIMIT'], a totalCount liczony jest tylko
+wtedy, gdy klient o niego poprosi.
+"""
+import base64
+import binascii
+import functools
+import heapq
+import json
+
+import graphene
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from graphene_django.settings import graphene_settings
+
+
+class PaginationError(Exception):
+    pass
+
+
+class CountableConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(description="Liczba wszystkich elementów (dodatkowe zapytanie COUNT).")
+
+    def resolve_total_count(root, info):
+        return sum(queryset.count() for queryset, _ in root.sources)
+
+
+def connection_field(connection, **arguments):
+    return graphene.Field(connection, first=graphene.Int(), after=graphene.String(), **arguments)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise PaginationError("Nieprawidłowy kursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError("Nieprawidłowy kursor.")
+    return values
+
+
+def page_size(first):
+    limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if first is None:
+        return limit
+    if first < 0:
+        raise PaginationError("Argument first nie może być ujemny.")
+    if first > limit:
+        raise PaginationError(f"Argument first nie może przekraczać {limit}.")
+    return first
+
+
+def keyset_filter(ordering, values):
+    """
+    Wiersze leżące za wierszem o podanych wartościach pól sortowania.
+    """
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return condition
+
+
+def _values(obj, ordering):
+    return [getattr(obj, name.lstrip('-')) for name in ordering]
+
+
+def _sort_key(ordering):
+    def compare(a, b):
+        for name, x, y in zip(ordering, _values(a, ordering), _values(b, ordering)):
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if name.startswith('-') else result
+        return 0
+    return functools.cmp_to_key(compare)
+
+
+def paginate(connection, sources, ordering=('pk',), first=None, after=None):
+    """
+    Strona połączenia `connection`. sources to queryset albo lista par
+    (queryset, funkcja zamieniająca wiersz na węzeł) - kilka źródeł
+    (np. faktury bieżące i archiwalne) jest łączonych według `ordering`,
+    które musi jednoznacznie wyznaczać kolejność (kończyć się na pk).
+    """
+    if not isinstance(sources, (list, tuple)):
+        sources = [(sources, None)]
+    ordering = list(ordering)
+    size = page_size(first)
+    condition = keyset_filter(ordering, decode_cursor(after, len(ordering))) if after else None
+
+    streams = []
+    for queryset, convert in sources:
+        queryset = queryset.order_by(*ordering)
+        if condition is not None:
+            queryset = queryset.filter(condition)
+        rows = list(queryset[:size + 1])
+        streams.append([convert(row) for row in rows] if convert else rows)
+    nodes = streams[0] if len(streams) == 1 else list(heapq.merge(*streams, key=_sort_key(ordering)))
+
+    edge_type = connection.Edge
+    edges = [edge_type(node=node, cursor=encode_cursor(_values(node, ordering))) for node in nodes[:size]]
+    result = connection(
+        edges=edges,
+        page_info=graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=after is not None,
+            has_next_page=len(nodes) > size,
+        ),
+    )
+    result.sources = sources
+    return result
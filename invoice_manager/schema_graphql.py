@@ -1,9 +1,12 @@
 import graphene
-from django.db.models import Count
 from graphene_django.types import DjangoObjectType
 from graphql_jwt.decorators import login_required
 
-from invoices.models import Product, Invoice, InvoiceItem
+from invoices import bulk, deletion, idempotency, queries
+from invoices.archive import as_invoice
+from invoices.models import Product, Invoice, InvoiceItem, ArchivedInvoice
+from invoices.transitions import TransitionError, filter_invoices, transition_for_user
+from invoice_manager.pagination import CountableConnection, connection_field, paginate
 from django.contrib.auth.models import User
 import graphql_jwt
 
@@ -30,6 +33,34 @@ class InvoiceType(DjangoObjectType):
         model = Invoice
 
 
+# Połączenia Relay (stronicowanie kursorem, zob. invoice_manager.pagination)
+class UserConnection(CountableConnection):
+    class Meta:
+        node = UserType
+
+
+class ProductConnection(CountableConnection):
+    class Meta:
+        node = ProductType
+
+
+class InvoiceConnection(CountableConnection):
+    class Meta:
+        node = InvoiceType
+
+
+PRODUCT_FILTERS = {
+    'category': graphene.String(),
+    'name': graphene.String(description="Fragment nazwy (bez rozróżniania wielkości liter)."),
+}
+
+INVOICE_FILTERS = {
+    'status': graphene.String(),
+    'date_from': graphene.Date(),
+    'date_to': graphene.Date(),
+}
+
+
 # Mutacja do dodania produktu przez zalogowanego użytkownika
 class CreateProduct(graphene.Mutation):
     product = graphene.Field(ProductType)
@@ -38,15 +69,137 @@ class CreateProduct(graphene.Mutation):
         name = graphene.String(required=True)
         desc = graphene.String()
         price = graphene.Decimal(required=True)
+        idempotency_key = graphene.String()
 
-    def mutate(self, info, name, price, desc="", user=None):
-        product = Product.objects.create(
+    @login_required
+    def mutate(self, info, name, price, desc="", idempotency_key=None):
+        user = info.context.user
+        key = idempotency_key or info.context.headers.get('Idempotency-Key')
+        if key is None:
+            return CreateProduct(product=CreateProduct.create(name, price, desc, user))
+
+        fingerprint = idempotency.fingerprint('mutation', 'createProduct', {'name': name, 'desc': desc, 'price': price})
+        try:
+            record, claimed = idempotency.claim(user, 'graphql-create-product', key, fingerprint)
+        except idempotency.IdempotencyError as e:
+            raise Exception(str(e))
+        if not claimed:
+            return CreateProduct(product=Product.objects.filter(pk=record.response['product_id']).first())
+
+        try:
+            product = CreateProduct.create(name, price, desc, user)
+        except Exception:
+            idempotency.release(record)
+            raise
+        idempotency.complete(record, 200, {'product_id': product.pk})
+        return CreateProduct(product=product)
+
+    @staticmethod
+    def create(name, price, desc, user):
+        return Product.objects.create(
             name=name,
             desc=desc,
             price=price,
-            created_by=User.objects.get(id=1)
+            created_by=user,
+            updated_by=user,
         )
-        return CreateProduct(product=product)
+
+
+# Zbiorcze tworzenie produktów i faktur (zob. invoices.bulk)
+class BulkErrorType(graphene.ObjectType):
+    field = graphene.String()
+    message = graphene.String()
+
+
+class ProductInput(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    price = graphene.Decimal(required=True)
+    desc = graphene.String()
+    category = graphene.String()
+
+
+class InvoiceItemInput(graphene.InputObjectType):
+    product_id = graphene.Int(required=True)
+    quantity = graphene.Int(required=True)
+    price = graphene.Decimal(description="Domyślnie cena produktu.")
+
+
+class InvoiceInput(graphene.InputObjectType):
+    items = graphene.List(graphene.NonNull(InvoiceItemInput), required=True)
+
+
+class ProductResult(graphene.ObjectType):
+    index = graphene.Int()
+    product = graphene.Field(ProductType)
+    errors = graphene.List(graphene.NonNull(BulkErrorType))
+
+
+class InvoiceResult(graphene.ObjectType):
+    index = graphene.Int()
+    invoice = graphene.Field(InvoiceType)
+    errors = graphene.List(graphene.NonNull(BulkErrorType))
+
+
+class CreateProducts(graphene.Mutation):
+    ok = graphene.Boolean(description="false - nic nie zapisano, błędy są w results.")
+    results = graphene.List(graphene.NonNull(ProductResult))
+
+    class Arguments:
+        products = graphene.List(graphene.NonNull(ProductInput), required=True)
+
+    @login_required
+    def mutate(self, info, products):
+        try:
+            ok, results = bulk.create_products(info.context.user, [dict(data) for data in products])
+        except bulk.BulkCreateError as e:
+            raise Exception(str(e))
+        return CreateProducts(ok=ok, results=[
+            ProductResult(index=result['index'], product=result['object'], errors=result['errors'])
+            for result in results
+        ])
+
+
+class CreateInvoices(graphene.Mutation):
+    ok = graphene.Boolean(description="false - nic nie zapisano, błędy są w results.")
+    results = graphene.List(graphene.NonNull(InvoiceResult))
+
+    class Arguments:
+        invoices = graphene.List(graphene.NonNull(InvoiceInput), required=True)
+
+    @login_required
+    def mutate(self, info, invoices):
+        inputs = [{'items': [dict(item) for item in data['items']]} for data in invoices]
+        try:
+            ok, results = bulk.create_invoices(info.context.user, inputs)
+        except bulk.BulkCreateError as e:
+            raise Exception(str(e))
+        return CreateInvoices(ok=ok, results=[
+            InvoiceResult(index=result['index'], invoice=result['object'], errors=result['errors'])
+            for result in results
+        ])
+
+
+# Zbiorcza zmiana statusu faktur (po id albo filtrze)
+class TransitionInvoices(graphene.Mutation):
+    updated = graphene.Int()
+    skipped = graphene.Int()
+    not_found = graphene.Int()
+
+    class Arguments:
+        status = graphene.String(required=True)
+        ids = graphene.List(graphene.NonNull(graphene.Int))
+        status_from = graphene.String()
+        date_from = graphene.Date()
+        date_to = graphene.Date()
+
+    @login_required
+    def mutate(self, info, status, ids=None, status_from=None, date_from=None, date_to=None):
+        try:
+            result = transition_for_user(info.context.user, status, ids=ids, status=status_from,
+                                         date_from=date_from, date_to=date_to)
+        except TransitionError as e:
+            raise Exception(str(e))
+        return TransitionInvoices(**result)
 
 
 # Mutacje główne
@@ -55,72 +208,87 @@ class Mutation(graphene.ObjectType):
     verify_token = graphql_jwt.Verify.Field()
     refresh_token = graphql_jwt.Refresh.Field()
     create_product = CreateProduct.Field()
+    create_products = CreateProducts.Field()
+    create_invoices = CreateInvoices.Field()
+    transition_invoices = TransitionInvoices.Field()
 
 # Główne zapytania
 class Query(graphene.ObjectType):
-    all_products = graphene.List(ProductType)
-    all_invoices = graphene.List(InvoiceType)
-    all_users = graphene.List(UserType)
+    all_products = connection_field(ProductConnection, **PRODUCT_FILTERS)
+    all_invoices = connection_field(InvoiceConnection, include_archived=graphene.Boolean(), **INVOICE_FILTERS)
+    all_users = connection_field(UserConnection)
 
     # Dodatkowe widoki jako zapytania
-    products_in_invoices = graphene.List(ProductType)
-    products_not_in_invoices = graphene.List(ProductType)
-    products_by_user_invoices = graphene.List(ProductType, user_id=graphene.Int())
+    products_in_invoices = connection_field(ProductConnection, **PRODUCT_FILTERS)
+    products_not_in_invoices = connection_field(ProductConnection, **PRODUCT_FILTERS)
+    products_by_user_invoices = connection_field(ProductConnection, user_id=graphene.Int(required=True), **PRODUCT_FILTERS)
 
-    users_with_paid_invoices = graphene.List(UserType)
-    users_with_invoices = graphene.List(UserType)
-    users_with_client_profile = graphene.List(UserType)
-    popular_products = graphene.List(ProductType)
-    invoice_basic_info = graphene.List(InvoiceType)
+    users_with_paid_invoices = connection_field(UserConnection)
+    users_with_invoices = connection_field(UserConnection)
+    users_with_client_profile = connection_field(UserConnection)
+    popular_products = connection_field(ProductConnection, **PRODUCT_FILTERS)
+    invoice_basic_info = connection_field(InvoiceConnection, **INVOICE_FILTERS)
 
-    def resolve_all_products(root, info):
-        return Product.objects.all()
+    def resolve_all_products(root, info, first=None, after=None, **filters):
+        products = queries.filter_products(Product.objects.all(), **filters)
+        return paginate(ProductConnection, products, first=first, after=after)
 
     @login_required
-    def resolve_all_invoices(root, info):
+    def resolve_all_invoices(root, info, first=None, after=None, include_archived=False, **filters):
         user = info.context.user
+        invoices = Invoice.objects.all()
+        archived = deletion.exclude_pending_users(ArchivedInvoice.objects.prefetch_related('items'))
         if user.is_staff:
-            return Invoice.objects.all()
-        return Invoice.objects.filter(user=user)
+            invoices = invoices.across_shards()
+            archived = archived.across_shards()
+        else:
+            invoices = invoices.for_user(user).filter(user=user)
+            archived = archived.for_user(user).filter(user=user)
+        sources = [(filter_invoices(invoices, **filters), None)]
+        if include_archived:
+            sources.append((filter_invoices(archived, **filters), as_invoice))
+        return paginate(InvoiceConnection, sources, first=first, after=after)
 
     @login_required
-    def resolve_all_users(root, info):
-        return User.objects.all()
+    def resolve_all_users(root, info, first=None, after=None):
+        return paginate(UserConnection, User.objects.all(), first=first, after=after)
 
     @login_required
-    def resolve_users_with_paid_invoices(root, info):
-        return User.objects.filter(invoice__status='PAID').distinct()
+    def resolve_users_with_paid_invoices(root, info, first=None, after=None):
+        return paginate(UserConnection, queries.users_with_invoices(status='PAID'), first=first, after=after)
 
     @login_required
-    def resolve_users_with_invoices(root, info):
-        return User.objects.filter(invoice__isnull=False).distinct()
+    def resolve_users_with_invoices(root, info, first=None, after=None):
+        return paginate(UserConnection, queries.users_with_invoices(), first=first, after=after)
 
     @login_required
-    def resolve_users_with_client_profile(root, info):
-        return User.objects.filter(clientprofile__isnull=False)
+    def resolve_users_with_client_profile(root, info, first=None, after=None):
+        users = User.objects.filter(clientprofile__isnull=False)
+        return paginate(UserConnection, users, first=first, after=after)
 
     @login_required
-    def resolve_products_in_invoices(root, info):
-        produkt_ids = InvoiceItem.objects.values_list('product', flat=True)
-        return Product.objects.filter(id__in=produkt_ids).distinct()
+    def resolve_products_in_invoices(root, info, first=None, after=None, **filters):
+        products = queries.filter_products(queries.products_in_invoices(), **filters)
+        return paginate(ProductConnection, products, first=first, after=after)
 
     @login_required
-    def resolve_products_not_in_invoices(root, info):
-        produkt_ids = InvoiceItem.objects.values_list('product', flat=True)
-        return Product.objects.exclude(id__in=produkt_ids)
+    def resolve_products_not_in_invoices(root, info, first=None, after=None, **filters):
+        products = queries.filter_products(queries.products_not_in_invoices(), **filters)
+        return paginate(ProductConnection, products, first=first, after=after)
 
     @login_required
-    def resolve_products_by_user_invoices(root, info, user_id):
-        return Product.objects.filter(invoiceitem__invoice__user_id=user_id).distinct()
+    def resolve_products_by_user_invoices(root, info, user_id, first=None, after=None, **filters):
+        products = queries.filter_products(queries.products_by_user_invoices(user_id), **filters)
+        return paginate(ProductConnection, products, first=first, after=after)
 
-    def resolve_popular_products(root, info):
-        return Product.objects.annotate(
-            invoice_count=Count('invoiceitem')
-        ).filter(invoice_count__gt=1).order_by('-invoice_count')
+    def resolve_popular_products(root, info, first=None, after=None, **filters):
+        products = queries.filter_products(queries.popular_products(), **filters)
+        return paginate(ProductConnection, products, ordering=('-invoice_count', 'pk'), first=first, after=after)
 
     @login_required
-    def resolve_invoice_basic_info(root, info):
-        return Invoice.objects.annotate(total_items=Count('items'))
+    def resolve_invoice_basic_info(root, info, first=None, after=None, **filters):
+        invoices = filter_invoices(queries.invoice_basic_info(), **filters)
+        return paginate(InvoiceConnection, invoices, first=first, after=after)
 
     viewer = graphene.Field(UserType)
 
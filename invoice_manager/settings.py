@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,11 +49,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'invoices.middleware.MetricsMiddleware',
+    'invoices.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'invoices.middleware.AdmissionControlMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,8 +92,30 @@ DATABASES = {
     }
 }
 
+# Sharding faktur po kliencie (invoices.sharding): INVOICE_SHARD_COUNT=3
+# dodaje bazy shard_1 i shard_2; 'default' jest shardem i bazą modeli globalnych
+INVOICE_SHARD_COUNT = int(os.environ.get('INVOICE_SHARD_COUNT', 1))
+for shard_number in range(1, INVOICE_SHARD_COUNT):
+    DATABASES[f'shard_{shard_number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard_number}.sqlite3',
+    }
+INVOICE_SHARDS = ['default'] + [f'shard_{number}' for number in range(1, INVOICE_SHARD_COUNT)]
+DATABASE_ROUTERS = ['invoices.sharding.ShardRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'invoices.metrics.MeteredLocMemCache',
+    }
+}
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'invoices.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'invoices.api.authentication.BatchSubrequestAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -111,8 +138,65 @@ GRAPHENE = {
     "MIDDLEWARE": [
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
     ],
+    # największa strona połączeń Relay (argument first), zob. invoice_manager.pagination
+    "RELAY_CONNECTION_MAX_LIMIT": 100,
 }
 
+# Kompresja odpowiedzi (gzip/deflate wg Accept-Encoding)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+
+# Jak długo pamiętamy klucze Idempotency-Key (starsze usuwa prune_idempotency_keys)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# Klucz bez zapisanej odpowiedzi starszy niż to uznajemy za porzucony (proces
+# padł w trakcie żądania) - ponowienie może go przejąć
+IDEMPOTENCY_KEY_LEASE = timedelta(minutes=5)
+
+# Kanał zmian /invoices/api/changes/ (invoices.changes); kompaktowanie: compact_changes
+CHANGE_FEED = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+    # starsze wpisy zastąpione nowszym wpisem tego samego obiektu są usuwane
+    'RETENTION': timedelta(days=7),
+    # po tym czasie znikają też wpisy usunięć - starsze kursory dostają 410
+    'TOMBSTONE_TTL': timedelta(days=30),
+}
+
+# Strumień SSE zmian faktur /invoices/events/ (invoices.events), tylko pod ASGI.
+# 'local' - zdarzenia z zapisów w tym samym procesie (jeden worker);
+# 'changelog' - każdy worker odpytuje dziennik zmian co POLL_INTERVAL sekund
+INVOICE_EVENTS = {
+    'BACKEND': os.environ.get('INVOICE_EVENTS_BACKEND', 'local'),
+    'POLL_INTERVAL': 1.0,
+    'HEARTBEAT': 15.0,
+    'QUEUE_SIZE': 100,
+}
+
+# Admission control: limity per klient i priorytety (klucze ROUTES to nazwy URL)
+ADMISSION_CONTROL = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'DEFAULT': {'priority': 'normal', 'rate': None, 'burst': None, 'concurrency': None},
+    'PRIORITIES': {
+        'high': {'slots': None, 'max_queue_wait': 10.0},
+        'normal': {'slots': 32, 'max_queue_wait': 2.0},
+        'low': {'slots': 4, 'max_queue_wait': 0.5},
+    },
+    'ROUTES': {
+        'users-with-invoices': {'priority': 'low', 'rate': 2, 'burst': 10, 'concurrency': 2},
+        'users-paid': {'priority': 'low', 'rate': 2, 'burst': 10, 'concurrency': 2},
+        'invoice-basic-info': {'priority': 'low', 'rate': 2, 'burst': 10, 'concurrency': 2},
+        'graphql': {'priority': 'low', 'rate': 10, 'burst': 30, 'concurrency': 4},
+    },
+}
+
+# Metryki Prometheusa - wspólny katalog dla wszystkich procesów workerów
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Poza DEBUG /metrics bez tokenu odpowiada tylko adresom z tych sieci (i administratorom)
+METRICS_ALLOWED_NETWORKS = ['127.0.0.0/8', '::1/128']
+
 AUTHENTICATION_BACKENDS = [
     "graphql_jwt.backends.JSONWebTokenBackend",
     "django.contrib.auth.backends.ModelBackend",
@@ -153,8 +237,6 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
-
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
@@ -162,6 +244,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    "default": {"BACKEND": "invoices.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Wysyłanie plików media przez serwer przed aplikacją:
+# None, 'x-sendfile' (Apache/lighttpd) albo 'x-accel-redirect' (nginx,
+# location MEDIA_ACCEL_REDIRECT_PREFIX z dyrektywą internal i alias na MEDIA_ROOT)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Cache-Control dla plików spoza magazynu adresowanego treścią
+MEDIA_CACHE_MAX_AGE = 3600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
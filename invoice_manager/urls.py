@@ -1,14 +1,33 @@
+import functools
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
-from graphene_django.views import GraphQLView
+from django.utils.module_loading import import_string
 from django.views.decorators.csrf import csrf_exempt
+from invoices.views import metrics_view, media_view
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """
+    Widok klasowy importowany dopiero przy pierwszym żądaniu - moduły
+    z ciężkimi zależnościami (schemat GraphQL) nie spowalniają startu procesu.
+    """
+    @functools.cache
+    def load():
+        return import_string(dotted_path).as_view(**initkwargs)
+
+    def view(request, *args, **kwargs):
+        return load()(request, *args, **kwargs)
+    return view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(lazy_view("invoice_manager.views.GraphQLView", graphiql=True)), name="graphql"),
+    path("metrics", metrics_view, name="metrics"),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
     path('invoices/', include('invoices.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), media_view, name="media"),
+]
 
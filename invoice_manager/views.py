@@ -0,0 +1,14 @@
+from graphene_django.views import GraphQLView as BaseGraphQLView
+
+from invoices.api.renderers import dumps
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQLView z szybszym kodowaniem odpowiedzi (orjson, jeśli dostępny).
+    """
+
+    def json_encode(self, request, d, pretty=False):
+        if not (self.pretty or pretty) and not request.GET.get("pretty"):
+            return dumps(d)
+        return super().json_encode(request, d, pretty)
@@ -1,8 +1,137 @@
 from django.contrib import admin
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from invoices.models import *
 
-admin.site.register(ClientProfile)
+# Powyżej tej liczby wierszy changelist nie liczy dokładnie (COUNT(*) po całej tabeli)
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_count(queryset):
+    """
+    Szybki szacunek liczby wierszy całej tabeli ze statystyk bazy
+    (PostgreSQL: pg_class.reltuples, SQLite: MAX(pk) po indeksie).
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            pk = queryset.model._meta.pk.column
+            cursor.execute(f"SELECT MAX({connection.ops.quote_name(pk)}) FROM {connection.ops.quote_name(table)}")
+        row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator changelisty dla dużych tabel: bez filtrów (poza domyślnym
+    filtrem managera, np. ukrywaniem usuniętych faktur) bierze szacunek ze
+    statystyk, z filtrami liczy najwyżej EXACT_COUNT_LIMIT wierszy.
+
+    Po dojściu do limitu count jest tylko dolną granicą (capped = True),
+    a strony za nią dalej da się otworzyć - szablon pokazuje "co najmniej N"
+    i link do następnej strony.
+    """
+    capped = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if self.unfiltered(queryset):
+            estimate = estimated_count(queryset)
+            if estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        count = queryset[:EXACT_COUNT_LIMIT].count()
+        self.capped = count == EXACT_COUNT_LIMIT
+        return count
+
+    @staticmethod
+    def unfiltered(queryset):
+        where = queryset.query.where
+        return not where or where == queryset.model._default_manager.all().query.where
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # za limitem liczenia nie znamy ostatniej strony
+            if not self.capped or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.capped:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if not object_list and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return self._get_page(object_list, number, self)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(ClientProfile)
+class ClientProfileAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'tax_id')
+    list_select_related = ('user',)
+    search_fields = ('=tax_id', '^user__username')
+    autocomplete_fields = ('user',)
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'price', 'category')
+    list_filter = ('category',)
+    search_fields = ('^name',)
+    autocomplete_fields = ('created_by', 'updated_by')
+
+
+class InvoiceItemInline(admin.TabularInline):
+    model = InvoiceItem
+    extra = 0
+    autocomplete_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(Invoice)
+class InvoiceAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'status', 'date', 'created_by')
+    list_select_related = ('user', 'created_by')
+    list_filter = ('status', ('date', admin.DateFieldListFilter))
+    search_fields = ('=id', '^user__username')
+    autocomplete_fields = ('user', 'created_by', 'updated_by')
+    inlines = [InvoiceItemInline]
+
+
+@admin.register(InvoiceItem)
+class InvoiceItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'invoice', 'product', 'quantity', 'price')
+    # __str__ faktury sięga po user.username, a pozycji po product.name
+    list_select_related = ('invoice__user', 'product')
+    search_fields = ('=invoice__id',)
+    raw_id_fields = ('invoice',)
+    autocomplete_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('invoice__user', 'product')
+
 
-admin.site.register(Invoice)
-admin.site.register(InvoiceItem)
-admin.site.register(Product)
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'status', 'date', 'archived_at')
+    list_select_related = ('user',)
+    list_filter = ('status',)
+    search_fields = ('=id', '^user__username')
+    raw_id_fields = ('user', 'created_by', 'updated_by')
@@ -0,0 +1,261 @@
+"""
+Kontrola przyjmowania żądań (admission control).
+
+Każde żądanie dostaje klasę priorytetu: zapisy i uwierzytelnianie są
+'high', ciężkie odczyty skonfigurowane w ADMISSION_CONTROL['ROUTES'] -
+zwykle 'low'. Na trasach GraphQL (zapytania też przychodzą jako POST)
+zapisem jest tylko dokument z mutacją. Przed wykonaniem widoku sprawdzamy kolejno:
+
+1. czas oczekiwania w kolejce load balancera (X-Request-Start) - jeśli
+   przekracza limit klasy, od razu 503;
+2. limit tempa klienta (token bucket w cache) - 429;
+3. limit równoległych żądań klienta - 429;
+4. wolny slot klasy priorytetu w procesie; jeśli trzeba na niego czekać
+   dłużej niż max_queue_wait albo średnia krocząca ostatnich oczekiwań
+   przekracza połowę tego limitu, żądanie jest odrzucane - 503.
+
+Odpowiedzi 429/503 mają nagłówek Retry-After.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    # limity dla tras bez własnej konfiguracji; None = bez limitu
+    'DEFAULT': {'priority': 'normal', 'rate': None, 'burst': None, 'concurrency': None},
+    'PRIORITIES': {
+        'high': {'slots': None, 'max_queue_wait': 10.0},
+        'normal': {'slots': 32, 'max_queue_wait': 2.0},
+        'low': {'slots': 4, 'max_queue_wait': 0.5},
+    },
+    'ROUTES': {},
+    # nazwy URL traktowane jak uwierzytelnianie (zawsze 'high')
+    'AUTH_ROUTES': ('token_obtain_pair', 'token_refresh', 'rest_framework:login'),
+    # nazwy URL endpointów GraphQL - priorytet wg typu operacji, nie metody HTTP
+    'GRAPHQL_ROUTES': ('graphql',),
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+    @property
+    def detail(self):
+        return 'Za dużo żądań.' if self.status == 429 else 'Serwer jest przeciążony, spróbuj później.'
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'ADMISSION_CONTROL', {}))
+    return config
+
+
+def client_id(request):
+    """
+    Tożsamość klienta: zalogowany użytkownik (sesja), skrót tokenu
+    z Authorization albo adres IP.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    auth = request.META.get('HTTP_AUTHORIZATION')
+    if auth:
+        return 't' + hashlib.sha1(auth.encode()).hexdigest()[:16]
+    return 'ip' + request.META.get('REMOTE_ADDR', '')
+
+
+def queue_time(request, now=None):
+    """
+    Czas od X-Request-Start (t=<sekundy|ms|µs od epoki>) ustawionego przez proxy.
+    """
+    header = request.META.get('HTTP_X_REQUEST_START')
+    if not header:
+        return 0.0
+    try:
+        started = float(header.split('=')[-1])
+    except ValueError:
+        return 0.0
+    while started > 1e11:  # ms / µs -> s
+        started /= 1000.0
+    return max(0.0, (now or time.time()) - started)
+
+
+def _graphql_documents(request):
+    """
+    Pary (dokument, operationName) z żądania GraphQL: GET ?query=,
+    JSON (także lista - batch), application/graphql albo formularz.
+    """
+    if request.method in SAFE_METHODS:
+        documents = [(request.GET.get('query'), request.GET.get('operationName'))]
+    elif request.content_type == 'application/graphql':
+        documents = [(request.body.decode(errors='replace'), None)]
+    elif request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return []
+        documents = [(item.get('query'), item.get('operationName'))
+                     for item in (data if isinstance(data, list) else [data]) if isinstance(item, dict)]
+    else:
+        documents = [(request.POST.get('query'), request.POST.get('operationName'))]
+    return [(query, name) for query, name in documents if isinstance(query, str)]
+
+
+def is_graphql_mutation(request):
+    """
+    Czy żądanie wykonuje mutację. Dokument, którego nie da się sparsować,
+    traktujemy jak odczyt - widok i tak go odrzuci.
+    """
+    # import dopiero tutaj - GraphQL ładuje się leniwie (zob. invoice_manager.urls)
+    from graphql import GraphQLError, OperationDefinitionNode, OperationType, parse
+    for query, operation_name in _graphql_documents(request):
+        try:
+            document = parse(query)
+        except GraphQLError:
+            continue
+        for definition in document.definitions:
+            if not isinstance(definition, OperationDefinitionNode) or definition.operation != OperationType.MUTATION:
+                continue
+            if operation_name is None or (definition.name and definition.name.value == operation_name):
+                return True
+    return False
+
+
+class TokenBucket:
+    """
+    Token bucket trzymany w cache: (tokeny, czas ostatniego uzupełnienia).
+    Odczyt i zapis nie są atomowe - przy wyścigu limit może zostać
+    minimalnie przekroczony, co jest akceptowalne dla ochrony przed zalewem.
+    """
+
+    def __init__(self, cache, rate, burst):
+        self.cache = cache
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+
+    def take(self, key, now=None):
+        now = now or time.time()
+        tokens, updated = self.cache.get(key) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.cache.set(key, (tokens, now), timeout=int(self.burst / self.rate) + 60)
+            raise Rejected(429, 'rate', (1 - tokens) / self.rate)
+        self.cache.set(key, (tokens - 1, now), timeout=int(self.burst / self.rate) + 60)
+
+
+class PriorityGate:
+    """
+    Sloty wykonania dla jednej klasy priorytetu w obrębie procesu.
+    """
+    EWMA_WEIGHT = 0.2
+
+    def __init__(self, name, slots, max_queue_wait):
+        self.name = name
+        self.max_queue_wait = max_queue_wait
+        self.target_wait = max_queue_wait / 2
+        self.semaphore = threading.BoundedSemaphore(slots) if slots else None
+        self.avg_wait = 0.0
+
+    def acquire(self):
+        if self.semaphore is None:
+            return False
+        # kolejka stoi - nie dokładamy kolejnych czekających
+        if self.avg_wait > self.target_wait:
+            self.avg_wait *= 1 - self.EWMA_WEIGHT
+            raise Rejected(503, 'overload', self.avg_wait)
+        start = time.monotonic()
+        acquired = self.semaphore.acquire(timeout=self.max_queue_wait)
+        waited = time.monotonic() - start
+        self.avg_wait += self.EWMA_WEIGHT * (waited - self.avg_wait)
+        if not acquired:
+            raise Rejected(503, 'queue', self.max_queue_wait)
+        return True
+
+    def release(self):
+        self.semaphore.release()
+
+
+class AdmissionController:
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.cache = caches[self.config['CACHE']]
+        self.gates = {
+            name: PriorityGate(name, options.get('slots'), options.get('max_queue_wait', 1.0))
+            for name, options in self.config['PRIORITIES'].items()
+        }
+
+    def route_options(self, url_name):
+        options = dict(self.config['DEFAULT'])
+        options.update(self.config['ROUTES'].get(url_name, {}))
+        return options
+
+    def priority(self, request, url_name, options):
+        if url_name in self.config['AUTH_ROUTES']:
+            return 'high'
+        if url_name in self.config['GRAPHQL_ROUTES']:
+            write = is_graphql_mutation(request)
+        else:
+            write = request.method not in SAFE_METHODS
+        return 'high' if write else options.get('priority', 'normal')
+
+    def admit(self, request, url_name):
+        """
+        Zwraca funkcję zwalniającą zasoby po obsłużeniu żądania
+        albo rzuca Rejected.
+        """
+        options = self.route_options(url_name)
+        gate = self.gates[self.priority(request, url_name, options)]
+        waited = queue_time(request)
+        if waited > gate.max_queue_wait:
+            raise Rejected(503, 'queue', gate.max_queue_wait)
+
+        client = client_id(request)
+        if options.get('rate'):
+            TokenBucket(self.cache, options['rate'], options.get('burst')) \
+                .take(f'admission:bucket:{url_name}:{client}')
+
+        concurrency_key = None
+        if options.get('concurrency'):
+            concurrency_key = f'admission:inflight:{url_name}:{client}'
+            self.cache.add(concurrency_key, 0, timeout=300)
+            try:
+                inflight = self.cache.incr(concurrency_key)
+            except ValueError:  # klucz wygasł w międzyczasie
+                self.cache.set(concurrency_key, 1, timeout=300)
+                inflight = 1
+            if inflight > options['concurrency']:
+                self._decr(concurrency_key)
+                raise Rejected(429, 'concurrency', 1)
+
+        try:
+            holds_slot = gate.acquire()
+        except Rejected:
+            if concurrency_key:
+                self._decr(concurrency_key)
+            raise
+
+        def release():
+            if holds_slot:
+                gate.release()
+            if concurrency_key:
+                self._decr(concurrency_key)
+        return release
+
+    def _decr(self, key):
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
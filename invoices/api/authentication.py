@@ -0,0 +1,15 @@
+from rest_framework.authentication import BaseAuthentication
+
+
+class BatchSubrequestAuthentication(BaseAuthentication):
+    """
+    Uwierzytelnia podżądania BatchView użytkownikiem żądania batcha.
+
+    BatchView ustawia batch_credentials na HttpRequest podżądania - z sieci
+    nie da się go ustawić, więc dla zwykłych żądań klasa zwraca None
+    i decydują kolejne klasy. CSRF nie jest sprawdzany ponownie: żądanie
+    batcha przeszło już przez CsrfViewMiddleware i uwierzytelnianie DRF.
+    """
+
+    def authenticate(self, request):
+        return getattr(request._request, 'batch_credentials', None)
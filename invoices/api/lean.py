@@ -0,0 +1,306 @@
+"""
+Szybka ścieżka odczytu list dla ModelSerializerów.
+
+Zamiast budować instancje modeli i przechodzić przez get_attribute /
+to_representation każdego pola, lista jest pobierana przez values_list(),
+a wynikowe słowniki składane są przez konwertery przygotowane raz dla
+danej klasy serializera. Wynik (kolejność kluczy, typy, formaty) jest taki
+sam jak z serializer.data, więc odpowiedź JSON nie zmienia się ani o bajt.
+
+Pola, których nie umiemy odwzorować (np. SerializerMethodField), wyłączają
+szybką ścieżkę - widok wraca wtedy do zwykłej serializacji.
+"""
+import decimal
+
+from django.db import models
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class Unsupported(Exception):
+    pass
+
+
+# Pola, które dla wartości prosto z bazy zwracają ją bez zmian
+PASSTHROUGH_FIELDS = (
+    fields.IntegerField, fields.CharField, fields.ChoiceField, fields.BooleanField,
+)
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.localize or field.normalize_output or not coerce_to_string or field.decimal_places is None:
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != fields.ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        return value if isinstance(value, str) else value.isoformat()
+    return convert
+
+
+def _file_converter(field, model_field):
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+    storage = model_field.storage
+
+    def convert(value, request):
+        if not value:
+            return None
+        if not use_url:
+            return value
+        url = storage.url(value)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class LeanPlan:
+    """
+    Skompilowany opis serializacji: kolumny do values_list() i lista
+    (nazwa pola, rodzaj, indeks kolumny / zależny plan, konwerter).
+    """
+
+    def __init__(self, serializer_class, model, annotations, selected=None):
+        self.model = model
+        self.columns = ['pk']
+        self.entries = []
+        serializer = serializer_class()
+        opts = model._meta
+
+        for name, field in serializer.fields.items():
+            if field.write_only or (selected is not None and name not in selected):
+                continue
+            source = field.source
+            if source == '*' or '.' in source:
+                raise Unsupported(name)
+
+            try:
+                model_field = opts.get_field(source)
+            except Exception:
+                model_field = None
+
+            if isinstance(field, serializers.ListSerializer):
+                if model_field is None or not model_field.one_to_many:
+                    raise Unsupported(name)
+                child = self._compile_child(field.child, model_field.related_model)
+                self.entries.append((name, 'nested', (model_field.field.name, child), None))
+                continue
+
+            if isinstance(field, relations.ManyRelatedField):
+                child = field.child_relation
+                if not isinstance(child, relations.PrimaryKeyRelatedField) or child.pk_field is not None \
+                        or model_field is None or not model_field.many_to_many or model_field.auto_created:
+                    raise Unsupported(name)
+                self.entries.append((name, 'many', model_field, None))
+                continue
+
+            if model_field is None or not getattr(model_field, 'concrete', False):
+                if source in annotations:
+                    self.entries.append((name, 'value', self._column(source), self._converter(field, None)))
+                elif field.default is not empty:
+                    raise Unsupported(name)
+                elif field.allow_null:
+                    self.entries.append((name, 'const', None, None))
+                elif not field.required:
+                    # zwykły serializer pomija takie pole (SkipField)
+                    continue
+                else:
+                    raise Unsupported(name)
+                continue
+
+            if isinstance(field, relations.PrimaryKeyRelatedField):
+                if field.pk_field is not None:
+                    raise Unsupported(name)
+                self.entries.append((name, 'value', self._column(source), None))
+                continue
+
+            if isinstance(model_field, models.FileField):
+                self.entries.append((name, 'file', self._column(source), _file_converter(field, model_field)))
+                continue
+
+            self.entries.append((name, 'value', self._column(source), self._converter(field, model_field)))
+
+    @staticmethod
+    def _compile_child(child_serializer, model):
+        if not isinstance(child_serializer, serializers.ModelSerializer):
+            raise Unsupported(child_serializer.__class__.__name__)
+        return get_plan(child_serializer.__class__, model, frozenset())
+
+    def _column(self, source):
+        if source not in self.columns:
+            self.columns.append(source)
+        return self.columns.index(source)
+
+    @staticmethod
+    def _converter(field, model_field):
+        if isinstance(field, fields.DecimalField):
+            return _decimal_converter(field)
+        if isinstance(field, fields.DateTimeField):
+            return field.to_representation
+        if isinstance(field, fields.DateField):
+            return _date_converter(field)
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            if isinstance(model_field, models.DecimalField) or isinstance(model_field, models.DateField):
+                return field.to_representation
+            return None
+        raise Unsupported(field.field_name)
+
+    def represent(self, rows, request=None, using=None):
+        """
+        Zamienia krotki z values_list(self.columns) na listę słowników.
+        using: baza wierszy - powiązane obiekty leżą w tym samym shardzie.
+        """
+        rows = list(rows)
+        related = {}
+        for name, kind, spec, _ in self.entries:
+            if kind == 'nested':
+                related[name] = self._fetch_nested(spec, rows, request, using)
+            elif kind == 'many':
+                related[name] = self._fetch_many(spec, rows, using)
+
+        entries = self.entries
+        result = []
+        for row in rows:
+            pk = row[0]
+            item = {}
+            for name, kind, spec, convert in entries:
+                if kind == 'value':
+                    value = row[spec]
+                    item[name] = value if value is None or convert is None else convert(value)
+                elif kind == 'file':
+                    item[name] = convert(row[spec], request)
+                elif kind == 'const':
+                    item[name] = None
+                else:
+                    item[name] = related[name].get(pk, [])
+            result.append(item)
+        return result
+
+    def _fetch_nested(self, spec, rows, request, using):
+        fk_name, child = spec
+        ids = [row[0] for row in rows]
+        grouped = {}
+        if not ids:
+            return grouped
+        child_rows = list(
+            child.model._default_manager.db_manager(using).filter(**{f'{fk_name}__in': ids})
+            .order_by('pk').values_list(*child.columns, f'{fk_name}_id')
+        )
+        fk_index = len(child.columns)
+        for data, child_row in zip(child.represent(child_rows, request, using), child_rows):
+            grouped.setdefault(child_row[fk_index], []).append(data)
+        return grouped
+
+    @staticmethod
+    def _fetch_many(model_field, rows, using):
+        ids = [row[0] for row in rows]
+        grouped = {}
+        if not ids:
+            return grouped
+        through = model_field.remote_field.through
+        source = model_field.m2m_field_name()
+        target = model_field.m2m_reverse_field_name()
+        pairs = through._default_manager.db_manager(using).filter(**{f'{source}__in': ids}) \
+            .order_by('pk').values_list(f'{source}_id', f'{target}_id')
+        for owner_id, target_id in pairs:
+            grouped.setdefault(owner_id, []).append(target_id)
+        return grouped
+
+
+_plans = {}
+
+
+def get_plan(serializer_class, model, annotations, selected=None):
+    """
+    Zwraca (z pamięci podręcznej) plan dla danego serializera albo None,
+    jeśli serializer ma pola nieobsługiwane przez szybką ścieżkę.
+    selected: zbiór nazw pól do wypisania (None - wszystkie).
+    """
+    key = (serializer_class, model, annotations, selected)
+    if key not in _plans:
+        try:
+            _plans[key] = LeanPlan(serializer_class, model, annotations, selected)
+        except Unsupported:
+            _plans[key] = None
+    return _plans[key]
+
+
+class LeanQuery:
+    """
+    Para (plan, queryset) gotowa do paginacji - krojenie zwraca
+    już gotowe słowniki zamiast instancji modelu.
+    """
+
+    def __init__(self, plan, queryset, request=None):
+        self.plan = plan
+        self.rows = queryset.values_list(*plan.columns)
+        self.request = request
+        self.ordered = queryset.ordered
+        self.model = queryset.model
+
+    def count(self):
+        return self.rows.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.plan.represent(self.rows[key], self.request, self.rows.db)
+        return self.plan.represent([self.rows[key]], self.request, self.rows.db)[0]
+
+    def __iter__(self):
+        return iter(self.plan.represent(self.rows, self.request, self.rows.db))
+
+
+def lean_query(serializer_class, queryset, request=None, selected=None):
+    if not isinstance(queryset, models.QuerySet):  # faktury z archiwum, zapytania po shardach
+        return None
+    plan = get_plan(serializer_class, queryset.model, frozenset(queryset.query.annotations), selected)
+    if plan is None:
+        return None
+    return LeanQuery(plan, queryset, request)
+
+
+class LeanListMixin:
+    """
+    Mixin dla ListAPIView: GET listy idzie szybką ścieżką, o ile
+    serializer się na to nadaje. lean_list = False wyłącza ją w widoku.
+    """
+    lean_list = True
+
+    def get_requested_fields(self):
+        # nadpisywane przez SparseFieldsMixin (?fields= / ?expand=)
+        return None
+
+    def get_lean_query(self, queryset):
+        if not self.lean_list:
+            return None
+        return lean_query(self.get_serializer_class(), queryset, self.request, self.get_requested_fields())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lean = self.get_lean_query(queryset)
+        if lean is None:
+            return super().list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(lean)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(list(lean))
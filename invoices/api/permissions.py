@@ -13,6 +13,18 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         # Pozwalamy tylko jeśli użytkownik jest twórcą
         return obj.created_by == request.user
 
+    @staticmethod
+    def filter_queryset(request, queryset):
+        """
+        To samo ograniczenie co has_object_permission, ale na poziomie SQL.
+        Faktury użytkownika leżą w jego shardzie, admin widzi wszystkie shardy.
+        """
+        if request.user and request.user.is_staff:
+            return queryset.across_shards() if hasattr(queryset, 'across_shards') else queryset
+        if hasattr(queryset, 'for_user'):
+            queryset = queryset.for_user(request.user)
+        return queryset.filter(created_by=request.user)
+
 
 class IsSelfOrAdmin(permissions.BasePermission):
     """
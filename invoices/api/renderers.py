@@ -0,0 +1,53 @@
+"""
+Szybsze renderowanie JSON.
+
+Jeśli zainstalowany jest orjson, JSON budowany jest od razu jako bajty
+w kodzie natywnym (daty, słowniki, listy, liczby). Typy, których orjson nie
+zna (Decimal, leniwe napisy, QuerySet...), obsługuje domyślny encoder DRF,
+więc wynik jest zgodny ze standardowym JSONRenderer. Bez orjson renderer
+zachowuje się dokładnie jak JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # opcjonalna zależność
+    orjson = None
+
+_default = JSONEncoder().default
+
+if orjson is not None:
+    # daty/czasy przez encoder DRF (obcięcie do milisekund, 'Z' zamiast +00:00)
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data):
+    """
+    Zwarty JSON (bez spacji, bez escapowania znaków spoza ASCII) jako bytes.
+    """
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=_default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            # np. liczby całkowite większe niż 64 bity - zostawiamy stdlib
+            pass
+        else:
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                # tak jak DRF: U+2028/U+2029 psują osadzanie JSON w <script>
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+    return JSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer korzystający z orjson, gdy nie jest wymagane wcięcie.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
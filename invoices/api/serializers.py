@@ -1,8 +1,21 @@
 from rest_framework import serializers
-from invoices.models import Product, Invoice, InvoiceItem, ClientProfile
+from invoices.models import Product, Invoice, InvoiceItem, ClientProfile, DeletionJob
 from django.contrib.auth.models import User
 
 
+class SelectableFieldsMixin:
+    """
+    Serializer z argumentem fields=... zostawia tylko wskazane pola
+    (zob. SparseFieldsMixin w widokach).
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class ClientProfileSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
 
@@ -45,7 +58,7 @@ class UserWithInvoices(serializers.ModelSerializer):
             model = User
             fields = ['id', 'username', 'invoices']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     invoice_count = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -61,7 +74,7 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
             'price': {'required': False},  # nie wymagaj price przy tworzeniu
         }
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     items = InvoiceItemSerializer(many=True)
     total_value = serializers.DecimalField(read_only=True, decimal_places=2, max_digits=12)
 
@@ -112,4 +125,60 @@ class InvoiceBasicInfoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Invoice
-        fields = ['id', 'date', 'status', 'total_items']
\ No newline at end of file
+        fields = ['id', 'date', 'status', 'total_items']
+
+class BatchItemSerializer(serializers.Serializer):
+    # nagłówki, które podżądanie może mieć własne (nie dziedziczy ich z batcha)
+    HEADERS = ('Idempotency-Key', 'If-Match', 'If-None-Match', 'If-Modified-Since', 'If-Unmodified-Since')
+
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    url = serializers.CharField()
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate_headers(self, headers):
+        allowed = {name.lower(): name for name in self.HEADERS}
+        unknown = [name for name in headers if name.lower() not in allowed]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Niedozwolone nagłówki: {', '.join(unknown)}. Dozwolone: {', '.join(self.HEADERS)}.")
+        return {allowed[name.lower()]: value for name, value in headers.items()}
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False, max_length=25)
+
+class InvoiceFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Invoice.STATUS_CHOICES, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+class InvoiceSelectionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=50000)
+    filter = InvoiceFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Podaj dokładnie jedno z pól: ids albo filter.")
+        return attrs
+
+class InvoiceTransitionSerializer(InvoiceSelectionSerializer):
+    status = serializers.ChoiceField(choices=[('SENT', 'Sent'), ('PAID', 'Paid')])
+
+class InvoiceDeleteSerializer(InvoiceSelectionSerializer):
+    all = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        # usunięcie wszystkiego tylko jawnie - pusty filtr to zwykle błąd klienta
+        if sum(('ids' in attrs, 'filter' in attrs, attrs['all'])) != 1:
+            raise serializers.ValidationError("Podaj dokładnie jedno z pól: ids, filter albo all.")
+        if 'filter' in attrs and not attrs['filter']:
+            raise serializers.ValidationError({'filter': "Filtr musi zawierać co najmniej jedno kryterium."})
+        return attrs
+
+class InvoiceIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=50000)
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ['id', 'kind', 'status', 'progress', 'error', 'created_at', 'updated_at', 'finished_at']
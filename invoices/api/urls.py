@@ -4,7 +4,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import UserViewSet, InvoiceListCreateView, InvoiceDetailView, ProductListCreateView, \
     ProductDetailView, APIRootView, ClientProfileDetailView, UsersWithPaidInvoices, ProductsInInvoices, \
     ProductsNotInInvoices, UsersWithInvoices, UsersWithClientProfil, PopularProducts, \
-    ProductsByUserInvoices, InvoiceBasicInfoListView
+    ProductsByUserInvoices, InvoiceBasicInfoListView, BatchView, InvoiceBulkTransitionView, \
+    InvoiceRestoreView, ChangeFeedView, InvoiceBulkDeleteView, DeletionJobDetailView
 
 router = SimpleRouter()
 router.register(r'users', UserViewSet)
@@ -24,6 +25,12 @@ urlpatterns = [
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
     path('invoices/', InvoiceListCreateView.as_view(), name='invoice-list-create'),
     path('invoices/<int:pk>/', InvoiceDetailView.as_view(), name='invoice-detail'),
+    path('invoices/transition/', InvoiceBulkTransitionView.as_view(), name='invoice-bulk-transition'),
+    path('invoices/restore/', InvoiceRestoreView.as_view(), name='invoice-restore'),
+    path('invoices/delete/', InvoiceBulkDeleteView.as_view(), name='invoice-bulk-delete'),
+    path('deletions/<int:pk>/', DeletionJobDetailView.as_view(), name='deletion-job-detail'),
+    path('batch/', BatchView.as_view(), name='api-batch'),
+    path('changes/', ChangeFeedView.as_view(), name='change-feed'),
 
     # Dodatkowe
     path('users-paid/', UsersWithPaidInvoices.as_view(), name='users-paid'),
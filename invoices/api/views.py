@@ -1,28 +1,189 @@
+import io
+import json
+from urllib.parse import urlsplit
+
 from django.contrib.auth.models import User
-from django.db.models import Sum, F, DecimalField, ExpressionWrapper, Count
+from django.core.exceptions import FieldDoesNotExist
+from django.http import Http404, HttpRequest, QueryDict
+from django.shortcuts import get_object_or_404
+from django.urls import Resolver404, resolve
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import viewsets, filters, generics, status
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
 
-from invoices.models import Product, Invoice, InvoiceItem, ClientProfile
+from invoices.archive import CombinedInvoices, as_invoice, restore_invoices, with_total_value
+from invoices.models import Product, Invoice, ClientProfile, ArchivedInvoice, DeletionJob
 from .serializers import UserSerializer, ProductSerializer, InvoiceSerializer, UserCreateSerializer, \
-    ClientProfileSerializer, InvoiceBasicInfoSerializer, UserWithInvoices
+    ClientProfileSerializer, InvoiceBasicInfoSerializer, UserWithInvoices, BatchSerializer, \
+    InvoiceTransitionSerializer, InvoiceIdsSerializer, InvoiceDeleteSerializer, DeletionJobSerializer
+from invoices.transitions import filter_invoices, invoices_for_user, transition_for_user
+from invoices import admission, changes, deletion, idempotency, metrics, queries
 
+from .lean import LeanListMixin
 from .permissions import IsOwnerOrAdmin, IsSelfOrAdmin
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class MultiGetMixin:
+    """
+    ?ids=1,2,3 zwraca wskazane obiekty jedną odpowiedzią, bez paginacji.
+    Obiekty niedostępne dla użytkownika (poza get_queryset) są pomijane.
+    """
+    max_batch_ids = 100
+
+    def get_requested_ids(self):
+        raw = self.request.query_params.get('ids')
+        if raw is None:
+            return None
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in raw.split(',') if pk.strip()))
+        except ValueError:
+            raise ValidationError({'ids': 'Oczekiwano listy liczb oddzielonych przecinkami.'})
+        if len(ids) > self.max_batch_ids:
+            raise ValidationError({'ids': f'Maksymalnie {self.max_batch_ids} identyfikatorów.'})
+        return ids
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ids = self.get_requested_ids()
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        if self.get_requested_ids() is not None:
+            return None
+        return super().paginate_queryset(queryset)
+
+
+class SparseFieldsMixin:
+    """
+    GET z ?fields=id,status zwraca tylko wskazane pola, a ?expand=items
+    dołącza pola kosztowne (expandable_fields: zagnieżdżone pozycje, sumy).
+    Gdy podano którykolwiek z parametrów, pola kosztowne są pomijane, jeśli
+    nie zostały wymienione, a zapytanie pobiera tylko potrzebne kolumny
+    (only()). Bez parametrów - pełna reprezentacja, jak dotąd.
+    """
+    expandable_fields = ()
+    # kolumny potrzebne niezależnie od wybranych pól (np. do uprawnień)
+    required_columns = ()
+
+    @staticmethod
+    def _parse_names(raw):
+        return {name.strip() for name in raw.split(',') if name.strip()}
+
+    def get_requested_fields(self):
+        if hasattr(self, '_requested_fields'):
+            return self._requested_fields
+        params = self.request.query_params
+        selected = None
+        if self.request.method == 'GET' and ('fields' in params or 'expand' in params):
+            available = {name for name, field in self.get_serializer_class()().fields.items() if not field.write_only}
+            expand = self._parse_names(params.get('expand', ''))
+            if 'fields' in params:
+                requested = self._parse_names(params['fields'])
+                if not requested:
+                    raise ValidationError({'fields': 'Podaj co najmniej jedno pole.'})
+            else:
+                requested = available - set(self.expandable_fields)
+            if requested - available:
+                raise ValidationError({'fields': f"Nieznane pola: {', '.join(sorted(requested - available))}."})
+            if expand - set(self.expandable_fields):
+                raise ValidationError({'expand': f"Dostępne rozwinięcia: {', '.join(self.expandable_fields)}."})
+            selected = frozenset(requested | expand)
+        self._requested_fields = selected
+        return selected
+
+    def wants_field(self, name):
+        selected = self.get_requested_fields()
+        return selected is None or name in selected
+
+    def get_serializer(self, *args, **kwargs):
+        selected = self.get_requested_fields()
+        if selected is not None:
+            kwargs['fields'] = selected
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        selected = self.get_requested_fields()
+        if selected is not None:
+            queryset = queryset.only(*self.get_columns(queryset.model, selected))
+        return super().filter_queryset(queryset)
+
+    def get_columns(self, model, selected):
+        serializer_fields = self.get_serializer_class()().fields
+        columns = {model._meta.pk.name, *self.required_columns}
+        for name in selected:
+            try:
+                model_field = model._meta.get_field(serializer_fields[name].source)
+            except FieldDoesNotExist:
+                continue  # adnotacja albo pole wyliczane
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+        return columns
+
+
+class IdempotentCreateMixin:
+    """
+    POST z nagłówkiem Idempotency-Key wykonuje się co najwyżej raz -
+    powtórzenia dostają zapisaną odpowiedź (z nagłówkiem Idempotent-Replayed).
+    """
+    idempotency_scope = None
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return super().create(request, *args, **kwargs)
+
+        request_fingerprint = idempotency.fingerprint(request.method, request.path, request.data, request.FILES)
+        try:
+            record, claimed = idempotency.claim(request.user, self.idempotency_scope, key, request_fingerprint)
+        except idempotency.IdempotencyError as e:
+            return Response({'detail': str(e)}, status=e.status_code)
+        if not claimed:
+            return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = super().create(request, *args, **kwargs)
+        except Exception:
+            idempotency.release(record)
+            raise
+        idempotency.complete(record, response.status_code, response.data)
+        return response
+
+
+class IncludeArchivedMixin:
+    """
+    GET z ?include_archived=1 sięga także do archiwum faktur (tylko odczyt).
+    """
+
+    def include_archived(self):
+        return self.request.method == 'GET' and \
+            self.request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+    def get_archived_queryset(self):
+        queryset = deletion.exclude_pending_users(ArchivedInvoice.objects.all())
+        if self.wants_field('total_value'):
+            queryset = with_total_value(queryset)
+        return IsOwnerOrAdmin.filter_queryset(self.request, queryset)
+
+
+class UserViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['username', 'is_staff']
 
+    def get_queryset(self):
+        # usunięci miękko znikają od razu, zanim purge_deletions usunie ich dane
+        return super().get_queryset().exclude(pk__in=deletion.pending_user_ids())
+
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
@@ -37,6 +198,10 @@ class UserViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    def destroy(self, request, *args, **kwargs):
+        job = deletion.soft_delete_user(self.get_object(), request.user)
+        return Response(DeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
 
 class ClientProfileDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = ClientProfileSerializer
@@ -53,120 +218,308 @@ class ClientProfileDetailView(generics.RetrieveUpdateAPIView):
         # użytkownik widzi tylko swój profil
         return ClientProfile.objects.get(user=user)
 
-class ProductListCreateView(generics.ListCreateAPIView):
+class ProductListCreateView(SparseFieldsMixin, IdempotentCreateMixin, MultiGetMixin, LeanListMixin,
+                            generics.ListCreateAPIView):
+    idempotency_scope = 'product-create'
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    parser_classes = [FormParser, MultiPartParser]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name']
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user, updated_by=self.request.user)
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailView(SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
-    parser_classes = [FormParser, MultiPartParser]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
 
     def perform_update(self, serializer):
         serializer.save(updated_by=self.request.user)
 
-class InvoiceListCreateView(generics.ListCreateAPIView):
+class InvoiceListCreateView(SparseFieldsMixin, IdempotentCreateMixin, IncludeArchivedMixin, MultiGetMixin,
+                            LeanListMixin, generics.ListCreateAPIView):
+    idempotency_scope = 'invoice-create'
     serializer_class = InvoiceSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    expandable_fields = ('items', 'products', 'total_value')
+    required_columns = ('created_by',)
 
     def get_queryset(self):
-        qs = Invoice.objects.annotate(
-            total_value=Sum(
-                ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField())
-            )
-        )
-        if self.request.user.is_staff:
-            return qs
-        return qs.filter(created_by=self.request.user)
+        qs = Invoice.objects.all()
+        if self.wants_field('total_value'):
+            qs = with_total_value(qs)
+        return IsOwnerOrAdmin.filter_queryset(self.request, qs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.include_archived():
+            return queryset
+        archived = self.get_archived_queryset()
+        ids = self.get_requested_ids()
+        if ids is not None:
+            archived = archived.filter(pk__in=ids)
+        return CombinedInvoices(queryset, archived)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user, updated_by=self.request.user, status="NEW")
 
-class InvoiceDetailView(generics.RetrieveUpdateDestroyAPIView):
+class InvoiceDetailView(SparseFieldsMixin, IncludeArchivedMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = InvoiceSerializer
     permission_classes = [IsOwnerOrAdmin]
+    expandable_fields = ('items', 'products', 'total_value')
+    required_columns = ('created_by',)
 
     def get_queryset(self):
-        qs = Invoice.objects.annotate(
-            total_value=Sum(
-                ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField())
-            )
-        )
-        if self.request.user.is_staff:
-            return qs
-        return qs.filter(created_by=self.request.user)
+        qs = Invoice.objects.all()
+        if self.wants_field('total_value'):
+            qs = with_total_value(qs)
+        return IsOwnerOrAdmin.filter_queryset(self.request, qs)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if not self.include_archived():
+                raise
+        archived = get_object_or_404(self.get_archived_queryset(), pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, archived)
+        return as_invoice(archived)
 
     def perform_update(self, serializer):
         serializer.save(updated_by=self.request.user)
 
-class UsersWithPaidInvoices(generics.ListAPIView):  # nie działa
+class InvoiceRestoreView(APIView):
+    """
+    Przywraca faktury z archiwum do tabel bieżących.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = InvoiceIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        invoices, items = restore_invoices(serializer.validated_data['ids'])
+        return Response({'invoices': invoices, 'items': items})
+
+class InvoiceBulkTransitionView(APIView):
+    """
+    Zbiorcza zmiana statusu faktur wskazanych przez ids albo filtr.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = InvoiceTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        result = transition_for_user(request.user, data['status'], ids=data.get('ids'), **data.get('filter', {}))
+        return Response(result)
+
+class InvoiceBulkDeleteView(APIView):
+    """
+    Miękkie usunięcie faktur wskazanych przez ids, filtr albo all: true -
+    znikają od razu, a pozycje i same wiersze usuwa w tle purge_deletions.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = InvoiceDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        queryset = filter_invoices(invoices_for_user(request.user), **data.get('filter', {}))
+        deleted, job = deletion.soft_delete_invoices(queryset, data.get('ids'), request.user)
+        return Response({'deleted': deleted, 'job': DeletionJobSerializer(job).data if job else None},
+                        status=status.HTTP_202_ACCEPTED)
+
+class DeletionJobDetailView(generics.RetrieveAPIView):
+    """
+    Postęp usuwania w tle (admin - wszystkie zadania, pozostali - własne).
+    """
+    serializer_class = DeletionJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return DeletionJob.objects.all()
+        return DeletionJob.objects.filter(requested_by=self.request.user)
+
+class ChangeFeedView(APIView):
+    """
+    Kanał zmian produktów, faktur i pozycji (zob. invoices.changes).
+    ?after=<kursor>&limit=<n>&models=invoice,product zwraca kolejne zmiany;
+    bez after - tylko bieżący kursor, od którego warto zacząć po pełnej
+    synchronizacji. Kursor sprzed kompaktowania dostaje 410.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_int_param(self, name):
+        raw = self.request.query_params.get(name)
+        if raw is None:
+            return None
+        try:
+            return int(raw)
+        except ValueError:
+            raise ValidationError({name: 'Oczekiwano liczby.'})
+
+    def get(self, request):
+        after = self.get_int_param('after')
+        if after is None:
+            return Response({'cursor': changes.head(), 'has_more': False, 'results': []})
+        models = [name.strip() for name in request.query_params.get('models', '').split(',') if name.strip()]
+        try:
+            entries, has_more = changes.feed(request.user, after, self.get_int_param('limit'), models)
+        except changes.ChangeFeedError as e:
+            raise ValidationError({'detail': str(e)})
+        except changes.ChangeFeedExpired:
+            return Response({'detail': 'Kursor sprzed kompaktowania dziennika - wymagana pełna synchronizacja.',
+                             'cursor': changes.head()}, status=status.HTTP_410_GONE)
+        return Response({
+            'cursor': entries[-1].pk if entries else after,
+            'has_more': has_more,
+            'results': [
+                {
+                    'cursor': entry.pk,
+                    'model': entry.model,
+                    'id': entry.object_id,
+                    'action': entry.action,
+                    'invoice': entry.invoice_id,
+                    'at': entry.created_at,
+                }
+                for entry in entries
+            ],
+        })
+
+class UsersWithPaidInvoices(LeanListMixin, generics.ListAPIView):  # nie działa
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
 
     def get_queryset(self):
-        return User.objects.filter(invoice__status='PAID').distinct()
+        return queries.users_with_invoices(status='PAID')
 
-class UsersWithInvoices(generics.ListAPIView):
+class UsersWithInvoices(LeanListMixin, generics.ListAPIView):
     serializer_class = UserWithInvoices
     permission_classes = [IsAdminUser]
 
     def get_queryset(self):
-        return User.objects.filter(invoice__isnull=False).distinct()
+        return queries.users_with_invoices()
 
-class UsersWithClientProfil(generics.ListAPIView):
+class UsersWithClientProfil(LeanListMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
 
     def get_queryset(self):
         return User.objects.filter(clientprofile__isnull=False)
 
-class ProductsInInvoices(generics.ListAPIView):
+class ProductsInInvoices(LeanListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        produkty_ids = InvoiceItem.objects.values_list('product', flat=True)
-        return Product.objects.filter(id__in=produkty_ids).distinct()
+        return queries.products_in_invoices()
 
-class ProductsNotInInvoices(generics.ListAPIView):
+class ProductsNotInInvoices(LeanListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        produkty_ids = InvoiceItem.objects.values_list('product', flat=True)
-        return Product.objects.exclude(id__in=produkty_ids)
+        return queries.products_not_in_invoices()
 
 class ProductsByUserInvoices(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request, user_id):
-        products = Product.objects.filter(invoiceitem__invoice__user_id=user_id).distinct()
+        products = queries.products_by_user_invoices(user_id)
         serializer = ProductSerializer(products, many=True)
         return Response(serializer.data)
 
-class PopularProducts(generics.ListAPIView):
+class PopularProducts(LeanListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductSerializer
 
     def get_queryset(self):
-        return Product.objects.annotate(
-            invoice_count=Count('invoiceitem')
-        ).filter(invoice_count__gt=1).order_by('-invoice_count')
+        return queries.popular_products()
 
-class InvoiceBasicInfoListView(generics.ListAPIView):
+class InvoiceBasicInfoListView(LeanListMixin, generics.ListAPIView):
     serializer_class = InvoiceBasicInfoSerializer
     permission_classes = [IsAdminUser]
 
     def get_queryset(self):
-        return Invoice.objects.annotate(total_items=Count('items'))
+        return queries.invoice_basic_info()
+
+class BatchView(APIView):
+    """
+    Wiele wywołań API w jednym żądaniu HTTP. Podżądania wykonywane są
+    w tym samym wątku (to samo połączenie z bazą) i korzystają z już
+    rozpoznanego użytkownika zamiast uwierzytelniać się ponownie.
+
+    Z żądania batcha podżądania dziedziczą tylko forwarded_meta
+    (uwierzytelnianie, Accept, adres serwera i klienta). Idempotency-Key
+    i nagłówki warunkowe każde podżądanie podaje osobno w "headers".
+
+    Podżądania wywołują widok bezpośrednio, więc middleware działa tylko
+    raz - dla całego batcha (metryki, kompresja, sesja, CSRF, nagłówki
+    bezpieczeństwa). Wyjątkiem jest kontrola przyjęć: dispatch_one przepuszcza
+    każde podżądanie przez limity jego własnej trasy.
+    """
+    permission_classes = [IsAuthenticated]
+    forwarded_meta = (
+        'HTTP_AUTHORIZATION', 'HTTP_COOKIE', 'HTTP_ACCEPT', 'HTTP_ACCEPT_LANGUAGE', 'HTTP_USER_AGENT',
+        'HTTP_HOST', 'HTTP_X_FORWARDED_PROTO', 'SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR', 'wsgi.url_scheme',
+    )
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({
+            'responses': [self.dispatch_one(request, item) for item in serializer.validated_data['requests']]
+        })
+
+    def dispatch_one(self, request, item):
+        parts = urlsplit(item['url'])
+        try:
+            match = resolve(parts.path)
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': 'Nie znaleziono.'}}
+        view_class = getattr(match.func, 'cls', None)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchView):
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Tego adresu nie można użyć w batchu.'}}
+
+        sub = HttpRequest()
+        sub.method = item['method']
+        sub.path = sub.path_info = parts.path
+        sub.META = {key: request.META[key] for key in self.forwarded_meta if key in request.META}
+        for name, value in item.get('headers', {}).items():
+            sub.META['HTTP_' + name.upper().replace('-', '_')] = value
+        sub.META['QUERY_STRING'] = parts.query
+        sub.GET = QueryDict(parts.query)
+        sub.COOKIES = request.COOKIES
+        body = json.dumps(item['body']).encode() if 'body' in item else b''
+        sub.META['CONTENT_TYPE'] = 'application/json'
+        sub.META['CONTENT_LENGTH'] = str(len(body))
+        sub._stream = io.BytesIO(body)
+        sub._read_started = False
+        sub.resolver_match = match
+        sub.user = request.user
+        # odczytuje BatchSubrequestAuthentication - bez ponownego logowania i CSRF
+        sub.batch_credentials = (request.user, request.auth)
+
+        release = None
+        controller = getattr(request, '_admission_controller', None)
+        if controller is not None:
+            try:
+                release = controller.admit(sub, match.view_name)
+            except admission.Rejected as e:
+                metrics.registry.inc('requests_shed_total', {'view': match.view_name, 'reason': e.reason})
+                return {'status': e.status, 'body': {'detail': e.detail, 'retry_after': e.retry_after}}
+        try:
+            response = match.func(sub, *match.args, **match.kwargs)
+        finally:
+            if release is not None:
+                release()
+        return {'status': response.status_code, 'body': getattr(response, 'data', None)}
+
 
 class APIRootView(APIView):
     """
@@ -174,12 +527,7 @@ class APIRootView(APIView):
     """
     def get(self, request, format=None):
         total_products = Product.objects.count()
-        total_invoices = Invoice.objects.count()
-        total_invoice_value = Invoice.objects.annotate(
-            total_value=Sum(
-                ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField())
-            )
-        ).aggregate(Sum('total_value'))['total_value__sum'] or 0  # Domyślna wartość 0, jeśli brak faktur
+        total_invoices, total_invoice_value = queries.invoice_totals()
 
         return Response({
             'token': reverse('token_obtain_pair', request=request, format=format),
@@ -188,6 +536,8 @@ class APIRootView(APIView):
             'produkty': reverse('product-list-create', request=request, format=format),
             'faktury': reverse('invoice-list-create', request=request, format=format),
             'profil': reverse('my-profile', request=request, format=format),
+            'batch': reverse('api-batch', request=request, format=format),
+            'zmiany': reverse('change-feed', request=request, format=format),
 
             'GET użytkownicy z profilem klienta': reverse('users-with-clientprofile', request=request, format=format),
             'GET użytkownicy z fakturami': reverse('users-with-invoices', request=request, format=format),
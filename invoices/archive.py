@@ -0,0 +1,211 @@
+"""
+Archiwizacja starych zapłaconych faktur.
+
+Faktury PAID starsze niż podana data są przenoszone partiami (razem
+z pozycjami) do tabel ArchivedInvoice / ArchivedInvoiceItem przez
+INSERT ... SELECT i DELETE, bez ładowania wierszy do Pythona. Tabele
+Invoice i InvoiceItem zostają małe, a archiwum jest dostępne do odczytu
+przez API (?include_archived=1) i GraphQL (includeArchived: true).
+"""
+from django.db import connections, transaction
+from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+from django.utils import timezone
+
+from invoices import changes
+from invoices.models import Invoice, InvoiceItem, ArchivedInvoice, ArchivedInvoiceItem, Product
+from invoices.sharding import shard_names
+
+INVOICE_FIELDS = ['id', 'user', 'date', 'status', 'created_by', 'updated_by']
+ITEM_FIELDS = ['id', 'invoice', 'product', 'quantity', 'price']
+ID_CHUNK_SIZE = 500
+
+
+def _columns(model, fields):
+    return [model._meta.get_field(name).column for name in fields]
+
+
+def _copy_rows(using, source, target, fields, where_column, ids, extra=None):
+    """
+    INSERT INTO target (...) SELECT ... FROM source WHERE where_column IN (ids).
+    extra: {kolumna docelowa: stała wartość}.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    src_columns = _columns(source, fields)
+    dst_columns = _columns(target, fields)
+    select = [qn(column) for column in src_columns]
+    params = []
+    for column, value in (extra or {}).items():
+        dst_columns.append(column)
+        select.append('%s')
+        params.append(value)
+    sql = 'INSERT INTO {target} ({dst}) SELECT {select} FROM {source} WHERE {where} IN ({ids})'.format(
+        target=qn(target._meta.db_table),
+        dst=', '.join(qn(column) for column in dst_columns),
+        select=', '.join(select),
+        source=qn(source._meta.db_table),
+        where=qn(where_column),
+        ids=', '.join(['%s'] * len(ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(ids))
+        return cursor.rowcount
+
+
+def _delete_rows(using, model, where_column, ids):
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = 'DELETE FROM {table} WHERE {where} IN ({ids})'.format(
+        table=qn(model._meta.db_table), where=qn(where_column), ids=', '.join(['%s'] * len(ids)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(ids))
+        return cursor.rowcount
+
+
+def _move(using, ids, invoice_from, invoice_to, item_from, item_to, archived_at=None):
+    connection = connections[using]
+    extra = {'archived_at': connection.ops.adapt_datetimefield_value(archived_at)} if archived_at else None
+    with transaction.atomic(using=using):
+        # wpis w kanale zmian obejmuje fakturę razem z pozycjami
+        changes.record_invoices(invoice_from.objects.using(using), 'archive' if archived_at else 'restore', ids)
+        moved = _copy_rows(using, invoice_from, invoice_to, INVOICE_FIELDS, 'id', ids, extra)
+        items = _copy_rows(using, item_from, item_to, ITEM_FIELDS, item_from._meta.get_field('invoice').column, ids)
+        _delete_rows(using, item_from, item_from._meta.get_field('invoice').column, ids)
+        _delete_rows(using, invoice_from, 'id', ids)
+    return moved, items
+
+
+def archive_paid_invoices(before, batch_size=ID_CHUNK_SIZE, using=None, progress=None):
+    """
+    Przenosi do archiwum faktury PAID z datą wcześniejszą niż `before`.
+    Każda partia to osobna, krótka transakcja. Bez `using` - na każdym
+    shardzie po kolei. Zwraca (faktury, pozycje).
+    """
+    if using is None:
+        total_invoices = total_items = 0
+        for shard in shard_names():
+            invoices, items = archive_paid_invoices(before, batch_size, shard, progress)
+            total_invoices += invoices
+            total_items += items
+        return total_invoices, total_items
+    batch_size = min(batch_size, ID_CHUNK_SIZE)
+    candidates = Invoice.objects.using(using).filter(status='PAID', date__lt=before).order_by('pk')
+    total_invoices = total_items = 0
+    while True:
+        ids = list(candidates.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total_invoices, total_items
+        moved, items = _move(using, ids, Invoice, ArchivedInvoice, InvoiceItem, ArchivedInvoiceItem,
+                             archived_at=timezone.now())
+        total_invoices += moved
+        total_items += items
+        if progress:
+            progress(total_invoices, total_items)
+
+
+def restore_invoices(ids, using=None):
+    """
+    Przywraca wskazane faktury z archiwum do tabel bieżących.
+    """
+    if using is None:
+        ids = list(ids)
+        total_invoices = total_items = 0
+        for shard in shard_names():
+            invoices, items = restore_invoices(ids, shard)
+            total_invoices += invoices
+            total_items += items
+        return total_invoices, total_items
+    ids = list(ArchivedInvoice.objects.using(using).filter(pk__in=list(ids)).values_list('pk', flat=True))
+    total_invoices = total_items = 0
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        moved, items = _move(using, ids[start:start + ID_CHUNK_SIZE],
+                             ArchivedInvoice, Invoice, ArchivedInvoiceItem, InvoiceItem)
+        total_invoices += moved
+        total_items += items
+    return total_invoices, total_items
+
+
+def with_total_value(queryset):
+    return queryset.annotate(
+        total_value=Sum(ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField()))
+    )
+
+
+def as_invoice(archived):
+    """
+    Niezapisywana instancja Invoice z danymi faktury archiwalnej - dzięki
+    temu serializery i typy GraphQL faktur działają bez zmian. Pozycje
+    i produkty są ustawione jako prefetch, więc nie idą do bazy ponownie.
+    """
+    invoice = Invoice(
+        id=archived.id, user_id=archived.user_id, date=archived.date, status=archived.status,
+        created_by_id=archived.created_by_id, updated_by_id=archived.updated_by_id,
+    )
+    invoice._state.adding = False
+    invoice._state.db = archived._state.db
+    invoice.archived = True
+    if hasattr(archived, 'total_value'):
+        invoice.total_value = archived.total_value
+
+    items = []
+    for archived_item in archived.items.all():
+        item = InvoiceItem(id=archived_item.id, invoice=invoice, product_id=archived_item.product_id,
+                           quantity=archived_item.quantity, price=archived_item.price)
+        item._state.adding = False
+        items.append(item)
+    invoice._prefetched_objects_cache = {
+        'items': _cached_queryset(InvoiceItem, items),
+        'products': _cached_queryset(Product, [Product(pk=item.product_id) for item in items]),
+    }
+    return invoice
+
+
+def _cached_queryset(model, objects):
+    queryset = model._default_manager.none()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    return queryset
+
+
+class CombinedInvoices:
+    """
+    Faktury bieżące, a po nich archiwalne - jako jedna sekwencja
+    z count() i krojeniem, którą można przekazać do paginatora.
+    """
+    ordered = True
+
+    def __init__(self, hot, archived):
+        self.hot = hot.order_by('pk') if not hot.ordered else hot
+        self.archived = archived.order_by('pk').prefetch_related('items')
+        self.model = Invoice
+        self._hot_count = None
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            result = self[key:key + 1]
+            if not result:
+                raise IndexError(key)
+            return result[0]
+        start = key.start or 0
+        stop = key.stop
+        hot_count = self.hot_count()
+        result = list(self.hot[start:stop]) if start < hot_count else []
+        archived_start = max(0, start - hot_count)
+        archived_stop = None if stop is None else max(0, stop - hot_count)
+        if archived_stop is None or archived_stop > archived_start:
+            result += [as_invoice(a) for a in self.archived[archived_start:archived_stop]]
+        return result
+
+    def __iter__(self):
+        return iter(self[0:None])
@@ -0,0 +1,118 @@
+"""
+Zbiorcze tworzenie produktów i faktur (mutacje GraphQL createProducts
+i createInvoices).
+
+Wejścia są walidowane razem - produkty z pozycji faktur pobieramy jednym
+zapytaniem - a zapis to bulk_create w jednej transakcji. Jeśli choć jedno
+wejście jest błędne, nic nie jest zapisywane, a wynik zawiera błędy
+każdego wejścia osobno, więc klient poprawia całą partię za jednym razem.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from invoices import changes, sharding
+from invoices.metrics import registry
+from invoices.models import Invoice, InvoiceItem, Product
+
+MAX_BATCH_SIZE = 1000
+PRODUCT_FIELDS = ('name', 'price', 'desc', 'category')
+
+
+class BulkCreateError(ValueError):
+    pass
+
+
+def _errors(error, prefix=''):
+    return [
+        {'field': prefix + field, 'message': message}
+        for field, messages in error.message_dict.items()
+        for message in messages
+    ]
+
+
+def _check_size(inputs):
+    if not inputs:
+        raise BulkCreateError("Lista wejść jest pusta.")
+    if len(inputs) > MAX_BATCH_SIZE:
+        raise BulkCreateError(f"Maksymalnie {MAX_BATCH_SIZE} wejść w jednej mutacji.")
+
+
+def create_products(user, inputs):
+    """
+    inputs: lista słowników z polami PRODUCT_FIELDS. Zwraca (ok, wyniki),
+    gdzie wynik to {'index', 'object', 'errors'}.
+    """
+    _check_size(inputs)
+    products, results = [], []
+    for index, data in enumerate(inputs):
+        product = Product(created_by=user, updated_by=user,
+                          **{name: value for name, value in data.items() if name in PRODUCT_FIELDS})
+        errors = []
+        try:
+            product.full_clean(exclude=['created_by', 'updated_by', 'image'])
+        except ValidationError as e:
+            errors = _errors(e)
+        products.append(product)
+        results.append({'index': index, 'object': None, 'errors': errors})
+    if any(result['errors'] for result in results):
+        return False, results
+
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        # bulk_create pomija sygnały - dziennik zmian i repliki na shardach ręcznie
+        changes.record_objects(products, 'create')
+        if sharding.is_enabled():
+            sharding.replicate_many(Product, products)
+    for result, product in zip(results, products):
+        result['object'] = product
+    return True, results
+
+
+def create_invoices(user, inputs):
+    """
+    inputs: lista słowników {'items': [{'product_id', 'quantity', 'price'?}]}.
+    Faktury dostają status NEW i użytkownika user (jak POST /invoices/),
+    cena pozycji domyślnie pochodzi z produktu. Zwraca (ok, wyniki).
+    """
+    _check_size(inputs)
+    product_ids = {int(item['product_id']) for data in inputs for item in data.get('items') or ()}
+    products = Product.objects.in_bulk(list(product_ids))
+
+    invoices, items, results = [], [], []
+    for index, data in enumerate(inputs):
+        invoice = Invoice(user=user, status='NEW', created_by=user, updated_by=user)
+        errors = []
+        if not data.get('items'):
+            errors.append({'field': 'items', 'message': "Faktura musi mieć co najmniej jedną pozycję."})
+        invoice_items = []
+        for position, item_data in enumerate(data.get('items') or ()):
+            prefix = f'items.{position}.'
+            product = products.get(int(item_data['product_id']))
+            if product is None:
+                errors.append({'field': prefix + 'product_id', 'message': "Produkt nie istnieje."})
+                continue
+            price = item_data.get('price')
+            item = InvoiceItem(invoice=invoice, product=product, quantity=item_data['quantity'],
+                               price=product.price if price is None else price)
+            try:
+                item.full_clean(exclude=['invoice', 'product'])
+            except ValidationError as e:
+                errors += _errors(e, prefix)
+            invoice_items.append(item)
+        invoices.append(invoice)
+        items.append(invoice_items)
+        results.append({'index': index, 'object': None, 'errors': errors})
+    if any(result['errors'] for result in results):
+        return False, results
+
+    # wszystkie faktury jednego klienta leżą w jednym shardzie
+    with transaction.atomic(using=Invoice.objects.for_user(user).db):
+        Invoice.objects.bulk_create(invoices)
+        for invoice, invoice_items in zip(invoices, items):
+            for item in invoice_items:
+                item.invoice = invoice
+        InvoiceItem.objects.bulk_create([item for invoice_items in items for item in invoice_items])
+    registry.inc('invoices_created_total', {'status': 'NEW'}, len(invoices))
+    for result, invoice in zip(results, invoices):
+        result['object'] = invoice
+    return True, results
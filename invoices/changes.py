@@ -0,0 +1,254 @@
+"""
+Kanał zmian ("co się zmieniło od kursora") dla produktów, faktur i pozycji.
+
+Każdy zapis Product, Invoice i InvoiceItem - przez save/delete (sygnały)
+i przez ścieżki zbiorcze (bulk_create, zbiorcza zmiana statusu,
+archiwizacja) - dopisuje wiersz do ChangeLogEntry. Klient zapamiętuje id
+ostatniego przeczytanego wpisu i pyta o kolejne, a potem pobiera zmienione
+obiekty przez ?ids=..., zamiast co kilka minut ściągać całe listy.
+
+Kompaktowanie (compact_changes) usuwa starsze niż RETENTION wpisy, które
+mają nowszy wpis dla tego samego obiektu - dziennik rośnie z liczbą
+zmienianych obiektów, nie z liczbą zapisów. Wpisy usunięć i archiwizacji
+starsze niż TOMBSTONE_TTL też są kasowane; klient z kursorem sprzed nich
+dostaje ChangeFeedExpired i musi zsynchronizować się od nowa.
+
+Wpis trafia do bazy 'default' także przy wielu shardach (jeden, globalny
+kursor). Zapis faktury i wpis w dzienniku nie są wtedy w jednej
+transakcji: wycofany zapis może zostawić zbędny wpis, co dla klienta
+oznacza tylko ponowne pobranie obiektu.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Exists, Max, OuterRef, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from invoices.models import ChangeLogCompaction, ChangeLogEntry, Invoice, InvoiceItem, Product
+from invoices.sharding import per_shard
+
+MODELS = {
+    'product': Product,
+    'invoice': Invoice,
+    'invoiceitem': InvoiceItem,
+}
+# akcje, po których obiektu nie ma już na bieżących listach
+TOMBSTONES = ('delete', 'archive')
+BATCH_SIZE = 500
+
+DEFAULTS = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+    'RETENTION': timedelta(days=7),
+    'TOMBSTONE_TTL': timedelta(days=30),
+    # przy bazie z równoległymi zapisami (PostgreSQL) id może zostać
+    # zatwierdzone później niż większe id - wpisy młodsze niż SETTLE
+    # czekają, żeby klient ich nie przeskoczył (SQLite zapisuje po kolei)
+    'SETTLE': timedelta(0),
+}
+
+
+# wysyłany po zapisaniu wpisów (entries: lista albo queryset) - zob. invoices.events
+entries_recorded = Signal()
+
+
+class ChangeFeedError(ValueError):
+    pass
+
+
+class ChangeFeedExpired(Exception):
+    """
+    Kursor sprzed kompaktowania - część usunięć już nie istnieje w dzienniku.
+    """
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'CHANGE_FEED', {})}
+
+
+def _owner(instance):
+    if isinstance(instance, Invoice):
+        return instance.created_by_id
+    if isinstance(instance, InvoiceItem):
+        if InvoiceItem.invoice.is_cached(instance):
+            return instance.invoice.created_by_id
+        # usuwana kaskadowo pozycja - faktury może już nie być
+        return Invoice.objects.using(instance._state.db).filter(
+            pk=instance.invoice_id).values_list('created_by', flat=True).first()
+    return None
+
+
+def record(instance, action):
+    record_many(instance._meta.model_name, action, [
+        (instance.pk, _owner(instance), getattr(instance, 'invoice_id', None))
+    ])
+
+
+def record_many(model, action, rows):
+    """
+    Zapisuje wpisy dla wielu obiektów naraz; rows to trójki
+    (id, id właściciela, id faktury).
+    """
+    if model not in MODELS:
+        return
+    entries = ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=model, object_id=pk, action=action, owner_id=owner, invoice_id=invoice)
+        for pk, owner, invoice in rows
+    ], batch_size=BATCH_SIZE)
+    if entries:
+        entries_recorded.send(sender=ChangeLogEntry, entries=entries)
+
+
+def record_objects(objs, action):
+    """
+    Wpisy dla obiektów zapisanych z pominięciem sygnałów (bulk_create).
+    Właścicieli pozycji bez wczytanej faktury pobieramy jednym zapytaniem.
+    """
+    objs = [obj for obj in objs if obj.pk is not None]  # ignore_conflicts nie zwraca id
+    if not objs or objs[0]._meta.model_name not in MODELS:
+        return
+    missing = list({obj.invoice_id for obj in objs
+                    if isinstance(obj, InvoiceItem) and not InvoiceItem.invoice.is_cached(obj)})
+    owners = {}
+    for start in range(0, len(missing), BATCH_SIZE):
+        invoices = Invoice.objects.across_shards().filter(pk__in=missing[start:start + BATCH_SIZE])
+        for queryset in per_shard(invoices):
+            owners.update(queryset.values_list('pk', 'created_by'))
+
+    def owner(obj):
+        if isinstance(obj, InvoiceItem) and not InvoiceItem.invoice.is_cached(obj):
+            return owners.get(obj.invoice_id)
+        return _owner(obj)
+
+    record_many(objs[0]._meta.model_name, action, [
+        (obj.pk, owner(obj), getattr(obj, 'invoice_id', None)) for obj in objs
+    ])
+
+
+def record_invoices(queryset, action, ids):
+    """
+    Wpisy dla faktur o podanych id (ścieżki zbiorcze bez instancji).
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        rows = queryset.filter(pk__in=ids[start:start + BATCH_SIZE]).values_list('pk', 'created_by')
+        record_many('invoice', action, [(pk, owner, None) for pk, owner in rows])
+
+
+def record_query(queryset, action):
+    """
+    Wpisy dla faktur z queryset bez wczytywania ich do Pythona. W bazie
+    dziennika - jednym INSERT ... SELECT; faktury z innego shardu są
+    czytane strumieniem i zapisywane partiami po BATCH_SIZE. Wołać przed
+    UPDATE, po którym faktury wypadają z queryset (status, deleted_at).
+    """
+    rows = queryset.values_list('pk', 'created_by').order_by()
+    database = router.db_for_write(ChangeLogEntry)
+    if rows.db != database:
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append((*row, None))
+            if len(batch) == BATCH_SIZE:
+                record_many('invoice', action, batch)
+                batch = []
+        record_many('invoice', action, batch)
+        return
+
+    connection = connections[database]
+    quote = connection.ops.quote_name
+    meta = ChangeLogEntry._meta
+    columns = ', '.join(quote(meta.get_field(name).column)
+                        for name in ('object_id', 'owner', 'model', 'action', 'invoice_id', 'created_at'))
+    select, params = rows.query.get_compiler(using=database).as_sql()
+    after, now = head(), timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+            f"SELECT selected.*, %s, %s, NULL, %s FROM ({select}) selected",
+            ('invoice', action, connection.ops.adapt_datetimefield_value(now), *params),
+        )
+        inserted = cursor.rowcount
+    if inserted:
+        # odbiorcy (invoices.events) czytają wpisy tylko, gdy ich potrzebują
+        entries_recorded.send(sender=ChangeLogEntry, entries=ChangeLogEntry.objects.filter(
+            pk__gt=after, model='invoice', action=action, created_at=now).order_by('pk'))
+
+
+def head():
+    """
+    Kursor najnowszego wpisu - punkt startu po pełnej synchronizacji.
+    """
+    return ChangeLogEntry.objects.aggregate(Max('pk'))['pk__max'] or 0
+
+
+def horizon():
+    return ChangeLogCompaction.objects.aggregate(Max('horizon'))['horizon__max'] or 0
+
+
+def visible_to(user, queryset=None):
+    queryset = ChangeLogEntry.objects.all() if queryset is None else queryset
+    if user.is_staff:
+        return queryset
+    # produkty widzą wszyscy, faktury i pozycje - ich twórca (jak IsOwnerOrAdmin)
+    return queryset.filter(Q(model='product') | Q(owner=user))
+
+
+def feed(user, after, limit=None, models=None):
+    """
+    Wpisy widoczne dla użytkownika z id większym niż `after`, rosnąco.
+    Zwraca (wpisy, czy są kolejne).
+    """
+    options = config()
+    limit = options['PAGE_SIZE'] if limit is None else limit
+    if limit < 1 or limit > options['MAX_PAGE_SIZE']:
+        raise ChangeFeedError(f"limit musi być z zakresu 1-{options['MAX_PAGE_SIZE']}.")
+    unknown = set(models or ()) - set(MODELS)
+    if unknown:
+        raise ChangeFeedError(f"Nieznane modele: {', '.join(sorted(unknown))}.")
+    if after < horizon():
+        raise ChangeFeedExpired()
+
+    entries = visible_to(user).filter(pk__gt=after)
+    if models:
+        entries = entries.filter(model__in=models)
+    if options['SETTLE']:
+        entries = entries.filter(created_at__lte=timezone.now() - options['SETTLE'])
+    entries = list(entries.order_by('pk')[:limit + 1])
+    return entries[:limit], len(entries) > limit
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ChangeLogEntry.objects.filter(pk__in=ids).delete()[0]
+
+
+def compact(retention=None, tombstone_ttl=None, batch_size=BATCH_SIZE):
+    """
+    Usuwa wpisy zastąpione nowszymi (starsze niż retention) i stare wpisy
+    usunięć (starsze niż tombstone_ttl). Zwraca (zastąpione, usunięcia).
+    """
+    options = config()
+    retention = options['RETENTION'] if retention is None else retention
+    tombstone_ttl = options['TOMBSTONE_TTL'] if tombstone_ttl is None else tombstone_ttl
+    now = timezone.now()
+    newer = ChangeLogEntry.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), pk__gt=OuterRef('pk'))
+    superseded = ChangeLogEntry.objects.filter(created_at__lt=now - retention).filter(Exists(newer))
+    removed = _delete_in_batches(superseded, batch_size)
+
+    # najnowszy wpis zostaje zawsze: SQLite bez AUTOINCREMENT nadałby
+    # jego id ponownie, a kursor musi tylko rosnąć
+    tombstones = ChangeLogEntry.objects.filter(
+        action__in=TOMBSTONES, created_at__lt=now - tombstone_ttl, pk__lt=head())
+    last = tombstones.aggregate(Max('pk'))['pk__max']
+    if last is None:
+        return removed, 0
+    # najpierw horyzont - klient nie może przeskoczyć usunięć kasowanych niżej
+    ChangeLogCompaction.objects.create(horizon=last)
+    return removed, _delete_in_batches(tombstones.filter(pk__lte=last), batch_size)
@@ -0,0 +1,201 @@
+"""
+Miękkie usuwanie klientów i faktur, a zależności - w tle, partiami.
+
+User.delete() z on_delete=CASCADE zbiera w Pythonie wszystkie faktury,
+pozycje i profil klienta oraz zeruje created_by/updated_by w każdym
+produkcie i fakturze, a wszystko to w jednej transakcji - przy dużej
+historii blokada zapisu trwa minutami. Zamiast tego:
+
+- soft_delete_user od razu dezaktywuje konto (logowanie i tokeny przestają
+  działać, konto znika z /users/), oznacza jego faktury jako usunięte
+  i zakłada DeletionJob; faktury archiwalne klienta ukrywa
+  exclude_pending_users,
+- soft_delete_invoices od razu ustawia deleted_at - faktury znikają
+  z Invoice.objects, a kanał zmian dostaje wpisy usunięcia,
+- purge_deletions (run) usuwa zależności partiami po BATCH_SIZE wierszy,
+  każda partia w osobnej krótkiej transakcji, zapisując postęp w zadaniu;
+  na końcu samo User.delete() ma już niewiele do zebrania.
+
+Przerwane zadanie można wznowić - każdy krok jest idempotentny. Zadanie
+z błędem (failed) czeka na purge_deletions --retry-failed; do tego czasu
+usunięty klient pozostaje ukryty.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from invoices import changes
+from invoices.archive import _delete_rows
+from invoices.models import (
+    ArchivedInvoice, ArchivedInvoiceItem, DeletionJob, IdempotencyKey, Invoice, InvoiceItem, Product,
+)
+from invoices.sharding import DEFAULT_SHARD, is_sharded, per_shard, shard_names
+
+BATCH_SIZE = 500
+
+# kolumny z on_delete=SET_NULL wskazujące użytkownika
+USER_REFERENCES = [
+    (Product, 'created_by'),
+    (Product, 'updated_by'),
+    (Invoice, 'created_by'),
+    (Invoice, 'updated_by'),
+    (ArchivedInvoice, 'created_by'),
+    (ArchivedInvoice, 'updated_by'),
+]
+
+
+def soft_delete_user(user, requested_by=None):
+    invoices = Invoice.objects.for_user(user).filter(user=user)
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        job = DeletionJob.objects.create(kind='user', user_id=user.pk, requested_by=requested_by)
+        # przy wielu shardach - osobna transakcja w shardzie klienta
+        with transaction.atomic(using=invoices.db):
+            changes.record_query(invoices, 'delete')
+            invoices.update(deleted_at=timezone.now())
+    return job
+
+
+def pending_user_ids():
+    """
+    Użytkownicy usunięci miękko, którzy jeszcze czekają na purge.
+    """
+    return DeletionJob.objects.filter(kind='user').exclude(status='done').values('user')
+
+
+def exclude_pending_users(queryset):
+    """
+    Faktury archiwalne bez klientów czekających na purge (archiwum nie ma
+    deleted_at). Id pobieramy osobno - archiwum może leżeć w innym shardzie.
+    """
+    pending = list(pending_user_ids().values_list('user', flat=True))
+    return queryset.exclude(user_id__in=pending) if pending else queryset
+
+
+def soft_delete_invoices(queryset, ids=None, requested_by=None):
+    """
+    Oznacza faktury z queryset (zawężone do ids, jeśli podano) jako usunięte
+    i zakłada zadanie, które usunie je razem z pozycjami. Zwraca
+    (liczba faktur, zadanie albo None).
+    """
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+    now = timezone.now()
+    deleted = 0
+    for shard_queryset in per_shard(queryset):
+        if ids is None:
+            selections = [shard_queryset]
+        else:
+            selections = [shard_queryset.filter(pk__in=ids[start:start + BATCH_SIZE])
+                          for start in range(0, len(ids), BATCH_SIZE)]
+        with transaction.atomic(using=shard_queryset.db):
+            for selection in selections:
+                # wpisy przed UPDATE - po nim faktury wypadają z Invoice.objects
+                changes.record_query(selection, 'delete')
+                deleted += selection.update(deleted_at=now)
+    if not deleted:
+        return 0, None
+    job = DeletionJob.objects.create(kind='invoices', requested_by=requested_by, progress={'soft_deleted': deleted})
+    return deleted, job
+
+
+# --- kroki: każde wywołanie usuwa jedną partię i zwraca jej rozmiar (0 - koniec) ---
+
+def _purge_invoices(invoice_model, item_model, lookup, batch_size, record):
+    for shard in shard_names():
+        rows = invoice_model._base_manager.using(shard).filter(**lookup)
+        ids = list(rows.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            continue
+        with transaction.atomic(using=shard):
+            if record:
+                # _default_manager: faktury usunięte miękko mają już wpis usunięcia
+                changes.record_invoices(invoice_model._default_manager.using(shard), 'delete', ids)
+            _delete_rows(shard, item_model, item_model._meta.get_field('invoice').column, ids)
+            return _delete_rows(shard, invoice_model, 'id', ids)
+    return 0
+
+
+def _clear_reference(model, field, user_id, batch_size):
+    for shard in shard_names():
+        rows = model._base_manager.using(shard)
+        ids = list(rows.filter(**{field: user_id}).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            continue
+        with transaction.atomic(using=shard):
+            updated = rows.filter(pk__in=ids).update(**{field: None})
+            # kopie produktów na shardach nie są osobnymi zmianami
+            if model is not ArchivedInvoice and (shard == DEFAULT_SHARD or is_sharded(model)):
+                changes.record_many(model._meta.model_name, 'update', [(pk, None, None) for pk in ids])
+        return updated
+    return 0
+
+
+def _delete_keys(user_id, batch_size):
+    ids = list(IdempotencyKey.objects.filter(user_id=user_id).values_list('pk', flat=True)[:batch_size])
+    return IdempotencyKey.objects.filter(pk__in=ids).delete()[0] if ids else 0
+
+
+def _delete_user(user_id, batch_size):
+    # reszta (profil, przypisanie do shardu, repliki) jest już mała
+    return 1 if User.objects.filter(pk=user_id).delete()[0] else 0
+
+
+def user_steps(user_id):
+    steps = [
+        ('invoices', lambda n: _purge_invoices(Invoice, InvoiceItem, {'user_id': user_id}, n, True)),
+        ('archived_invoices', lambda n: _purge_invoices(
+            ArchivedInvoice, ArchivedInvoiceItem, {'user_id': user_id}, n, True)),
+        ('idempotency_keys', lambda n: _delete_keys(user_id, n)),
+    ]
+    for model, field in USER_REFERENCES:
+        steps.append((f'{model._meta.model_name}.{field}',
+                      lambda n, model=model, field=field: _clear_reference(model, field, user_id, n)))
+    steps.append(('user', lambda n: _delete_user(user_id, n)))
+    return steps
+
+
+def invoice_steps():
+    # wpisy usunięcia trafiły do dziennika już przy soft_delete_invoices
+    return [('invoices', lambda n: _purge_invoices(
+        Invoice, InvoiceItem, {'deleted_at__isnull': False}, n, False))]
+
+
+def run(job, batch_size=BATCH_SIZE, progress=None):
+    """
+    Wykonuje zadanie partiami; progress(job) jest wołane po każdej partii.
+    """
+    job.status = 'running'
+    DeletionJob.objects.filter(pk=job.pk).update(status='running', updated_at=timezone.now())
+    steps = user_steps(job.user_id) if job.kind == 'user' else invoice_steps()
+    try:
+        for name, step in steps:
+            while True:
+                count = step(batch_size)
+                if not count:
+                    break
+                job.progress[name] = job.progress.get(name, 0) + count
+                DeletionJob.objects.filter(pk=job.pk).update(progress=job.progress, updated_at=timezone.now())
+                if progress:
+                    progress(job)
+    except Exception as e:
+        job.status, job.error = 'failed', str(e)
+        DeletionJob.objects.filter(pk=job.pk).update(status='failed', error=job.error, updated_at=timezone.now())
+        raise
+    job.status, job.finished_at = 'done', timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(status='done', finished_at=job.finished_at,
+                                                 updated_at=job.finished_at)
+    return job
+
+
+def pending_jobs():
+    # 'running' też - zadanie przerwane w połowie jest wznawiane
+    return DeletionJob.objects.filter(status__in=('pending', 'running')).order_by('pk')
+
+
+def retry_failed():
+    """
+    Przywraca nieudane zadania do kolejki (postęp zostaje - kroki są
+    idempotentne). Zwraca liczbę zadań.
+    """
+    return DeletionJob.objects.filter(status='failed').update(status='pending', error='', updated_at=timezone.now())
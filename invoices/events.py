@@ -0,0 +1,229 @@
+"""
+Zdarzenia faktur dla strumienia Server-Sent Events (/invoices/events/).
+
+Zamiast odpytywać /invoices/<pk>/ klient trzyma otwarte połączenie
+i dostaje stan faktury (status, wartość) po każdym jej utworzeniu,
+zmianie lub zmianie pozycji. Właściciel (created_by) widzi swoje faktury,
+admin - wszystkie.
+
+Źródłem zdarzeń są wpisy dziennika zmian (invoices.changes), więc obejmują
+też ścieżki zbiorcze. Strumień to korutyna w pętli zdarzeń ASGI
+(invoice_manager.asgi), a nie wątek - jeden worker utrzyma tysiące
+bezczynnych połączeń. Rozsyłanie odbywa się w procesie (Broker), a skąd
+broker bierze wpisy, decyduje INVOICE_EVENTS['BACKEND']:
+
+- 'local' - prosto z zapisów w tym samym procesie (po commicie); wystarcza
+  przy jednym workerze,
+- 'changelog' - jedno zadanie na worker odpytuje tabelę dziennika co
+  POLL_INTERVAL sekund (jedno zapytanie na worker, nie na połączenie), więc
+  zdarzenie dociera do klientów każdego workera, niezależnie od tego, który
+  proces zapisał fakturę.
+
+Id zdarzenia to kursor dziennika - po zerwaniu połączenia przeglądarka
+wysyła Last-Event-ID i brakujące zmiany są odtwarzane z dziennika.
+"""
+import asyncio
+import json
+import threading
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from invoices import changes
+from invoices.archive import with_total_value
+from invoices.models import ChangeLogEntry, Invoice
+from invoices.sharding import per_shard
+
+MODELS = ('invoice', 'invoiceitem')
+BATCH_SIZE = 500
+CENTS = Decimal('0.01')
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'POLL_INTERVAL': 1.0,
+    # komentarz co tyle sekund - proxy nie zamykają bezczynnego połączenia
+    'HEARTBEAT': 15.0,
+    # zdarzenia czekające na wolnego klienta; nadmiar wypiera najstarsze
+    'QUEUE_SIZE': 100,
+    # po ilu ms przeglądarka ma się połączyć ponownie
+    'RETRY': 3000,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'INVOICE_EVENTS', {})}
+
+
+def invoice_events(entries):
+    """
+    Zdarzenia dla wpisów dziennika: jedno na fakturę, ze stanem po
+    ostatniej zmianie, w kolejności kursorów.
+    """
+    latest = {}
+    for entry in entries:
+        if entry.model == 'invoice':
+            invoice_id, action = entry.object_id, entry.action
+        elif entry.model == 'invoiceitem' and entry.invoice_id is not None:
+            invoice_id, action = entry.invoice_id, 'update'
+        else:
+            continue
+        previous = latest.get(invoice_id)
+        if previous and previous['action'] == 'create' and action == 'update':
+            action = 'create'
+        latest[invoice_id] = {'cursor': entry.pk, 'id': invoice_id, 'action': action, 'owner': entry.owner_id}
+
+    live = [invoice_id for invoice_id, event in latest.items() if event['action'] not in changes.TOMBSTONES]
+    rows = {}
+    for start in range(0, len(live), BATCH_SIZE):
+        invoices = with_total_value(Invoice.objects.across_shards().filter(pk__in=live[start:start + BATCH_SIZE]))
+        for queryset in per_shard(invoices):
+            rows.update((row[0], row) for row in queryset.values_list('pk', 'status', 'created_by', 'total_value'))
+
+    events = []
+    for invoice_id, event in latest.items():
+        if event['action'] not in changes.TOMBSTONES:
+            if invoice_id not in rows:
+                continue  # usunięta w międzyczasie - zdarzenie usunięcia przyjdzie osobno
+            _, event['status'], event['owner'], total = rows[invoice_id]
+            event['total_value'] = None if total is None else Decimal(total).quantize(CENTS)
+        events.append(event)
+    return sorted(events, key=lambda event: event['cursor'])
+
+
+def format_event(event):
+    data = {key: value for key, value in event.items() if key not in ('cursor', 'owner')}
+    return f"id: {event['cursor']}\nevent: invoice\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+class Subscription:
+    def __init__(self, loop, user_id, is_staff, size):
+        self.loop = loop
+        self.user_id = user_id
+        self.is_staff = is_staff
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def wants(self, event):
+        return self.is_staff or event['owner'] == self.user_id
+
+    def put(self, event):
+        # publish może przyjść z wątku widoku synchronicznego
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # pętla już zamknięta
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class Broker:
+    """
+    Rozsyłanie zdarzeń do strumieni otwartych w tym procesie.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._poller = None
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def subscribe(self, user_id, is_staff):
+        subscription = Subscription(asyncio.get_running_loop(), user_id, is_staff, config()['QUEUE_SIZE'])
+        with self._lock:
+            self._subscriptions.add(subscription)
+        if config()['BACKEND'] == 'changelog' and self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for event in events:
+                if subscription.wants(event):
+                    subscription.put(event)
+
+    async def _poll(self):
+        try:
+            cursor = await sync_to_async(changes.head)()
+            while self.has_subscribers():
+                await asyncio.sleep(config()['POLL_INTERVAL'])
+                entries = await sync_to_async(_entries_after)(cursor)
+                if entries:
+                    cursor = entries[-1].pk
+                    self.publish(await sync_to_async(invoice_events)(entries))
+        finally:
+            self._poller = None
+
+
+def _entries_after(cursor):
+    return list(ChangeLogEntry.objects.filter(pk__gt=cursor, model__in=MODELS).order_by('pk')[:BATCH_SIZE])
+
+
+broker = Broker()
+
+
+def notify(entries):
+    """
+    Backend 'local': przekazuje brokerowi zapisane właśnie wpisy, gdy
+    w procesie są otwarte strumienie (bez nich - żadnych dodatkowych zapytań).
+    """
+    if config()['BACKEND'] != 'local' or not broker.has_subscribers():
+        return
+    entries = [entry for entry in entries if entry.model in MODELS]
+    if entries:
+        transaction.on_commit(lambda: broker.publish(invoice_events(entries)))
+
+
+async def _replay(user, after):
+    """
+    Zdarzenia z dziennika po kursorze `after` (Last-Event-ID), strona po
+    stronie dziennika - po długiej przerwie w pamięci jest tylko jedna
+    strona, a klient dostaje pierwsze zdarzenia od razu. Faktura zmieniana
+    na kilku stronach przychodzi kilka razy, zawsze z bieżącym stanem.
+    """
+    has_more = True
+    while has_more:
+        page, has_more = await sync_to_async(changes.feed)(user, after, models=list(MODELS))
+        if not page:
+            return
+        after = page[-1].pk
+        for event in await sync_to_async(invoice_events)(page):
+            yield event
+
+
+async def stream(user, last_event_id=None):
+    options = config()
+    # subskrypcja przed odtworzeniem historii - nic nie ginie pomiędzy
+    subscription = broker.subscribe(user.pk, user.is_staff)
+    try:
+        yield f"retry: {options['RETRY']}\n\n".encode()
+        seen = 0
+        if last_event_id is not None:
+            try:
+                async for event in _replay(user, int(last_event_id)):
+                    seen = event['cursor']
+                    yield format_event(event)
+            except (ValueError, changes.ChangeFeedExpired):
+                yield b"event: resync\ndata: {}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), options['HEARTBEAT'])
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if event['cursor'] > seen:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,120 @@
+"""
+Obsługa nagłówka Idempotency-Key dla operacji tworzących obiekty.
+
+Pierwsze żądanie z danym kluczem zajmuje go przez INSERT do tabeli
+z ograniczeniem unikalności (user, scope, key) - równoległy duplikat dostaje
+IntegrityError zamiast czekać na blokadę. Po zakończeniu zapisujemy
+odpowiedź, którą kolejne powtórzenia dostają bez ponownego wykonania operacji.
+Klucz bez odpowiedzi starszy niż IDEMPOTENCY_KEY_LEASE (proces padł między
+claim a complete/release) jest porzucony i ponowienie może go przejąć.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from invoices.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    status_code = 400
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        if status_code is not None:
+            self.status_code = status_code
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def key_lease():
+    return getattr(settings, 'IDEMPOTENCY_KEY_LEASE', timedelta(minutes=5))
+
+
+def fingerprint(method, path, data, files=None):
+    """
+    Skrót treści żądania - ten sam klucz z inną treścią to błąd klienta.
+    Pliki opisujemy nazwą i rozmiarem, żeby nie czytać ich drugi raz.
+    """
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())
+    payload = {
+        'method': method,
+        'path': path,
+        'data': data,
+        'files': sorted((name, f.name, f.size) for name, f in (files or {}).items()),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def claim(user, scope, key, request_fingerprint):
+    """
+    Zwraca (rekord, True) gdy klucz został właśnie zajęty, albo
+    (istniejący rekord, False) gdy użyto go już wcześniej.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f"Idempotency-Key musi mieć od 1 do {MAX_KEY_LENGTH} znaków.")
+    if user is None or not user.is_authenticated:
+        raise IdempotencyError("Idempotency-Key wymaga zalogowanego użytkownika.", 401)
+
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, scope=scope, key=key, fingerprint=request_fingerprint
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+            if record is None:
+                continue  # właśnie usunięty - próbujemy jeszcze raz
+            if record.created_at < timezone.now() - key_ttl():
+                # wygasły klucz traktujemy jak nowy
+                IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+                continue
+            if record.fingerprint != request_fingerprint:
+                raise IdempotencyError("Idempotency-Key został już użyty z inną treścią żądania.", 422)
+            if record.status_code is None:
+                if record.created_at < timezone.now() - key_lease():
+                    # porzucony - warunek na status_code, żeby nie skasować właśnie zakończonego
+                    IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at,
+                                                  status_code__isnull=True).delete()
+                    continue
+                raise IdempotencyError("Żądanie z tym Idempotency-Key jest jeszcze przetwarzane.", 409)
+            return record, False
+    raise IdempotencyError("Nie udało się zarezerwować Idempotency-Key.", 409)
+
+
+def complete(record, status_code, response):
+    IdempotencyKey.objects.filter(pk=record.pk).update(status_code=status_code, response=response)
+    record.status_code = status_code
+    record.response = response
+
+
+def release(record):
+    """
+    Operacja się nie udała - zwalniamy klucz, żeby klient mógł ponowić.
+    """
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def prune(older_than=None, batch_size=10000):
+    """
+    Usuwa wygasłe klucze partiami (krótkie transakcje zamiast jednej długiej).
+    """
+    cutoff = timezone.now() - (older_than or key_ttl())
+    expired = IdempotencyKey.objects.filter(created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        count, _ = IdempotencyKey.objects.filter(pk__in=expired.values('pk')[:batch_size]).delete()
+        deleted += count
+        if count < batch_size:
+            return deleted
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoices.archive import archive_paid_invoices
+
+
+class Command(BaseCommand):
+    help = "Przenosi zapłacone faktury starsze niż --days dni (z pozycjami) do tabel archiwum."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        before = timezone.now().date() - timedelta(days=options['days'])
+
+        def progress(invoices, items):
+            self.stdout.write(f"... {invoices} faktur, {items} pozycji")
+
+        invoices, items = archive_paid_invoices(before, options['batch_size'], progress=progress)
+        self.stdout.write(f"Zarchiwizowano {invoices} faktur i {items} pozycji (sprzed {before}).")
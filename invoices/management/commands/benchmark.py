@@ -0,0 +1,156 @@
+import json
+import time
+import zlib
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from invoices.api.lean import lean_query
+from invoices.api.renderers import FastJSONRenderer, dumps
+from invoices.api.serializers import InvoiceSerializer, ProductSerializer
+from invoices.models import Product, Invoice, InvoiceItem
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(invoices, items_per_invoice):
+    """
+    Dane testowe w bieżącej transakcji (benchmark zawsze ją wycofuje).
+    """
+    user = User.objects.create_user(username='benchmark-user', is_staff=True)
+    products = Product.objects.bulk_create(
+        Product(name=f'Produkt {i}', price=Decimal('19.99') + i, category='OTHR',
+                image=f'produkty/p{i}.webp', created_by=user)
+        for i in range(max(items_per_invoice, 50))
+    )
+    created = Invoice.objects.bulk_create(
+        Invoice(user=user, status='NEW', created_by=user, updated_by=user) for _ in range(invoices)
+    )
+    InvoiceItem.objects.bulk_create(
+        InvoiceItem(invoice=invoice, product=products[j], quantity=j + 1, price=products[j].price)
+        for invoice in created for j in range(items_per_invoice)
+    )
+    return user
+
+
+def invoice_list_data(request):
+    queryset = Invoice.objects.annotate(
+        total_value=Sum(ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField()))
+    )
+    return list(lean_query(InvoiceSerializer, queryset, request))
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+def bench_serialization(command, options):
+    request = APIRequestFactory().get('/invoices/api/invoices/', HTTP_HOST='localhost')
+    invoices = Invoice.objects.annotate(
+        total_value=Sum(ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField()))
+    )
+    cases = [
+        ('invoices', InvoiceSerializer, invoices),
+        ('products', ProductSerializer, Product.objects.all()),
+    ]
+    for label, serializer_class, queryset in cases:
+        def drf():
+            return len(serializer_class(queryset.all(), many=True, context={'request': request}).data)
+
+        def lean():
+            return len(list(lean_query(serializer_class, queryset.all(), request)))
+
+        rows, before = measure(drf, options['repeat'])
+        _, after = measure(lean, options['repeat'])
+        command.stdout.write(
+            f'{label:<10} rows={rows:<7} serializer={rows / before:>10.0f} rows/s  '
+            f'lean={rows / after:>10.0f} rows/s  x{before / after:.1f}'
+        )
+
+
+def report_encoding(command, label, payload, repeat):
+    for coding, wbits in (('gzip', 16 + zlib.MAX_WBITS), ('deflate', zlib.MAX_WBITS)):
+        def compress():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+            return compressor.compress(payload) + compressor.flush()
+        compressed, elapsed = measure(compress, repeat)
+        command.stdout.write(
+            f'{label:<14} {coding:<8} {len(payload):>9} B -> {len(compressed):>8} B '
+            f'({len(compressed) / len(payload):.1%}) w {elapsed * 1000:.1f} ms'
+        )
+
+
+def bench_rendering(command, options):
+    from invoice_manager.schema_graphql import schema
+
+    request = APIRequestFactory().get('/invoices/api/invoices/', HTTP_HOST='localhost')
+    request.user = User.objects.get(username='benchmark-user')
+    data = invoice_list_data(request)
+    repeat = options['repeat']
+
+    payload, before = measure(lambda: JSONRenderer().render(data), repeat)
+    _, after = measure(lambda: FastJSONRenderer().render(data), repeat)
+    command.stdout.write(f'invoice list   JSONRenderer={before * 1000:.1f} ms  FastJSONRenderer={after * 1000:.1f} ms')
+    report_encoding(command, 'invoice list', payload, repeat)
+
+    query = '{ allInvoices { id date status items { quantity price product { id name } } } }'
+    result = schema.execute(query, context_value=request)
+    if result.errors:
+        raise result.errors[0]
+    graphql_data = {'data': result.data}
+    payload, before = measure(lambda: json.dumps(graphql_data, separators=(',', ':')).encode(), repeat)
+    _, after = measure(lambda: dumps(graphql_data), repeat)
+    command.stdout.write(f'allInvoices    json.dumps={before * 1000:.1f} ms  dumps={after * 1000:.1f} ms')
+    report_encoding(command, 'allInvoices', payload, repeat)
+
+
+def bench_transition(command, options):
+    from invoices.transitions import transition_for_user
+
+    user = User.objects.get(username='benchmark-user')
+    ids = list(Invoice.objects.filter(created_by=user).values_list('id', flat=True))
+    for target, kwargs in (('SENT', {'ids': ids}), ('PAID', {'status': 'SENT'})):
+        start = time.perf_counter()
+        result = transition_for_user(user, target, **kwargs)
+        elapsed = time.perf_counter() - start
+        mode = 'ids' if 'ids' in kwargs else 'filter'
+        command.stdout.write(f'-> {target:<5} ({mode:<6}) {result} w {elapsed * 1000:.1f} ms')
+
+
+SCENARIOS = {
+    'serialization': bench_serialization,
+    'rendering': bench_rendering,
+    'transition': bench_transition,
+}
+
+
+class Command(BaseCommand):
+    help = "Mikrobenchmarki ścieżek krytycznych na danych tymczasowych (wycofywanych po pomiarze)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--invoices', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed(options['invoices'], options['items'])
+                SCENARIOS[options['scenario']](self, options)
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from invoices import changes
+
+
+class Command(BaseCommand):
+    help = ("Kompaktuje dziennik zmian: usuwa wpisy zastąpione nowszymi (starsze niż RETENTION) "
+            "i wpisy usunięć starsze niż TOMBSTONE_TTL (zob. CHANGE_FEED).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help="Usuń zastąpione wpisy starsze niż tyle dni.")
+        parser.add_argument('--tombstone-days', type=float, help="Usuń wpisy usunięć starsze niż tyle dni.")
+        parser.add_argument('--batch-size', type=int, default=changes.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        retention = timedelta(days=options['days']) if options['days'] is not None else None
+        tombstone_ttl = timedelta(days=options['tombstone_days']) if options['tombstone_days'] is not None else None
+        superseded, tombstones = changes.compact(retention, tombstone_ttl, options['batch_size'])
+        self.stdout.write(f"Usunięto {superseded} zastąpionych wpisów i {tombstones} wpisów usunięć.")
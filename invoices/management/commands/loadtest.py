@@ -0,0 +1,116 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from invoices.models import Product, Invoice, InvoiceItem
+
+HEAVY_QUERY = '{ allInvoices { id status items { quantity price product { name } } } }'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Test obciążeniowy admission control: ciężki klient GraphQL kontra tworzenie faktur. "
+            "Działa na tymczasowej bazie, porównuje p50/p99 zapisów bez i z limitami.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--heavy-threads', type=int, default=8)
+        parser.add_argument('--writer-threads', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--invoices', type=int, default=300)
+        parser.add_argument('--aggressive', action='store_true',
+                            help="Ciężki klient ignoruje Retry-After i ponawia od razu.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict['TEST'] = dict(connection.settings_dict.get('TEST') or {}, NAME=path)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['invoices'])
+            for enabled in (False, True):
+                config = dict(settings.ADMISSION_CONTROL, ENABLED=enabled)
+                with override_settings(ADMISSION_CONTROL=config):
+                    caches['default'].clear()
+                    self.report('admission control ' + ('ON ' if enabled else 'OFF'), self.run_phase(options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if os.path.exists(path):
+                os.remove(path)
+
+    def seed(self, invoices):
+        self.heavy_user = User.objects.create_user(username='raporty', password='x', is_staff=True)
+        self.writer = User.objects.create_user(username='kasa', password='x')
+        self.product = Product.objects.create(name='Monitor', price=799, category='ELEC')
+        created = Invoice.objects.bulk_create(
+            Invoice(user=self.heavy_user, created_by=self.heavy_user) for _ in range(invoices))
+        InvoiceItem.objects.bulk_create(
+            InvoiceItem(invoice=invoice, product=self.product, quantity=i % 5 + 1, price=799)
+            for invoice in created for i in range(3))
+
+    def run_phase(self, options):
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        results = {'write': [], 'write_errors': 0, 'heavy': {}}
+
+        def heavy():
+            client = APIClient()
+            client.force_login(self.heavy_user)
+            while time.monotonic() < deadline:
+                response = client.post('/graphql', {'query': HEAVY_QUERY}, format='json')
+                code = response.status_code
+                with lock:
+                    results['heavy'][code] = results['heavy'].get(code, 0) + 1
+                if code in (429, 503) and not options['aggressive']:
+                    time.sleep(min(int(response['Retry-After']), max(0.0, deadline - time.monotonic())))
+            connections.close_all()
+
+        def writer():
+            client = APIClient()
+            client.force_login(self.writer)
+            payload = {'items': [{'product': self.product.id, 'quantity': 1}]}
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                code = client.post('/invoices/api/invoices/', payload, format='json').status_code
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if code == 201:
+                        results['write'].append(elapsed)
+                    else:
+                        results['write_errors'] += 1
+            connections.close_all()
+
+        threads = [threading.Thread(target=heavy) for _ in range(options['heavy_threads'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writer_threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def report(self, label, results):
+        writes = results['write']
+        heavy = ', '.join(f'{code}: {count}' for code, count in sorted(results['heavy'].items()))
+        self.stdout.write(
+            f'{label}  zapisy: {len(writes)} ok / {results["write_errors"]} błędów, '
+            f'p50={percentile(writes, 0.5) * 1000:.0f} ms p99={percentile(writes, 0.99) * 1000:.0f} ms  '
+            f'ciężki klient: {heavy}'
+        )
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from invoices import idempotency
+
+
+class Command(BaseCommand):
+    help = "Usuwa wygasłe klucze Idempotency-Key (domyślnie starsze niż IDEMPOTENCY_KEY_TTL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, help="Usuń klucze starsze niż tyle godzin.")
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        older_than = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        deleted = idempotency.prune(older_than, options['batch_size'])
+        self.stdout.write(f"Usunięto {deleted} kluczy.")
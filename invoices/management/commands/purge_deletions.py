@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoices import deletion
+
+
+class Command(BaseCommand):
+    help = ("Usuwa w tle, partiami, dane miękko usuniętych klientów i faktur (zadania DeletionJob). "
+            "Z --watch działa jako stały worker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=deletion.BATCH_SIZE)
+        parser.add_argument('--watch', type=float, metavar='SEKUNDY',
+                            help="Po opróżnieniu kolejki czekaj tyle sekund i sprawdzaj ponownie.")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Przed startem przywróć do kolejki zadania zakończone błędem.")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f"Przywrócono zadań: {deletion.retry_failed()}")
+        while True:
+            for job in deletion.pending_jobs():
+                self.stdout.write(f"Zadanie #{job.pk} ({job.get_kind_display()})...")
+                try:
+                    deletion.run(job, options['batch_size'], progress=self.report)
+                except Exception as e:
+                    # run() zapisał już status failed - jedno zadanie nie zatrzymuje workera
+                    self.stderr.write(f"Zadanie #{job.pk} przerwane: {e}")
+                    continue
+                self.stdout.write(f"Zadanie #{job.pk} zakończone: {self.format(job.progress)}")
+            if options['watch'] is None:
+                return
+            time.sleep(options['watch'])
+
+    def report(self, job):
+        self.stdout.write(f"  #{job.pk}: {self.format(job.progress)}")
+
+    @staticmethod
+    def format(progress):
+        return ', '.join(f"{name} {count}" for name, count in progress.items()) or 'nic do usunięcia'
@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from invoices.models import Product
+from invoices.storage import is_content_addressed
+
+
+class Command(BaseCommand):
+    help = ("Przenosi obrazy produktów do magazynu adresowanego treścią (identyczne pliki "
+            "zostają jednym plikiem); z --prune usuwa pliki, do których nie odwołuje się żaden produkt.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true')
+        parser.add_argument('--grace', type=float, default=60, metavar='MINUTY',
+                            help="Nie usuwaj plików młodszych niż tyle minut - zapis produktu "
+                                 "mógł jeszcze nie zostać zatwierdzony.")
+
+    def handle(self, *args, **options):
+        names = (Product.objects.exclude(image='').exclude(image__isnull=True)
+                 .values_list('image', flat=True).distinct())
+        moved = 0
+        for name in list(names):
+            if is_content_addressed(name):
+                continue
+            if not default_storage.exists(name):
+                self.stderr.write(f"Brak pliku {name}")
+                continue
+            with default_storage.open(name, 'rb') as f:
+                new_name = default_storage.save(name, f)
+            Product.objects.filter(image=name).update(image=new_name)
+            moved += 1
+            self.stdout.write(f"{name} -> {new_name}")
+        self.stdout.write(f"Przeniesiono {moved} plików.")
+
+        if options['prune']:
+            self.stdout.write(f"Usunięto {self.prune(options['grace'] * 60)} nieużywanych plików.")
+
+    def prune(self, grace):
+        upload_to = Product._meta.get_field('image').upload_to.rstrip('/')
+        root = default_storage.path(upload_to)
+        # plik zapisuje się przed zatwierdzeniem produktu - świeżych nie ruszamy
+        cutoff = time.time() - grace
+        used = set(Product.objects.values_list('image', flat=True))
+        removed = 0
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, default_storage.location).replace(os.sep, '/')
+                if name not in used and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
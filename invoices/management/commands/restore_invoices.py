@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from invoices.archive import restore_invoices
+
+
+class Command(BaseCommand):
+    help = "Przywraca wskazane faktury z archiwum do tabel bieżących."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='+', type=int)
+
+    def handle(self, *args, **options):
+        invoices, items = restore_invoices(options['ids'])
+        self.stdout.write(f"Przywrócono {invoices} faktur i {items} pozycji.")
@@ -0,0 +1,90 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# kod uruchamiany w świeżym procesie dla każdego wariantu startu
+TARGETS = {
+    'wsgi': ['-c', 'import invoice_manager.wsgi'],
+    'asgi': ['-c', 'import invoice_manager.asgi'],
+    'check': ['manage.py', 'check'],
+    # pierwsze żądanie: ładuje URLconf, widoki i (przy /graphql) schemat
+    'first-request': ['-c', (
+        'from wsgiref.util import setup_testing_defaults\n'
+        'from invoice_manager.wsgi import application\n'
+        'environ = {"PATH_INFO": "/invoices/api/products/", "HTTP_HOST": "localhost"}\n'
+        'setup_testing_defaults(environ)\n'
+        'b"".join(application(environ, lambda status, headers: None))\n'
+    )],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Wiersze `python -X importtime` jako (moduł, czas własny µs, czas łączny µs).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(own), int(cumulative)))
+    return rows
+
+
+def by_package(rows):
+    """
+    Łączny czas importu w podziale na pakiety najwyższego poziomu.
+    """
+    totals = {}
+    for name, own, _ in rows:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + own
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def run(target, env, importtime=False):
+    """
+    Czas całego procesu (ze startem interpretera); z importtime=True -
+    zamiast czasu lista importów (sam pomiar importów spowalnia start).
+    """
+    flags = ['-X', 'importtime'] if importtime else []
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable] + flags + TARGETS[target],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode:
+        raise CommandError(f"{target}: {process.stderr.strip().splitlines()[-1]}")
+    return parse_importtime(process.stderr) if importtime else elapsed
+
+
+class Command(BaseCommand):
+    help = ("Mierzy czas startu procesu (WSGI, ASGI, manage.py check, pierwsze żądanie) "
+            "i pokazuje, które importy go zajmują.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', help=f"Warianty: {', '.join(TARGETS)} (domyślnie wszystkie).")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--top', type=int, default=12)
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'invoice_manager.settings'))
+        unknown = set(options['targets']) - set(TARGETS)
+        if unknown:
+            raise CommandError(f"Nieznane warianty: {', '.join(sorted(unknown))}")
+        for target in options['targets'] or list(TARGETS):
+            times = [run(target, env) for _ in range(options['repeat'])]
+            rows = run(target, env, importtime=True)
+            imports = sum(own for _, own, _ in rows) / 1000
+            self.stdout.write(
+                f"{target}: mediana {statistics.median(times) * 1000:.0f} ms "
+                f"(min {min(times) * 1000:.0f} ms), modułów {len(rows)} (importy pod -X importtime: {imports:.0f} ms)"
+            )
+            for package, own in by_package(rows)[:options['top']]:
+                self.stdout.write(f"    {own / 1000:8.1f} ms  {package}")
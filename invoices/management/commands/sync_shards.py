@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from invoices import sharding
+from invoices.models import Invoice, Product, UserShard
+
+
+class Command(BaseCommand):
+    help = ("Kopiuje użytkowników i produkty z 'default' na pozostałe shardy i zapisuje "
+            "przypisania klientów, którzy mają już faktury na którymś shardzie.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for shard in sharding.shard_names():
+            if shard == sharding.DEFAULT_SHARD:
+                continue
+            for model in (User, Product):
+                copied = self.copy(model, shard, batch_size)
+                self.stdout.write(f"{shard}: {copied} x {model._meta.label}")
+
+        assigned = 0
+        for shard in sharding.shard_names():
+            user_ids = Invoice.objects.using(shard).values_list('user', flat=True).distinct().iterator()
+            batch = []
+            for user_id in user_ids:
+                batch.append(UserShard(user_id=user_id, shard=shard))
+                if len(batch) >= batch_size:
+                    assigned += len(UserShard.objects.bulk_create(batch, ignore_conflicts=True))
+                    batch = []
+            assigned += len(UserShard.objects.bulk_create(batch, ignore_conflicts=True))
+        sharding._assigned_shard.cache_clear()
+        self.stdout.write(f"Klienci z przypisanym shardem: {assigned}.")
+
+    def copy(self, model, shard, batch_size):
+        fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+        rows = model._base_manager.using(sharding.DEFAULT_SHARD).order_by('pk')
+        copied = last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return copied
+            model._base_manager.using(shard).bulk_create(
+                batch, update_conflicts=True, unique_fields=['pk'], update_fields=fields,
+            )
+            copied += len(batch)
+            last_pk = batch[-1].pk
@@ -0,0 +1,280 @@
+"""
+Metryki serwera w formacie tekstowym Prometheusa.
+
+Każdy proces zbiera liczniki i histogramy w pamięci, a jeśli ustawiono
+settings.METRICS_DIR, co METRICS_FLUSH_INTERVAL sekund zapisuje je do własnego
+pliku w tym katalogu. Endpoint /metrics sumuje pliki wszystkich procesów,
+więc dane są spójne niezależnie od tego, który worker obsłuży scrape.
+
+Plik zakończonego workera mark_process_dead dolicza do wspólnego
+metrics-dead.json i usuwa - liczniki nie cofają się, a katalog nie rośnie
+z każdym restartem. Wywołuje ją hook child_exit w gunicorn.conf.py.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HELP = {
+    'http_requests_total': ('counter', 'Liczba obsłużonych żądań HTTP.'),
+    'http_request_errors_total': ('counter', 'Liczba żądań zakończonych błędem serwera (5xx).'),
+    'http_request_duration_seconds': ('histogram', 'Czas obsługi żądania w sekundach.'),
+    'db_queries_per_request': ('histogram', 'Liczba zapytań SQL wykonanych w trakcie żądania.'),
+    'cache_requests_total': ('counter', 'Odczyty z cache z podziałem na trafienia i chybienia.'),
+    'invoices_created_total': ('counter', 'Liczba utworzonych faktur według statusu.'),
+    'requests_shed_total': ('counter', 'Żądania odrzucone przez admission control (429/503).'),
+}
+
+
+class Registry:
+    """
+    Rejestr metryk jednego procesu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._buckets = {}
+        self._started = int(time.time() * 1000)
+        self._last_flush = 0.0
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=DEFAULT_BUCKETS):
+        key = self._key(name, labels)
+        with self._lock:
+            self._buckets.setdefault(name, buckets)
+            state = self._histograms.get(key)
+            if state is None:
+                # liczniki kubełków (bez +Inf), suma, liczba obserwacji
+                state = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, dict(labels), list(state[0]), state[1], state[2]]
+                    for (name, labels), state in self._histograms.items()
+                ],
+                'buckets': {name: list(buckets) for name, buckets in self._buckets.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._buckets.clear()
+
+    def _path(self, directory):
+        return os.path.join(directory, f"metrics-{os.getpid()}-{self._started}.json")
+
+    def flush(self, force=False):
+        """
+        Zapisuje stan procesu do METRICS_DIR (atomowo, przez plik tymczasowy).
+        """
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, self._path(directory))
+
+
+registry = Registry()
+
+
+def _merge(snapshots):
+    counters = {}
+    histograms = {}
+    buckets = {}
+    for snap in snapshots:
+        buckets.update({name: tuple(b) for name, b in snap['buckets'].items()})
+        for name, labels, value in snap['counters']:
+            key = Registry._key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total, count in snap['histograms']:
+            key = Registry._key(name, labels)
+            state = histograms.get(key)
+            if state is None or len(state[0]) != len(counts):
+                histograms[key] = [list(counts), total, count]
+            else:
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+    return counters, histograms, buckets
+
+
+DEAD_FILE = 'metrics-dead.json'
+
+
+def _snapshot(counters, histograms, buckets):
+    return {
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, dict(labels), *state] for (name, labels), state in histograms.items()],
+        'buckets': {name: list(b) for name, b in buckets.items()},
+    }
+
+
+def mark_process_dead(pid, directory=None):
+    """
+    Przenosi metryki zakończonego procesu do DEAD_FILE. Wywoływać z jednego
+    procesu (mastera serwera), już po śmierci workera.
+    """
+    directory = directory or getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return
+    prefix = f'metrics-{pid}-'
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith(prefix) and name.endswith('.json')]
+    if not paths:
+        return
+    snapshots = []
+    for path in [os.path.join(directory, DEAD_FILE)] + paths:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(_snapshot(*_merge(snapshots)), f)
+    os.replace(tmp_path, os.path.join(directory, DEAD_FILE))
+    for path in paths:
+        os.remove(path)
+
+
+def collect():
+    """
+    Zwraca zsumowane metryki wszystkich procesów (albo tylko bieżącego,
+    gdy METRICS_DIR nie jest ustawione).
+    """
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return _merge([registry.snapshot()])
+
+    registry.flush(force=True)
+    snapshots = []
+    for filename in os.listdir(directory):
+        if not (filename.startswith('metrics-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # plik właśnie podmieniany albo uszkodzony - pomijamy w tym scrape
+            continue
+    return _merge(snapshots)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Formatuje metryki w tekstowym formacie ekspozycji Prometheusa (0.0.4).
+    """
+    counters, histograms, buckets = collect()
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for (name, labels), state in histograms.items():
+        by_name.setdefault(name, []).append((labels, state))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ('counter', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(buckets.get(name, DEFAULT_BUCKETS), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(float(bound))),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+_OPERATION_NAME = re.compile(r'^[_A-Za-z][_0-9A-Za-z]{0,63}$')
+_seen_operations = set()
+MAX_GRAPHQL_OPERATIONS = 200
+
+
+def graphql_operation_label(name):
+    """
+    Nazwa operacji GraphQL jako etykieta - ograniczona, bo pochodzi od klienta.
+    """
+    if not name or not _OPERATION_NAME.match(name):
+        return 'anonymous'
+    if name not in _seen_operations:
+        if len(_seen_operations) >= MAX_GRAPHQL_OPERATIONS:
+            return 'other'
+        _seen_operations.add(name)
+    return name
+
+
+def record_cache(cache_name, hit):
+    registry.inc('cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+class MeteredLocMemCache(LocMemCache):
+    """
+    LocMemCache zliczający trafienia i chybienia odczytów.
+    """
+    _missing = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._metrics_name = name or 'locmem'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        record_cache(self._metrics_name, value is not self._missing)
+        return default if value is self._missing else value
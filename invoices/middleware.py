@@ -0,0 +1,218 @@
+import json
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.http.request import RawPostDataException
+from django.utils.cache import patch_vary_headers
+
+from invoices import admission, metrics
+
+
+class MetricsMiddleware:
+    """
+    Zbiera liczbę żądań, czasy odpowiedzi, błędy i liczbę zapytań SQL
+    z etykietą nazwy URL (a dla GraphQL - nazwy operacji).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._record(request, status, time.perf_counter() - start, queries[0])
+
+    def _record(self, request, status, duration, query_count):
+        view = self._view_label(request)
+        labels = {'view': view, 'method': request.method}
+        registry = metrics.registry
+        registry.inc('http_requests_total', dict(labels, status=str(status)))
+        if status >= 500:
+            registry.inc('http_request_errors_total', labels)
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('db_queries_per_request', {'view': view}, query_count, metrics.QUERY_COUNT_BUCKETS)
+        registry.flush()
+
+    def _view_label(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        name = match.url_name or match.view_name or 'unnamed'
+        if name == 'graphql':
+            return f'graphql:{metrics.graphql_operation_label(self._operation_name(request))}'
+        return name
+
+    @staticmethod
+    def _operation_name(request):
+        name = request.GET.get('operationName')
+        if name or request.method != 'POST':
+            return name
+        if request.content_type == 'application/json':
+            try:
+                body = json.loads(request.body)
+            except (RawPostDataException, ValueError):
+                return None
+            return body.get('operationName') if isinstance(body, dict) else None
+        return request.POST.get('operationName')
+
+
+def parse_accept_encoding(header):
+    """
+    Zwraca {kodowanie: q} z nagłówka Accept-Encoding.
+    """
+    result = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[coding] = q
+    return result
+
+
+def choose_encoding(header, supported=('gzip', 'deflate')):
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in supported:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Kompresja gzip/deflate wynegocjowana z Accept-Encoding, tylko dla
+    odpowiedzi tekstowych/JSON większych niż COMPRESSION_MIN_SIZE bajtów.
+    Odpowiedzi strumieniowe są kompresowane w locie, kawałek po kawałku.
+
+    HTML domyślnie nie jest kompresowany (BREACH): strony przeglądarkowego
+    API zawierają token CSRF obok danych, na które wpływa atakujący.
+    """
+    WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.level = getattr(settings, 'COMPRESSION_LEVEL', 6)
+        self.types = tuple(getattr(settings, 'COMPRESSION_CONTENT_TYPES', (
+            'text/plain', 'text/css', 'text/csv', 'application/json', 'application/javascript',
+            'application/xml', 'application/graphql-response+json', 'image/svg+xml',
+        )))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.status_code != 200 or response.has_header('Content-Encoding') \
+                or response.has_header('Content-Range'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in self.types:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(response.streaming_content, coding)
+            else:
+                response.streaming_content = self._compress_stream(response.streaming_content, coding)
+            response.headers.pop('Content-Length', None)
+        else:
+            if len(response.content) < self.min_size:
+                return response
+            compressed = self._compressor(coding)
+            content = compressed.compress(response.content) + compressed.flush()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
+
+    def _compressor(self, coding):
+        return zlib.compressobj(self.level, zlib.DEFLATED, self.WBITS[coding])
+
+    def _compress_stream(self, chunks, coding):
+        compressor = self._compressor(coding)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    async def _compress_async(self, chunks, coding):
+        compressor = self._compressor(coding)
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limity tempa i współbieżności per klient oraz odrzucanie żądań
+    o niskim priorytecie przy przeciążeniu (konfiguracja: ADMISSION_CONTROL).
+    Musi stać za AuthenticationMiddleware, żeby rozpoznać zalogowanego użytkownika.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = admission.get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.controller = admission.AdmissionController(config)
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            release = getattr(request, '_admission_release', None)
+            if release is not None:
+                release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        # BatchView przepuszcza przez kontroler również swoje podżądania
+        request._admission_controller = self.controller
+        try:
+            request._admission_release = self.controller.admit(request, view_name)
+        except admission.Rejected as e:
+            metrics.registry.inc('requests_shed_total', {'view': view_name, 'reason': e.reason})
+            response = JsonResponse({'detail': e.detail}, status=e.status)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        return None
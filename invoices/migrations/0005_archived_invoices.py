@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-19 12:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField(db_index=True)),
+                ('status', models.CharField(choices=[('NEW', 'New'), ('SENT', 'Sent'), ('PAID', 'Paid')], max_length=4)),
+                ('archived_at', models.DateTimeField()),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_archived_invoices', to=settings.AUTH_USER_MODEL)),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='updated_archived_invoices', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Faktura archiwalna',
+                'verbose_name_plural': 'Faktury archiwalne',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='invoices.archivedinvoice')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_items', to='invoices.product')),
+            ],
+            options={
+                'verbose_name': 'Pozycja archiwalna',
+                'verbose_name_plural': 'Pozycje archiwalne',
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
 
 
@@ -36,6 +37,58 @@ class Product(models.Model):
     class Meta:
         verbose_name = "Produkt"
         verbose_name_plural = "Produkty"
+        indexes = [
+            models.Index(fields=['category'], name='product_category_idx'),
+        ]
+
+
+class ShardedModelQuerySet(models.QuerySet):
+    """
+    QuerySet modeli rozłożonych na shardy według klienta (zob. invoices.sharding).
+    """
+
+    def for_user(self, user):
+        from invoices.sharding import shard_for
+        return self.using(shard_for(user))
+
+    def across_shards(self):
+        from invoices.sharding import sharded
+        return sharded(self)
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        # bez .using() baza wynika z klucza shardu obiektu, nie z samego modelu
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from invoices import changes
+        from invoices.sharding import assign_ids, is_enabled, shard_of
+        objs = list(objs)
+        assign_ids(self.model, objs)
+        if self._db is not None or not is_enabled():
+            objs = super().bulk_create(objs, *args, **kwargs)
+        else:
+            by_shard = {}
+            for obj in objs:
+                by_shard.setdefault(shard_of(obj), []).append(obj)
+            for shard, group in by_shard.items():
+                models.QuerySet.bulk_create(self.using(shard), group, *args, **kwargs)
+        # bulk_create nie wysyła sygnałów - wpisy kanału zmian zapisujemy tutaj
+        changes.record_objects(objs, 'create')
+        return objs
+
+
+class LiveInvoiceManager(models.Manager.from_queryset(ShardedModelQuerySet)):
+    """
+    Faktury bez usuniętych miękko (deleted_at) - te czekają na purge_deletions.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Invoice(models.Model):
@@ -50,6 +103,11 @@ class Invoice(models.Model):
     products = models.ManyToManyField(Product, through='InvoiceItem')
     created_by = models.ForeignKey(User, related_name='created_invoices', on_delete=models.SET_NULL, null=True, blank=True)
     updated_by = models.ForeignKey(User, related_name='updated_invoices', on_delete=models.SET_NULL, null=True, blank=True)
+    # usunięta miękko (zob. invoices.deletion) - niewidoczna przez Invoice.objects
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveInvoiceManager()
+    all_objects = ShardedModelQuerySet.as_manager()
 
     def __str__(self):
         return f"Faktura #{self.id} - {self.user.username} - {self.status}"
@@ -57,6 +115,10 @@ class Invoice(models.Model):
     class Meta:
         verbose_name = "Faktura"
         verbose_name_plural = "Faktury"
+        indexes = [
+            models.Index(fields=['status', 'date'], name='invoice_status_date_idx'),
+            models.Index(fields=['date'], name='invoice_date_idx'),
+        ]
 
 
 class InvoiceItem(models.Model):
@@ -65,9 +127,185 @@ class InvoiceItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = ShardedModelQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.product.name} x{self.quantity} dla Faktury #{self.invoice.id}"
 
     class Meta:
         verbose_name = "Pozycja"
-        verbose_name_plural = "Pozycje"
\ No newline at end of file
+        verbose_name_plural = "Pozycje"
+
+class IdempotencyKey(models.Model):
+    """
+    Klucz Idempotency-Key z zapisaną odpowiedzią - ponowienie żądania
+    z tym samym kluczem zwraca zapisaną odpowiedź zamiast tworzyć duplikat.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.scope}: {self.key}"
+
+    class Meta:
+        verbose_name = "Klucz idempotencji"
+        verbose_name_plural = "Klucze idempotencji"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+
+class ArchivedInvoice(models.Model):
+    """
+    Zapłacona faktura przeniesiona z tabeli Invoice (zob. invoices.archive).
+    Zachowuje oryginalne id, więc adresy i odwołania klientów pozostają ważne.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='archived_invoices', on_delete=models.CASCADE)
+    date = models.DateField(db_index=True)
+    status = models.CharField(max_length=4, choices=Invoice.STATUS_CHOICES)
+    created_by = models.ForeignKey(User, related_name='created_archived_invoices', on_delete=models.SET_NULL, null=True, blank=True)
+    updated_by = models.ForeignKey(User, related_name='updated_archived_invoices', on_delete=models.SET_NULL, null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    objects = ShardedModelQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Faktura archiwalna #{self.id} - {self.status}"
+
+    class Meta:
+        verbose_name = "Faktura archiwalna"
+        verbose_name_plural = "Faktury archiwalne"
+
+
+class ArchivedInvoiceItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='archived_items', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = ShardedModelQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Pozycja #{self.id} faktury archiwalnej #{self.invoice_id}"
+
+    class Meta:
+        verbose_name = "Pozycja archiwalna"
+        verbose_name_plural = "Pozycje archiwalne"
+
+
+class UserShard(models.Model):
+    """
+    Trwałe przypisanie klienta (Invoice.user) do bazy z jego fakturami
+    (zob. invoices.sharding). Trzymane w bazie 'default'.
+    """
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, db_constraint=False)
+    shard = models.CharField(max_length=50)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.shard}"
+
+    class Meta:
+        verbose_name = "Przypisanie do shardu"
+        verbose_name_plural = "Przypisania do shardów"
+
+
+class ShardSequence(models.Model):
+    """
+    Globalny licznik id faktur i pozycji przy wielu shardach, żeby id
+    pozostały unikalne w całym systemie (adresy /invoices/<id>/).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Wpis dziennika zmian produktów, faktur i pozycji (zob. invoices.changes).
+    Rosnące id jest kursorem kanału zmian. Trzymany w bazie 'default'.
+    """
+    ACTION_CHOICES = [
+        ('create', 'Utworzenie'),
+        ('update', 'Zmiana'),
+        ('delete', 'Usunięcie'),
+        ('archive', 'Archiwizacja'),
+        ('restore', 'Przywrócenie'),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTION_CHOICES)
+    # faktura pozycji (dla wpisów 'invoiceitem')
+    invoice_id = models.BigIntegerField(null=True, blank=True)
+    # właściciel faktury (Invoice.created_by) - zawężenie kanału dla nie-adminów
+    owner = models.ForeignKey(User, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_id}"
+
+    class Meta:
+        verbose_name = "Wpis dziennika zmian"
+        verbose_name_plural = "Dziennik zmian"
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='changelog_owner_idx'),
+            models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'),
+        ]
+
+
+class ChangeLogCompaction(models.Model):
+    """
+    Ślad kompaktowania dziennika: wpisy usunięć o id <= horizon zostały
+    skasowane, więc klient z kursorem sprzed horyzontu musi zsynchronizować
+    się od nowa.
+    """
+    horizon = models.BigIntegerField()
+    compacted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.compacted_at}: {self.horizon}"
+
+
+class DeletionJob(models.Model):
+    """
+    Usuwanie w tle (zob. invoices.deletion): klienta z całą historią albo
+    miękko usuniętych faktur. progress to liczniki usuniętych wierszy.
+    """
+    KIND_CHOICES = [
+        ('user', 'Użytkownik'),
+        ('invoices', 'Faktury'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Oczekuje'),
+        ('running', 'W toku'),
+        ('done', 'Zakończone'),
+        ('failed', 'Błąd'),
+    ]
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False,
+                             null=True, blank=True)
+    requested_by = models.ForeignKey(User, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False,
+                                     null=True, blank=True)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='pending', db_index=True)
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} ({self.status})"
+
+    class Meta:
+        verbose_name = "Usuwanie w tle"
+        verbose_name_plural = "Usuwanie w tle"
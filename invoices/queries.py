@@ -0,0 +1,94 @@
+"""
+Zapytania łączące modele globalne (User, Product) z fakturami, wspólne
+dla REST API i GraphQL. Przy jednym shardzie to te same pojedyncze
+zapytania SQL co wcześniej; przy wielu - faktury są odpytywane na każdym
+shardzie, a wynik zawęża zapytanie w bazie 'default'.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+
+from invoices.models import Invoice, InvoiceItem, Product
+from invoices.sharding import is_enabled, shard_names, shard_values, sharded
+
+
+def live_items(queryset=None):
+    """
+    Pozycje bez faktur usuniętych miękko (czekających na purge_deletions).
+    """
+    queryset = InvoiceItem.objects.all() if queryset is None else queryset
+    return queryset.filter(invoice__deleted_at__isnull=True)
+
+
+def filter_products(queryset, category=None, name=None):
+    if category:
+        queryset = queryset.filter(category=category)
+    if name:
+        queryset = queryset.filter(name__icontains=name)
+    return queryset
+
+
+def users_with_invoices(status=None):
+    invoices = Invoice.objects.all()
+    if status is not None:
+        invoices = invoices.filter(status=status)
+    if not is_enabled():
+        lookup = {'invoice__status': status} if status is not None else {'invoice__isnull': False}
+        return User.objects.filter(invoice__deleted_at__isnull=True, **lookup).distinct()
+    return User.objects.filter(pk__in=shard_values(invoices, 'user'))
+
+
+def products_in_invoices():
+    return Product.objects.filter(id__in=shard_values(live_items(), 'product')).distinct()
+
+
+def products_not_in_invoices():
+    return Product.objects.exclude(id__in=shard_values(live_items(), 'product'))
+
+
+def products_by_user_invoices(user_id):
+    if not is_enabled():
+        return Product.objects.filter(invoiceitem__invoice__user_id=user_id,
+                                      invoiceitem__invoice__deleted_at__isnull=True).distinct()
+    items = live_items(InvoiceItem.objects.for_user(user_id)).filter(invoice__user_id=user_id)
+    return Product.objects.filter(pk__in=list(items.values_list('product', flat=True).distinct()))
+
+
+def popular_products():
+    """
+    Produkty występujące w więcej niż jednej pozycji faktury, od najczęstszych.
+    """
+    if not is_enabled():
+        return Product.objects.annotate(
+            invoice_count=Count('invoiceitem', filter=Q(invoiceitem__invoice__deleted_at__isnull=True))
+        ).filter(invoice_count__gt=1).order_by('-invoice_count')
+
+    counts = Counter()
+    for shard in shard_names():
+        rows = live_items(InvoiceItem.objects.using(shard)).values('product').annotate(n=Count('id')).values_list('product', 'n')
+        counts.update(dict(rows))
+    popular = {product: n for product, n in counts.items() if n > 1}
+    return Product.objects.filter(pk__in=list(popular)).annotate(
+        invoice_count=Case(
+            *[When(pk=product, then=Value(n)) for product, n in popular.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+    ).order_by('-invoice_count')
+
+
+def invoice_basic_info():
+    return sharded(Invoice.objects.annotate(total_items=Count('items')))
+
+
+def invoice_totals():
+    """
+    Liczba faktur i suma ich wartości (po wszystkich shardach).
+    """
+    invoices = sharded(Invoice.objects.all())
+    total_value = sharded(Invoice.objects.annotate(
+        total_value=Sum(
+            ExpressionWrapper(F('items__quantity') * F('items__price'), output_field=DecimalField())
+        )
+    )).aggregate(Sum('total_value'))['total_value__sum'] or 0  # Domyślna wartość 0, jeśli brak faktur
+    return invoices.count(), total_value
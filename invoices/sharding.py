@@ -0,0 +1,452 @@
+"""
+Sharding faktur po kliencie (Invoice.user).
+
+Faktury i ich pozycje (także archiwalne) każdego klienta leżą w jednej
+z baz wymienionych w settings.INVOICE_SHARDS. Przypisanie klient -> shard
+jest trwałe (tabela UserShard w bazie 'default'): nowy klient trafia na
+shard wyznaczony skrótem id, a dodanie shardów nie przenosi istniejących.
+
+User i Product są globalne - zapisywane w 'default' i replikowane na
+pozostałe shardy (zob. invoices.signals), żeby klucze obce faktur
+i pozycji miały swoje wiersze w tej samej bazie.
+
+Routing:
+- zapis faktury / pozycji - ShardRouter, na podstawie Invoice.user;
+- zapytania jednego klienta - Invoice.objects.for_user(user) albo
+  relacje od obiektu (user.invoice_set, invoice.items);
+- zapytania po wszystkich klientach - sharded(queryset) /
+  Invoice.objects.across_shards(): scatter-gather z łączeniem wyników
+  według order_by i składaniem agregatów.
+
+Id faktur i pozycji przy wielu shardach pochodzą z globalnego licznika
+(ShardSequence), pobieranego blokami po ID_BLOCK_SIZE.
+
+Przy jednym shardzie (domyślnie) wszystko sprowadza się do zwykłych
+zapytań do 'default'. Nowy shard: dopisać bazę do DATABASES
+i INVOICE_SHARDS, `migrate --database <shard>` i `sync_shards`.
+"""
+import functools
+import heapq
+import itertools
+import threading
+import zlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MultipleObjectsReturned
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FileField, Max, Min, QuerySet, Sum
+from django.db.models.query import FlatValuesListIterable, ValuesIterable, ValuesListIterable
+
+DEFAULT_SHARD = 'default'
+SHARDED_MODELS = ('invoice', 'invoiceitem', 'archivedinvoice', 'archivedinvoiceitem')
+ID_BLOCK_SIZE = 100
+
+
+def shard_names():
+    return list(getattr(settings, 'INVOICE_SHARDS', [DEFAULT_SHARD]))
+
+
+def is_enabled():
+    return len(shard_names()) > 1
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'invoices' and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for(user):
+    """
+    Baza z fakturami klienta (obiekt User albo id).
+    """
+    names = shard_names()
+    if len(names) == 1:
+        return names[0]
+    user_id = getattr(user, 'pk', user)
+    if user_id is None:
+        return DEFAULT_SHARD
+    return _assigned_shard(tuple(names), int(user_id))
+
+
+@functools.lru_cache(maxsize=100000)
+def _assigned_shard(names, user_id):
+    from invoices.models import UserShard
+
+    existing = UserShard.objects.using(DEFAULT_SHARD).filter(user_id=user_id).values_list('shard', flat=True)
+    shard = existing.first()
+    if shard is not None:
+        return shard
+    shard = names[zlib.crc32(str(user_id).encode()) % len(names)]
+    try:
+        with transaction.atomic(using=DEFAULT_SHARD):
+            UserShard.objects.using(DEFAULT_SHARD).create(user_id=user_id, shard=shard)
+    except IntegrityError:  # równoległe przypisanie - wygrywa zapisane
+        return existing.first()
+    return shard
+
+
+def shard_of(instance):
+    """
+    Shard obiektu modelu shardowanego wyliczony z klucza (nie z _state.db).
+    """
+    if hasattr(instance, 'user_id'):
+        return shard_for(instance.user_id)
+    parent = instance.invoice
+    if parent._state.db and not parent._state.adding:
+        return parent._state.db
+    return shard_of(parent)
+
+
+class ShardRouter:
+    """
+    Router baz: modele globalne zawsze w 'default', faktury i pozycje
+    w shardzie klienta.
+    """
+
+    def _route(self, model, instance=None):
+        if not is_sharded(model):
+            return DEFAULT_SHARD
+        if instance is None:
+            return None
+        if is_sharded(instance.__class__):  # __class__, bo request.user to SimpleLazyObject
+            if instance._state.db and not instance._state.adding:
+                return instance._state.db
+            return shard_of(instance)
+        if isinstance(instance, User):  # user.invoice_set itp.
+            return shard_for(instance)
+        return None
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if not is_sharded(model) and instance is not None and is_sharded(instance.__class__):
+            # invoice.products, item.product: złączenie z pozycjami musi iść
+            # w shardzie faktury, a produkty i użytkownicy są tam replikowani
+            return self._route(instance.__class__, instance)
+        return self._route(model, instance)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # User i Product są replikowane na każdy shard
+        return True
+
+
+# --- globalne id ---
+
+_id_blocks = {}
+_id_lock = threading.Lock()
+
+
+def _archive_model(model):
+    from invoices.models import ArchivedInvoice, ArchivedInvoiceItem, Invoice, InvoiceItem
+    return {Invoice: ArchivedInvoice, InvoiceItem: ArchivedInvoiceItem}.get(model)
+
+
+def _current_max_id(model):
+    models = [model] + [m for m in [_archive_model(model)] if m is not None]
+    return max(
+        m._base_manager.using(shard).aggregate(value=Max('pk'))['value'] or 0
+        for m in models for shard in shard_names()
+    )
+
+
+def allocate_ids(model, count):
+    """
+    Rezerwuje w globalnym liczniku `count` kolejnych id; zwraca pierwsze.
+    """
+    from invoices.models import ShardSequence
+
+    name = model._meta.label_lower
+    sequences = ShardSequence.objects.using(DEFAULT_SHARD)
+    for _ in range(2):
+        with transaction.atomic(using=DEFAULT_SHARD):
+            if sequences.filter(name=name).update(value=F('value') + count):
+                return sequences.get(name=name).value - count + 1
+            try:
+                with transaction.atomic(using=DEFAULT_SHARD):
+                    start = _current_max_id(model) + 1
+                    sequences.create(name=name, value=start + count - 1)
+                return start
+            except IntegrityError:
+                continue
+    raise IntegrityError(f"Nie udało się zarezerwować id dla {name}.")
+
+
+def next_id(model):
+    with _id_lock:
+        next_value, end = _id_blocks.get(model, (1, 0))
+        if next_value > end:
+            next_value = allocate_ids(model, ID_BLOCK_SIZE)
+            end = next_value + ID_BLOCK_SIZE - 1
+        _id_blocks[model] = (next_value + 1, end)
+        return next_value
+
+
+def assign_ids(model, objs):
+    """
+    Nadaje globalne id nowym obiektom modelu shardowanego (save i bulk_create).
+    """
+    if not is_enabled() or _archive_model(model) is None:
+        return
+    missing = [obj for obj in objs if obj.pk is None]
+    if len(missing) > ID_BLOCK_SIZE:
+        start = allocate_ids(model, len(missing))
+        for offset, obj in enumerate(missing):
+            obj.pk = start + offset
+        return
+    for obj in missing:
+        obj.pk = next_id(model)
+
+
+# --- replikacja modeli globalnych ---
+
+def _row(instance):
+    values = {}
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        if isinstance(field, FileField):
+            value = value.name if value else ''
+        values[field.attname] = value
+    return values
+
+
+def replicate(instance):
+    """
+    Kopiuje wiersz modelu globalnego z 'default' na pozostałe shardy.
+    """
+    model = type(instance)
+    values = _row(instance)
+    pk_name = model._meta.pk.attname
+    for shard in shard_names():
+        if shard == DEFAULT_SHARD:
+            continue
+        rows = model._base_manager.using(shard)
+        updated = rows.filter(pk=values[pk_name]).update(
+            **{name: value for name, value in values.items() if name != pk_name}
+        )
+        if not updated:
+            rows.bulk_create([model(**values)])
+
+
+def replicate_many(model, instances):
+    """
+    Jak replicate, dla nowych wierszy zapisanych przez bulk_create (bez sygnałów).
+    """
+    for shard in shard_names():
+        if shard != DEFAULT_SHARD:
+            model._base_manager.using(shard).bulk_create([model(**_row(instance)) for instance in instances])
+
+
+def replicate_delete(model, pk):
+    for shard in shard_names():
+        if shard != DEFAULT_SHARD:
+            model._base_manager.using(shard).filter(pk=pk).delete()
+
+
+# --- scatter-gather ---
+
+AGGREGATE_COMBINERS = (
+    (Count, sum),
+    (Sum, sum),
+    (Max, max),
+    (Min, min),
+)
+
+
+class ShardedQuerySet:
+    """
+    To samo zapytanie na wszystkich shardach. Metody zwracające QuerySet
+    (filter, annotate, order_by, prefetch_related...) dają kolejny
+    ShardedQuerySet; count/exists/aggregate/update/delete składają wyniki
+    shardów, a krojenie i iteracja łączą posortowane strumienie shardów
+    (heapq.merge) według order_by - każdy shard oddaje najwyżej `stop`
+    wierszy, więc głęboka paginacja kosztuje shardy * offset.
+    """
+
+    def __init__(self, queryset, shards=None):
+        self.queryset = queryset
+        self.shards = list(shards or shard_names())
+        self.model = queryset.model
+
+    def __getattr__(self, name):
+        attribute = getattr(self.queryset, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def method(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if not isinstance(result, QuerySet):
+                raise TypeError(f"{name}() nie jest obsługiwane dla zapytań po wszystkich shardach.")
+            return ShardedQuerySet(result, self.shards)
+        return method
+
+    def __repr__(self):
+        return f"<ShardedQuerySet {self.shards} {self.queryset.query}>"
+
+    @property
+    def ordered(self):
+        # bez order_by wyniki i tak są łączone po pk
+        return True
+
+    def per_shard(self):
+        return [self.queryset.using(shard) for shard in self.shards]
+
+    def all(self):
+        return ShardedQuerySet(self.queryset.all(), self.shards)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.per_shard())
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.per_shard())
+
+    def aggregate(self, *args, **kwargs):
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        combiners = {}
+        for alias, aggregate in kwargs.items():
+            if getattr(aggregate, 'distinct', False):
+                raise TypeError(f"Agregatu DISTINCT ({alias}) nie da się złożyć z wyników shardów.")
+            combiners[alias] = next(
+                (combine for kind, combine in AGGREGATE_COMBINERS if isinstance(aggregate, kind)), None
+            )
+            if combiners[alias] is None:
+                raise TypeError(f"Agregatu {type(aggregate).__name__} nie da się złożyć z wyników shardów.")
+        results = [queryset.aggregate(**kwargs) for queryset in self.per_shard()]
+        merged = {}
+        for alias, combine in combiners.items():
+            values = [result[alias] for result in results if result[alias] is not None]
+            merged[alias] = combine(values) if values else results[0][alias]
+        return merged
+
+    def update(self, **kwargs):
+        updated = 0
+        for queryset in self.per_shard():
+            with transaction.atomic(using=queryset.db):
+                updated += queryset.update(**kwargs)
+        return updated
+
+    def delete(self):
+        deleted, per_model = 0, {}
+        for queryset in self.per_shard():
+            count, counts = queryset.delete()
+            deleted += count
+            for label, value in counts.items():
+                per_model[label] = per_model.get(label, 0) + value
+        return deleted, per_model
+
+    def get(self, *args, **kwargs):
+        found = []
+        for queryset in self.per_shard():
+            found += list(queryset.filter(*args, **kwargs)[:2])
+            if len(found) > 1:
+                raise MultipleObjectsReturned(f"get() zwróciło więcej niż jeden obiekt {self.model.__name__}.")
+        if not found:
+            raise self.model.DoesNotExist(f"{self.model.__name__} nie istnieje.")
+        return found[0]
+
+    def first(self):
+        result = self[0:1]
+        return result[0] if result else None
+
+    def ordering(self):
+        query = self.queryset.query
+        if query.order_by:
+            return list(query.order_by)
+        if query.default_ordering and self.model._meta.ordering:
+            return list(self.model._meta.ordering)
+        return ['pk']
+
+    def _getter(self, name):
+        iterable = self.queryset._iterable_class
+        if iterable is ValuesIterable:
+            return lambda row: row[name]
+        if iterable in (ValuesListIterable, FlatValuesListIterable):
+            fields = list(self.queryset._fields or [])
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            if name not in fields:
+                raise TypeError(f"Sortowanie po {name} wymaga tej kolumny w values_list().")
+            if iterable is FlatValuesListIterable:
+                return lambda row: row
+            index = fields.index(name)
+            return lambda row: row[index]
+        path = name.split('__')
+        return lambda obj: functools.reduce(lambda value, attr: getattr(value, attr, None), path, obj)
+
+    def sort_key(self):
+        fields = []
+        for name in self.ordering():
+            if not isinstance(name, str) or name == '?':
+                raise TypeError("Łączenie wyników shardów wymaga sortowania po nazwach pól.")
+            fields.append((self._getter(name.lstrip('-')), name.startswith('-')))
+
+        def compare(a, b):
+            for getter, descending in fields:
+                x, y = getter(a), getter(b)
+                if x == y:
+                    continue
+                if x is None:
+                    result = -1
+                elif y is None:
+                    result = 1
+                else:
+                    result = -1 if x < y else 1
+                return -result if descending else result
+            return 0
+        return functools.cmp_to_key(compare)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            result = self[key:key + 1]
+            if not result:
+                raise IndexError(key)
+            return result[0]
+        start = key.start or 0
+        stop = key.stop
+        querysets = self.per_shard()
+        if not self.queryset.ordered:
+            querysets = [queryset.order_by('pk') for queryset in querysets]
+        streams = [iter(queryset if stop is None else queryset[:stop]) for queryset in querysets]
+        return list(itertools.islice(heapq.merge(*streams, key=self.sort_key()), start, stop))
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.exists()
+
+
+def sharded(queryset):
+    """
+    Zapytanie po wszystkich shardach; przy jednym shardzie - bez zmian.
+    """
+    if isinstance(queryset, ShardedQuerySet) or not is_enabled() or not is_sharded(queryset.model):
+        return queryset
+    return ShardedQuerySet(queryset)
+
+
+def per_shard(queryset):
+    if isinstance(queryset, ShardedQuerySet):
+        return queryset.per_shard()
+    return [queryset]
+
+
+def shard_values(queryset, field):
+    """
+    Wartości pola z zapytania po wszystkich shardach, do użycia w
+    filter(x__in=...) na modelu z innej bazy. Przy jednym shardzie zwraca
+    podzapytanie, więc całość nadal jest jednym zapytaniem SQL.
+    """
+    if not is_enabled():
+        return queryset.values(field)
+    values = set()
+    for shard in shard_names():
+        values.update(queryset.using(shard).values_list(field, flat=True).distinct())
+    values.discard(None)
+    return list(values)
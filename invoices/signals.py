@@ -1,9 +1,60 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import ClientProfile
+from . import changes, events, sharding
+from .metrics import registry
+from .models import ClientProfile, Invoice, InvoiceItem, Product
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        ClientProfile.objects.create(user=instance)
\ No newline at end of file
+        ClientProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Invoice)
+def count_created_invoice(sender, instance, created, **kwargs):
+    if created:
+        registry.inc('invoices_created_total', {'status': instance.status})
+
+
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=InvoiceItem)
+def assign_global_id(sender, instance, **kwargs):
+    if instance.pk is None:
+        sharding.assign_ids(sender, [instance])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Product)
+def replicate_to_shards(sender, instance, using, **kwargs):
+    if using == sharding.DEFAULT_SHARD and sharding.is_enabled():
+        sharding.replicate(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Product)
+def replicate_delete_to_shards(sender, instance, using, **kwargs):
+    if using == sharding.DEFAULT_SHARD and sharding.is_enabled():
+        sharding.replicate_delete(sender, instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=InvoiceItem)
+def record_change(sender, instance, created, raw, using, **kwargs):
+    # kopie produktów na shardach (replicate) nie są osobnymi zmianami
+    if not raw and (using == sharding.DEFAULT_SHARD or sharding.is_sharded(sender)):
+        changes.record(instance, 'create' if created else 'update')
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=InvoiceItem)
+def record_deletion(sender, instance, using, **kwargs):
+    if using == sharding.DEFAULT_SHARD or sharding.is_sharded(sender):
+        changes.record(instance, 'delete')
+
+
+@receiver(changes.entries_recorded)
+def publish_invoice_events(sender, entries, **kwargs):
+    events.notify(entries)
@@ -0,0 +1,84 @@
+"""
+Magazyn plików adresowany treścią.
+
+Plik trafia pod nazwę wyliczoną ze skrótu SHA-256 treści
+(np. produkty/3f/3fa4...c2.webp). Skrót liczymy w trakcie kopiowania
+strumienia do pliku tymczasowego, więc duży upload nie jest trzymany
+w pamięci. Jeśli plik o tym skrócie już istnieje, tymczasowy jest usuwany
+i model dostaje nazwę istniejącego - ten sam obraz zapisany wiele razy
+zajmuje miejsce raz. Treść pod daną nazwą nigdy się nie zmienia, więc
+adresy można cache'ować bez końca (zob. invoices.views.media_view).
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.move import file_move_safe
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})(?:\.[\w]+)?$')
+
+
+def is_content_addressed(name):
+    return HASH_NAME_RE.search(name) is not None
+
+
+def content_hash(name):
+    match = HASH_NAME_RE.search(name)
+    return match.group(1) if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage, który zapisuje pliki pod nazwą ze skrótu treści
+    i nie duplikuje identycznych plików.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # docelowa nazwa powstaje dopiero w _save, po policzeniu skrótu
+        return name
+
+    def hashed_name(self, name, digest):
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        temp_dir = self.path('.tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                if hasattr(content, 'seek') and content.seekable():
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+
+            final_name = self.hashed_name(name, digest.hexdigest())
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                os.remove(temp_path)
+                return final_name
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            file_move_safe(temp_path, final_path, allow_overwrite=True)
+            return final_name
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def delete(self, name):
+        # ten sam plik może wskazywać wiele rekordów - nie usuwamy go przy
+        # podmianie obrazu jednego z nich (sprzątanie: rehash_media --prune)
+        if not is_content_addressed(name):
+            super().delete(name)
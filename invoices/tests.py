@@ -1,12 +1,30 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
 from .models import ClientProfile, Product, Invoice, InvoiceItem
+from datetime import date, timedelta
 from decimal import Decimal
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+from unittest import mock, skipUnless
+
+from . import metrics
 
 
 class ModelTests(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         self.user = User.objects.create_user(username="jan", password="haslo")
 
@@ -60,6 +78,8 @@ class ModelTests(TestCase):
 
 # testy API
 class InvoiceAPITestCase(APITestCase):
+    databases = '__all__'
+
     def setUp(self):
         self.user1 = User.objects.create_user(username='tom', password='password123')
         self.user2 = User.objects.create_user(username='bob', password='password123')
@@ -92,8 +112,8 @@ class InvoiceAPITestCase(APITestCase):
         }
         response = self.client.post('/invoices/api/invoices/', payload, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Invoice.objects.count(), 1)
-        self.assertEqual(InvoiceItem.objects.count(), 1)
+        self.assertEqual(Invoice.objects.across_shards().count(), 1)
+        self.assertEqual(InvoiceItem.objects.across_shards().count(), 1)
 
     def test_retrieve_own_invoice(self):
         invoice = Invoice.objects.create(user=self.user1, status="NEW", created_by=self.user1)
@@ -110,4 +130,1310 @@ class InvoiceAPITestCase(APITestCase):
         self.client.login(username='bob', password='password123')
 
         response = self.client.get(f'/invoices/api/invoices/{invoice.id}/')
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class MetricsTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='ala', password='password123')
+        self.client.login(username='ala', password='password123')
+
+    def test_request_metrics_labelled_by_url_name(self):
+        self.client.get('/invoices/api/invoices/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="invoice-list-create"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",view="invoice-list-create",le="+Inf"} 1', body)
+        self.assertIn('db_queries_per_request_count{view="invoice-list-create"} 1', body)
+
+    def test_graphql_operation_name_label(self):
+        self.client.post('/graphql', {'query': 'query Produkty { allProducts { edges { node { id } } } }', 'operationName': 'Produkty'},
+                         format='json')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('view="graphql:Produkty"', body)
+
+    def test_invoices_created_by_status(self):
+        Invoice.objects.create(user=self.user, status='SENT', created_by=self.user)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('invoices_created_total{status="SENT"} 1', body)
+
+    def test_aggregates_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            other = metrics.Registry()
+            other._started = 0
+            other.inc('http_requests_total', {'view': 'x', 'method': 'GET', 'status': '200'}, 2)
+            other.flush(force=True)
+            metrics.registry.inc('http_requests_total', {'view': 'x', 'method': 'GET', 'status': '200'}, 3)
+            self.assertIn('http_requests_total{method="GET",status="200",view="x"} 5', metrics.render())
+
+    def test_dead_worker_files_are_folded(self):
+        labels = {'view': 'x', 'method': 'GET', 'status': '200'}
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            for pid in (111, 222):
+                worker = metrics.Registry()
+                worker.inc('http_requests_total', labels, pid)
+                worker.observe('http_request_duration_seconds', {'view': 'x', 'method': 'GET'}, 0.2)
+                with open(os.path.join(directory, f'metrics-{pid}-0.json'), 'w') as f:
+                    json.dump(worker.snapshot(), f)
+                metrics.mark_process_dead(pid)
+            metrics.mark_process_dead(333)  # brak pliku - nic do zrobienia
+
+            body = metrics.render()
+            self.assertIn('http_requests_total{method="GET",status="200",view="x"} 333', body)
+            self.assertIn('http_request_duration_seconds_count{method="GET",view="x"} 2', body)
+            self.assertEqual(sorted(name for name in os.listdir(directory) if not name.startswith(f'metrics-{os.getpid()}-')),
+                             [metrics.DEAD_FILE])
+
+    def test_metrics_access(self):
+        url = '/metrics'
+        with self.settings(METRICS_ALLOWED_NETWORKS=[], METRICS_TOKEN='sekret'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer zly').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer sekret').status_code, 200)
+        with self.settings(METRICS_ALLOWED_NETWORKS=['10.0.0.0/8'], METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code, 403)
+            self.user.is_staff = True
+            self.user.save()
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code, 200)
+
+
+class LeanListTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.login(username='admin', password='password123')
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("2000.5"), category="ELEC",
+                                             image="produkty/monitor.webp", created_by=self.admin)
+        self.book = Product.objects.create(name="Książka", price=50, category="BOOK")
+        for status_ in ("NEW", "PAID", "SENT"):
+            invoice = Invoice.objects.create(user=self.admin, status=status_, created_by=self.admin)
+            InvoiceItem.objects.create(invoice=invoice, product=self.laptop, quantity=3, price=Decimal("1999.99"))
+            InvoiceItem.objects.create(invoice=invoice, product=self.book, quantity=1, price=50)
+        Invoice.objects.create(user=self.admin, status="NEW", created_by=self.admin)
+
+    def assertSameResponse(self, url):
+        from .api import lean
+        with mock.patch.object(lean.LeanListMixin, 'lean_list', False):
+            expected = self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_invoice_list_identical(self):
+        from .api.lean import lean_query
+        from .api.serializers import InvoiceSerializer, ProductSerializer
+        self.assertIsNotNone(lean_query(InvoiceSerializer, Invoice.objects.all()))
+        self.assertIsNotNone(lean_query(ProductSerializer, Product.objects.all()))
+        self.assertSameResponse('/invoices/api/invoices/')
+        self.assertSameResponse('/invoices/api/invoices/?page=2')
+
+    def test_product_lists_identical(self):
+        self.assertSameResponse('/invoices/api/products/?ordering=-price')
+        self.assertSameResponse('/invoices/api/products/popular/')
+        self.assertSameResponse('/invoices/api/users/')
+        self.assertSameResponse('/invoices/api/invoices-simple/')
+
+    def test_unsupported_serializer_falls_back(self):
+        from .api.lean import lean_query
+        from .api.serializers import UserWithInvoices
+        self.assertIsNone(lean_query(UserWithInvoices, User.objects.all()))
+        self.assertSameResponse('/invoices/api/users-with-invoices/')
+
+    def test_decimal_options_match_serializer(self):
+        from rest_framework import serializers
+        from .api.lean import lean_query
+
+        class NormalizedPrice(serializers.ModelSerializer):
+            price = serializers.DecimalField(max_digits=10, decimal_places=2, normalize_output=True)
+
+            class Meta:
+                model = Product
+                fields = ['id', 'name', 'price']
+
+        products = Product.objects.order_by('pk')
+        rows = list(lean_query(NormalizedPrice, products))
+        self.assertEqual(rows, NormalizedPrice(products, many=True).data)
+        self.assertEqual([row['price'] for row in rows], ['2000.5', '50'])
+
+
+class RenderingAndCompressionTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ala', password='password123', is_staff=True)
+        self.client.login(username='ala', password='password123')
+        product = Product.objects.create(name="Monitor", price=Decimal("799.99"), category="ELEC")
+        for _ in range(3):
+            invoice = Invoice.objects.create(user=self.user, created_by=self.user)
+            for quantity in range(1, 11):
+                InvoiceItem.objects.create(invoice=invoice, product=product, quantity=quantity, price=Decimal("799.99"))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        from datetime import datetime, timezone
+        from rest_framework.renderers import JSONRenderer
+        from .api.renderers import FastJSONRenderer
+        data = {'kwota': Decimal('12.50'), 'kiedy': datetime(2025, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc),
+                'nazwa': 'Książka ', 'lista': [1, 2.5, None, True]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_gzip_negotiated_for_large_response(self):
+        response = self.client.get('/invoices/api/users/', HTTP_ACCEPT_ENCODING='deflate;q=0.5, gzip')
+        self.assertNotIn('Content-Encoding', response)  # za mała odpowiedź
+        response = self.client.get('/invoices/api/invoices/', HTTP_ACCEPT_ENCODING='deflate;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results'][0]['items']), 10)
+
+    def test_html_is_not_compressed(self):
+        # przeglądarkowe API zawiera token CSRF - kompresja otwierałaby BREACH
+        response = self.client.get('/invoices/api/invoices/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_deflate_and_streaming(self):
+        from django.http import StreamingHttpResponse
+        from .middleware import CompressionMiddleware
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+        middleware = CompressionMiddleware(
+            lambda r: StreamingHttpResponse((b'{"a": 1}' for _ in range(500)), content_type='application/json'))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(b''.join(response.streaming_content)), b'{"a": 1}' * 500)
+
+
+class BatchAPITestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.bob = User.objects.create_user(username='bob', password='password123')
+        self.client.login(username='tom', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+        self.other = Product.objects.create(name="Mysz", price=50, category="ELEC")
+        self.own = [Invoice.objects.create(user=self.tom, created_by=self.tom) for _ in range(3)]
+        self.foreign = Invoice.objects.create(user=self.bob, created_by=self.bob)
+
+    def test_multi_get_filters_by_owner(self):
+        ids = ','.join(str(invoice.id) for invoice in self.own + [self.foreign])
+        response = self.client.get(f'/invoices/api/invoices/?ids={ids}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(row['id'] for row in response.data), sorted(invoice.id for invoice in self.own))
+
+    def test_multi_get_products_and_validation(self):
+        response = self.client.get(f'/invoices/api/products/?ids={self.product.id},{self.other.id}')
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get('/invoices/api/products/?ids=1,abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_endpoint(self):
+        response = self.client.post('/invoices/api/batch/', {'requests': [
+            {'url': f'/invoices/api/invoices/{self.own[0].id}/'},
+            {'url': f'/invoices/api/invoices/{self.foreign.id}/'},
+            {'url': f'/invoices/api/products/?ids={self.product.id}'},
+            {'method': 'POST', 'url': '/invoices/api/invoices/',
+             'body': {'items': [{'product': self.product.id, 'quantity': 1}]}},
+            {'url': '/invoices/api/batch/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        codes = [item['status'] for item in response.data['responses']]
+        self.assertEqual(codes, [200, 404, 200, 201, 400])
+        self.assertEqual(response.data['responses'][0]['body']['id'], self.own[0].id)
+        self.assertEqual(Invoice.objects.across_shards().filter(created_by=self.tom).count(), 4)
+
+    def test_batch_product_writes(self):
+        # pod-żądania mają treść JSON - widoki produktów muszą ją przyjmować
+        response = self.client.post('/invoices/api/batch/', {'requests': [
+            {'method': 'POST', 'url': '/invoices/api/products/',
+             'body': {'name': "Monitor", 'price': "800.00", 'category': "ELEC"}},
+            {'method': 'PATCH', 'url': f'/invoices/api/products/{self.other.id}/', 'body': {'price': "60.00"}},
+        ]}, format='json')
+        self.assertEqual([item['status'] for item in response.data['responses']], [201, 200],
+                         response.data)
+        self.assertEqual(Product.objects.get(name="Monitor").created_by, self.tom)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.price, Decimal("60.00"))
+
+    def test_batch_headers_are_per_item(self):
+        def post(name, **headers):
+            item = {'method': 'POST', 'url': '/invoices/api/products/', 'body': {'name': name, 'price': "1.00"}}
+            return dict(item, headers=headers) if headers else item
+        # klucz batcha nie przechodzi na podżądania - to nie jest ponowienie
+        response = self.client.post('/invoices/api/batch/', {'requests': [post("A"), post("B")]},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+        self.assertEqual([item['status'] for item in response.data['responses']], [201, 201])
+
+        response = self.client.post('/invoices/api/batch/', {'requests': [
+            post("C", **{'idempotency-key': 'c'}), post("C", **{'Idempotency-Key': 'c'})]}, format='json')
+        first, second = response.data['responses']
+        self.assertEqual((first['status'], second['status']), (201, 201))
+        self.assertEqual(first['body'], second['body'])
+        self.assertEqual(Product.objects.filter(name="C").count(), 1)
+
+        response = self.client.post('/invoices/api/batch/', {'requests': [
+            {'url': '/invoices/api/products/', 'headers': {'Cookie': 'x'}}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_subrequests_reuse_outer_authentication(self):
+        from rest_framework.test import APIClient
+        from rest_framework_simplejwt.tokens import AccessToken
+        item = {'method': 'POST', 'url': '/invoices/api/products/', 'body': {'name': "Kabel", 'price': "5.00"}}
+
+        # sesja z CSRF: token sprawdza się raz, dla żądania batcha
+        client = APIClient(enforce_csrf_checks=True)
+        client.login(username='tom', password='password123')
+        client.cookies['csrftoken'] = token = 'x' * 32
+        response = client.post('/invoices/api/batch/', {'requests': [item]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = client.post('/invoices/api/batch/', {'requests': [item]}, format='json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.data['responses'][0]['status'], 201)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.bob)}')
+        response = client.post('/invoices/api/batch/', {'requests': [
+            {'url': f'/invoices/api/invoices/{self.foreign.id}/'},
+            {'url': f'/invoices/api/invoices/{self.own[0].id}/'},
+        ]}, format='json')
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 404])
+
+
+class BulkTransitionTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.bob = User.objects.create_user(username='bob', password='password123')
+        self.client.login(username='tom', password='password123')
+        self.sent = [Invoice.objects.create(user=self.tom, status='SENT', created_by=self.tom) for _ in range(3)]
+        self.new = Invoice.objects.create(user=self.tom, status='NEW', created_by=self.tom)
+        self.foreign = Invoice.objects.create(user=self.bob, status='SENT', created_by=self.bob)
+
+    def test_transition_by_ids(self):
+        ids = [invoice.id for invoice in self.sent] + [self.new.id, self.foreign.id]
+        response = self.client.post('/invoices/api/invoices/transition/', {'status': 'PAID', 'ids': ids},
+                                    format='json')
+        self.assertEqual(response.data, {'updated': 3, 'skipped': 1, 'not_found': 1})
+        self.assertEqual(Invoice.objects.across_shards().filter(status='PAID', updated_by=self.tom).count(), 3)
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.status, 'SENT')
+
+    def test_transition_by_filter_and_validation(self):
+        response = self.client.post('/invoices/api/invoices/transition/',
+                                    {'status': 'SENT', 'filter': {'status': 'NEW'}}, format='json')
+        self.assertEqual(response.data, {'updated': 1, 'skipped': 0, 'not_found': 0})
+        response = self.client.post('/invoices/api/invoices/transition/', {'status': 'NEW', 'ids': [1]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/invoices/api/invoices/transition/', {'status': 'PAID'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_transition_is_set_based(self):
+        from django.db import connections
+        from .models import ChangeLogEntry
+        from .sharding import shard_for
+        for _ in range(600):
+            Invoice.objects.create(user=self.tom, status='SENT', created_by=self.tom)
+        database = shard_for(self.tom)
+        with CaptureQueriesContext(connections[database]) as queries:
+            response = self.client.post('/invoices/api/invoices/transition/',
+                                        {'status': 'PAID', 'filter': {'status': 'SENT'}}, format='json')
+        self.assertEqual(response.data['updated'], 603)
+        statements = [q['sql'] for q in queries.captured_queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE "invoices_invoice"')]), 1)
+        if database == 'default':
+            # z innego shardu INSERT ... SELECT do dziennika jest niemożliwy - wpisy idą partiami
+            self.assertEqual(len([sql for sql in statements if sql.startswith('INSERT')]), 1)
+        entries = ChangeLogEntry.objects.filter(model='invoice', action='update')
+        self.assertEqual(entries.count(), 603)
+        self.assertEqual(set(entries.values_list('owner', flat=True)), {self.tom.id})
+
+    def test_graphql_mutation(self):
+        query = 'mutation { transitionInvoices(status: "PAID", statusFrom: "SENT") { updated skipped notFound } }'
+        response = self.client.post('/graphql', {'query': query}, format='json')
+        self.assertEqual(response.json()['data']['transitionInvoices'], {'updated': 3, 'skipped': 0, 'notFound': 0})
+
+
+class IdempotencyTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tom', password='password123')
+        self.client.login(username='tom', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+
+    def post_invoice(self, key, quantity=2):
+        payload = {"items": [{"product": self.product.id, "quantity": quantity}]}
+        return self.client.post('/invoices/api/invoices/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.post_invoice('abc')
+        second = self.post_invoice('abc')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(Invoice.objects.across_shards().count(), 1)
+        self.assertEqual(InvoiceItem.objects.across_shards().count(), 1)
+
+    def test_key_reused_with_different_body(self):
+        self.post_invoice('abc')
+        response = self.post_invoice('abc', quantity=5)
+        self.assertEqual(response.status_code, 422)
+
+    def test_in_flight_key_and_failed_request(self):
+        from . import idempotency
+        record, claimed = idempotency.claim(self.user, 'invoice-create', 'busy', 'x')
+        self.assertTrue(claimed)
+        with self.assertRaises(idempotency.IdempotencyError):
+            idempotency.claim(self.user, 'invoice-create', 'busy', 'x')
+        # nieudane żądanie nie blokuje klucza
+        response = self.client.post('/invoices/api/products/', {"price": "10"}, HTTP_IDEMPOTENCY_KEY='p1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/invoices/api/products/', {"name": "Mysz", "price": "10"},
+                                    HTTP_IDEMPOTENCY_KEY='p1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_abandoned_key_is_reclaimed_after_lease(self):
+        from django.utils import timezone
+        from . import idempotency
+        from .models import IdempotencyKey
+        idempotency.claim(self.user, 'invoice-create', 'crashed', 'x')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=4))
+        with self.assertRaises(idempotency.IdempotencyError):
+            idempotency.claim(self.user, 'invoice-create', 'crashed', 'x')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=6))
+        record, claimed = idempotency.claim(self.user, 'invoice-create', 'crashed', 'x')
+        self.assertTrue(claimed)
+        self.assertEqual(IdempotencyKey.objects.get().pk, record.pk)
+
+    def test_prune_expired_keys(self):
+        from . import idempotency
+        from .models import IdempotencyKey
+        self.post_invoice('old')
+        IdempotencyKey.objects.update(created_at=IdempotencyKey.objects.get().created_at - timedelta(days=2))
+        self.post_invoice('new')
+        self.assertEqual(idempotency.prune(batch_size=1), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+ADMISSION_TEST_CONFIG = {
+    'ROUTES': {'users-with-invoices': {'priority': 'low', 'rate': 0.01, 'burst': 2},
+               'graphql': {'priority': 'low'}},
+    'PRIORITIES': {'high': {'slots': None, 'max_queue_wait': 10.0},
+                   'normal': {'slots': 8, 'max_queue_wait': 2.0},
+                   'low': {'slots': 1, 'max_queue_wait': 0.05}},
+}
+
+
+@override_settings(ADMISSION_CONTROL=ADMISSION_TEST_CONFIG)
+class AdmissionControlTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.login(username='admin', password='password123')
+
+    def test_rate_limit_returns_429_with_retry_after(self):
+        codes = [self.client.get('/invoices/api/users-with-invoices/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = self.client.get('/invoices/api/users-with-invoices/')
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # inne trasy nie są objęte tym limitem
+        self.assertEqual(self.client.get('/invoices/api/users/').status_code, 200)
+
+    def test_batch_subrequests_use_route_limits(self):
+        response = self.client.post('/invoices/api/batch/', {'requests': [
+            {'url': '/invoices/api/users-with-invoices/'} for _ in range(5)] + [{'url': '/invoices/api/users/'}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        codes = [item['status'] for item in response.data['responses']]
+        self.assertEqual(codes, [200, 200, 429, 429, 429, 200])
+        self.assertGreaterEqual(response.data['responses'][2]['body']['retry_after'], 1)
+        # limit jest wspólny z bezpośrednimi wywołaniami trasy
+        self.assertEqual(self.client.get('/invoices/api/users-with-invoices/').status_code, 429)
+
+    def test_stale_queue_time_is_shed(self):
+        started = f't={int((time.time() - 5) * 1000)}'
+        response = self.client.get('/invoices/api/users-with-invoices/', HTTP_X_REQUEST_START=started)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_priority_classes_and_slots(self):
+        from .admission import AdmissionController, Rejected
+        controller = AdmissionController()
+        request = RequestFactory().post('/invoices/api/invoices/')
+        self.assertEqual(controller.priority(request, 'users-with-invoices', {'priority': 'low'}), 'high')
+        request = RequestFactory().get('/invoices/api/token/')
+        self.assertEqual(controller.priority(request, 'token_obtain_pair', {'priority': 'low'}), 'high')
+
+        request = RequestFactory().get('/invoices/api/invoices-simple/')
+        release = controller.admit(request, 'invoice-basic-info')
+        gate = controller.gates['low']
+        self.assertTrue(gate.acquire())  # jedyny slot klasy 'low'
+        with self.assertRaises(Rejected) as ctx:
+            gate.acquire()
+        self.assertEqual(ctx.exception.status, 503)
+        gate.release()
+        release()
+
+    def test_graphql_priority_follows_operation_type(self):
+        from .admission import AdmissionController, PriorityGate, Rejected
+        controller = AdmissionController()
+
+        def priority(query, **extra):
+            request = RequestFactory().post('/graphql', json.dumps({'query': query, **extra}),
+                                            content_type='application/json')
+            return controller.priority(request, 'graphql', {'priority': 'low'})
+        self.assertEqual(priority('{ allProducts { edges { node { id } } } }'), 'low')
+        self.assertEqual(priority('mutation { refreshToken { token } }'), 'high')
+        both = 'query Q { allProducts { totalCount } } mutation M { refreshToken { token } }'
+        self.assertEqual(priority(both, operationName='Q'), 'low')
+        self.assertEqual(priority(both, operationName='M'), 'high')
+
+        # zajęta klasa 'low' - zapytanie odrzucone, mutacja przechodzi
+        def acquire(gate):
+            if gate.name == 'low':
+                raise Rejected(503, 'queue', 1)
+            return False
+        with mock.patch.object(PriorityGate, 'acquire', autospec=True, side_effect=acquire):
+            response = self.client.post('/graphql', {'query': '{ allProducts { totalCount } }'}, format='json')
+            self.assertEqual(response.status_code, 503)
+            response = self.client.post('/graphql', {'query': 'mutation { createProduct(name: "X", price: "1.00") '
+                                                              '{ product { id } } }'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('errors', response.json())
+
+
+class ArchiveTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.client.login(username='tom', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+        self.old = Invoice.objects.create(user=self.tom, status='PAID', created_by=self.tom)
+        InvoiceItem.objects.create(invoice=self.old, product=self.product, quantity=2, price=Decimal("1500.00"))
+        Invoice.objects.for_user(self.tom).filter(pk=self.old.pk).update(date=date(2020, 1, 15))
+        self.recent = Invoice.objects.create(user=self.tom, status='PAID', created_by=self.tom)
+        self.unpaid = Invoice.objects.create(user=self.tom, status='SENT', created_by=self.tom)
+        Invoice.objects.for_user(self.tom).filter(pk=self.unpaid.pk).update(date=date(2020, 1, 15))
+
+    def test_archive_moves_only_old_paid_invoices(self):
+        from .archive import archive_paid_invoices
+        from .models import ArchivedInvoice, ArchivedInvoiceItem
+        expected = self.client.get(f'/invoices/api/invoices/{self.old.id}/').content
+        self.assertEqual(archive_paid_invoices(date(2021, 1, 1)), (1, 1))
+        self.assertFalse(Invoice.objects.for_user(self.tom).filter(pk=self.old.pk).exists())
+        self.assertEqual(ArchivedInvoice.objects.for_user(self.tom).get().date, date(2020, 1, 15))
+        self.assertEqual(ArchivedInvoiceItem.objects.for_user(self.tom).get().price, Decimal("1500.00"))
+
+        self.assertEqual(self.client.get(f'/invoices/api/invoices/{self.old.id}/').status_code, 404)
+        response = self.client.get(f'/invoices/api/invoices/{self.old.id}/?include_archived=1')
+        self.assertEqual(response.content, expected)
+
+    def test_list_and_graphql_include_archived(self):
+        from .archive import archive_paid_invoices
+        archive_paid_invoices(date(2021, 1, 1))
+        response = self.client.get('/invoices/api/invoices/')
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get('/invoices/api/invoices/?include_archived=1&page=2')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.old.id])
+        self.assertEqual(response.data['results'][0]['total_value'], '3000.00')
+        self.assertEqual(response.data['results'][0]['products'], [self.product.id])
+
+        query = '{ allInvoices(includeArchived: true) { edges { node { id items { quantity product { name } } } } } }'
+        data = self.client.post('/graphql', {'query': query}, format='json').json()['data']['allInvoices']['edges']
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0]['node']['items'], [{'quantity': 2, 'product': {'name': 'Laptop'}}])
+
+    def test_restore(self):
+        from .archive import archive_paid_invoices, restore_invoices
+        archive_paid_invoices(date(2021, 1, 1))
+        self.assertEqual(restore_invoices([self.old.id, 999]), (1, 1))
+        restored = Invoice.objects.for_user(self.tom).get(pk=self.old.pk)
+        self.assertEqual(restored.date, date(2020, 1, 15))
+        self.assertEqual(restored.items.get().quantity, 2)
+
+
+class AdminTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(self.admin)
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+
+    def add_invoices(self, count):
+        for _ in range(count):
+            user = User.objects.create_user(username=f'klient{User.objects.count()}')
+            invoice = Invoice.objects.create(user=user, created_by=user)
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=1, price=2000)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_invoices(2)
+        few = [self.count_queries(f'/admin/invoices/{name}/') for name in ('invoice', 'invoiceitem')]
+        self.add_invoices(10)
+        many = [self.count_queries(f'/admin/invoices/{name}/') for name in ('invoice', 'invoiceitem')]
+        self.assertEqual(few, many)
+
+    def test_item_form_does_not_list_all_products(self):
+        for i in range(5):
+            Product.objects.create(name=f"Produkt {i}", price=1)
+        response = self.client.get('/admin/invoices/invoiceitem/add/')
+        self.assertNotContains(response, 'Produkt 4')
+
+    def test_estimated_count_paginator(self):
+        from .admin import EstimatedCountPaginator
+        for _ in range(3):
+            Invoice.objects.create(user=self.admin, created_by=self.admin)
+        # all_objects - bez filtra deleted_at, czyli ścieżka szacunku
+        invoices = Invoice.all_objects.for_user(self.admin).order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(invoices, 50).count, 3)
+        self.assertEqual(EstimatedCountPaginator(invoices.filter(status='PAID'), 50).count, 0)
+
+    def test_estimated_count_paginator_limits(self):
+        from django.core.paginator import EmptyPage
+        from .admin import EstimatedCountPaginator, estimated_count
+        for _ in range(5):
+            Invoice.objects.create(user=self.admin, created_by=self.admin)
+        live = Invoice.objects.for_user(self.admin).order_by('pk')
+        with mock.patch('invoices.admin.EXACT_COUNT_LIMIT', 2):
+            # sam filtr managera (bez usuniętych) nie wyłącza szacunku
+            self.assertEqual(EstimatedCountPaginator(live, 2).count, estimated_count(live))
+
+            paginator = EstimatedCountPaginator(live.filter(user=self.admin), 2)
+            self.assertEqual((paginator.count, paginator.capped), (2, True))
+            self.assertEqual([len(paginator.page(number)) for number in (1, 2, 3)], [2, 2, 1])
+            with self.assertRaises(EmptyPage):
+                paginator.page(4)
+
+            Product.objects.create(name="Myszka", price=50, category="ELEC")
+            response = self.client.get('/admin/invoices/product/', {'category__exact': 'ELEC'})
+            self.assertContains(response, 'at least 2 Produkty')
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        from .storage import ContentAddressedStorage
+        self.media_root = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE=None)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_identical_uploads_are_stored_once(self):
+        from django.core.files.base import ContentFile
+        from .storage import is_content_addressed
+        first = self.storage.save('produkty/a.jpg', ContentFile(b'obraz' * 1000))
+        second = self.storage.save('produkty/kopia.JPG', ContentFile(b'obraz' * 1000))
+        other = self.storage.save('produkty/a.jpg', ContentFile(b'inny obraz'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(is_content_addressed(first))
+        self.assertTrue(first.startswith('produkty/') and first.endswith('.jpg'))
+        self.assertEqual(len(os.listdir(os.path.dirname(self.storage.path(first)))), 1)
+        self.assertEqual(os.listdir(self.storage.path('.tmp')), [])
+
+    def test_media_view_ranges_and_cache_headers(self):
+        from django.core.files.base import ContentFile
+        content = bytes(range(256)) * 8
+        name = self.storage.save('produkty/plik.bin', ContentFile(content))
+        url = f'/media/{name}'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), content[-5:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(content)}')
+
+        # If-Range z nieaktualnym ETag - cały plik zamiast zakresu
+        response = self.client.get(url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE='"stary"')
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+    def test_media_view_hides_dotfiles(self):
+        for name in ('.tmp/tmpabc123', 'produkty/.ukryty.jpg'):
+            os.makedirs(os.path.dirname(self.storage.path(name)), exist_ok=True)
+            with open(self.storage.path(name), 'wb') as f:
+                f.write(b'niepelny zapis')
+            self.assertEqual(self.client.get(f'/media/{name}').status_code, 404)
+            self.assertEqual(self.client.get(f'/media/produkty/../{name}').status_code, 404)
+
+    def test_prune_skips_recent_files(self):
+        from io import StringIO
+        from django.core.files.base import ContentFile
+        from django.core.management import call_command
+        used = self.storage.save('produkty/a.jpg', ContentFile(b'a'))
+        Product.objects.create(name="Aparat", price=1, image=used)
+        old = self.storage.save('produkty/b.jpg', ContentFile(b'b'))
+        recent = self.storage.save('produkty/c.jpg', ContentFile(b'c'))
+        hour_ago = time.time() - 3600
+        for name in (used, old):
+            os.utime(self.storage.path(name), (hour_ago, hour_ago))
+
+        call_command('rehash_media', '--prune', '--grace', '30', stdout=StringIO())
+        self.assertEqual([self.storage.exists(name) for name in (used, old, recent)], [True, False, True])
+
+    def test_media_view_hands_off_to_front_end_server(self):
+        from django.core.files.base import ContentFile
+        name = self.storage.save('produkty/plik.webp', ContentFile(b'x' * 100))
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.client.get(f'/media/{name}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{name}')
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(f'/media/{name}')
+        self.assertEqual(response['X-Sendfile'], self.storage.path(name))
+
+
+class ShardedQuerySetTestCase(TestCase):
+    """
+    Łączenie wyników shardów - tu dwa "shardy" to ta sama baza (shard
+    klienta), więc każdy wiersz występuje dwa razy.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        from .sharding import ShardedQuerySet, shard_for
+        user = User.objects.create_user(username='tom')
+        product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+        self.invoices = [Invoice.objects.create(user=user, status=s) for s in ('NEW', 'SENT', 'PAID')]
+        for invoice in self.invoices:
+            InvoiceItem.objects.create(invoice=invoice, product=product, quantity=1, price=Decimal("10.00"))
+        self.sharded = lambda queryset: ShardedQuerySet(queryset, shards=[shard_for(user)] * 2)
+
+    def test_merge_keeps_ordering(self):
+        ids = [invoice.id for invoice in self.invoices]
+        queryset = self.sharded(Invoice.objects.order_by('-id'))
+        self.assertEqual([invoice.id for invoice in queryset], sorted(ids * 2, reverse=True))
+        self.assertEqual([invoice.id for invoice in queryset[1:3]], [ids[2], ids[1]])
+        self.assertEqual(list(self.sharded(Invoice.objects.values_list('id', flat=True)).order_by('id')),
+                         sorted(ids * 2))
+        self.assertEqual(queryset.filter(status='PAID').count(), 2)
+
+    def test_aggregates_and_get(self):
+        from django.core.exceptions import MultipleObjectsReturned
+        from django.db.models import Avg, Max, Sum
+        queryset = self.sharded(InvoiceItem.objects.all())
+        self.assertEqual(queryset.aggregate(Sum('price'), top=Max('price')),
+                         {'price__sum': Decimal("60.00"), 'top': Decimal("10.00")})
+        with self.assertRaises(TypeError):
+            queryset.aggregate(Avg('price'))
+        with self.assertRaises(MultipleObjectsReturned):
+            queryset.get(pk=self.invoices[0].items.get().pk)
+        with self.assertRaises(InvoiceItem.DoesNotExist):
+            queryset.get(pk=-1)
+
+
+@skipUnless(len(settings.INVOICE_SHARDS) > 1, "wymaga co najmniej dwóch shardów (INVOICE_SHARD_COUNT=2)")
+class ShardingTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        from .sharding import shard_for
+        self.admin = User.objects.create_superuser(username='admin', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+        # dwóch klientów na różnych shardach
+        self.clients = []
+        while len({shard_for(user) for user in self.clients}) < 2:
+            self.clients.append(User.objects.create_user(username=f'klient{len(self.clients)}', password='pass'))
+        self.tom = self.clients[0]
+        self.ann = next(user for user in self.clients if shard_for(user) != shard_for(self.tom))
+
+    def create_invoice(self, user, quantity=1):
+        self.client.force_authenticate(user)
+        response = self.client.post('/invoices/api/invoices/', {
+            'items': [{'product': self.product.id, 'quantity': quantity}]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_invoices_live_on_customer_shard(self):
+        from .sharding import shard_for
+        tom_invoice = self.create_invoice(self.tom)
+        ann_invoice = self.create_invoice(self.ann)
+        self.assertNotEqual(tom_invoice, ann_invoice)
+        self.assertTrue(Invoice.objects.using(shard_for(self.tom)).filter(pk=tom_invoice).exists())
+        self.assertFalse(Invoice.objects.using(shard_for(self.ann)).filter(pk=tom_invoice).exists())
+        self.assertTrue(InvoiceItem.objects.using(shard_for(self.ann)).filter(invoice_id=ann_invoice).exists())
+        # produkt i użytkownik są replikowane
+        self.assertTrue(Product.objects.using(shard_for(self.ann)).filter(pk=self.product.pk).exists())
+
+        self.client.force_authenticate(self.tom)
+        response = self.client.get('/invoices/api/invoices/')
+        self.assertEqual([row['id'] for row in response.data['results']], [tom_invoice])
+        self.assertEqual(self.client.get(f'/invoices/api/invoices/{tom_invoice}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/invoices/api/invoices/{ann_invoice}/').status_code, 404)
+
+    def test_staff_scatter_gather(self):
+        ids = sorted(self.create_invoice(user, quantity=2) for user in (self.tom, self.ann, self.tom))
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/invoices/api/invoices/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([row['id'] for row in response.data['results']], ids[:2])
+        self.assertEqual(self.client.get(f'/invoices/api/invoices/{ids[1]}/').status_code, 200)
+
+        root = self.client.get('/invoices/api/').data
+        self.assertEqual(root['ilość faktur'], 3)
+        self.assertEqual(root['suma wartości faktur'], Decimal("12000.00"))
+        users = self.client.get('/invoices/api/users-with-invoices/').data
+        self.assertEqual(users['count'], 2)
+
+        response = self.client.post('/invoices/api/invoices/transition/', {'status': 'SENT', 'ids': ids}, format='json')
+        self.assertEqual(response.data, {'updated': 3, 'skipped': 0, 'not_found': 0})
+
+
+class GraphQLConnectionTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.client.force_login(self.tom)
+        self.products = [
+            Product.objects.create(name=f"Produkt {i}", price=10 + i, category='ELEC' if i % 2 else 'BOOK')
+            for i in range(5)
+        ]
+
+    def query(self, query):
+        response = self.client.post('/graphql', {'query': query}, format='json').json()
+        return response
+
+    def test_cursor_paging(self):
+        page = '{ allProducts(first: 2%s) { edges { node { name } } pageInfo { hasNextPage endCursor } } }'
+        names = []
+        after = ''
+        while True:
+            data = self.query(page % after)['data']['allProducts']
+            names += [edge['node']['name'] for edge in data['edges']]
+            if not data['pageInfo']['hasNextPage']:
+                break
+            after = ', after: "%s"' % data['pageInfo']['endCursor']
+        self.assertEqual(names, [product.name for product in self.products])
+
+    def test_total_count_only_when_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.query('{ allProducts(first: 2) { edges { node { id } } } }')
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        data = self.query('{ allProducts(first: 2, category: "ELEC") { totalCount edges { node { id } } } }')
+        self.assertEqual(data['data']['allProducts']['totalCount'], 2)
+
+    def test_max_page_size_and_bad_cursor(self):
+        from graphene_django.settings import graphene_settings
+        limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        data = self.query('{ allProducts(first: %d) { edges { node { id } } } }' % (limit + 1))
+        self.assertIn(str(limit), data['errors'][0]['message'])
+        data = self.query('{ allProducts(after: "nie-kursor") { edges { node { id } } } }')
+        self.assertEqual(data['errors'][0]['message'], "Nieprawidłowy kursor.")
+
+    def test_invoice_filters_and_keyset_on_annotation(self):
+        invoices = [Invoice.objects.create(user=self.tom, status=status) for status in ('NEW', 'PAID', 'PAID')]
+        Invoice.objects.for_user(self.tom).filter(pk=invoices[2].pk).update(date=date(2020, 1, 1))
+        for invoice in invoices:
+            InvoiceItem.objects.create(invoice=invoice, product=self.products[0], quantity=1, price=10)
+        InvoiceItem.objects.create(invoice=invoices[0], product=self.products[1], quantity=1, price=10)
+        InvoiceItem.objects.create(invoice=invoices[1], product=self.products[1], quantity=1, price=10)
+
+        data = self.query('{ allInvoices(status: "PAID", dateFrom: "2021-01-01") { edges { node { id } } } }')
+        self.assertEqual([edge['node']['id'] for edge in data['data']['allInvoices']['edges']], [str(invoices[1].id)])
+
+        data = self.query('{ popularProducts(first: 1) { edges { cursor node { name } } } }')
+        edge = data['data']['popularProducts']['edges'][0]
+        self.assertEqual(edge['node']['name'], self.products[0].name)
+        data = self.query('{ popularProducts(first: 1, after: "%s") { edges { node { name } } } }' % edge['cursor'])
+        self.assertEqual(data['data']['popularProducts']['edges'][0]['node']['name'], self.products[1].name)
+
+
+class StartupTestCase(TestCase):
+    databases = '__all__'
+
+    def test_boot_does_not_import_graphql_schema(self):
+        import subprocess
+        import sys
+        code = ("import sys, invoice_manager.wsgi; "
+                "print(sorted(m for m in ('invoice_manager.schema_graphql', 'invoice_manager.views') if m in sys.modules))")
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='invoice_manager.settings')
+        output = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_importtime_parsing(self):
+        from .management.commands.startup_report import by_package, parse_importtime
+        rows = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       100 |        100 |     graphql.language\n"
+            "import time:        50 |        150 |   graphql\n"
+            "import time:        30 |         30 | django\n"
+        )
+        self.assertEqual(rows[1], ('graphql', 50, 150))
+        self.assertEqual(by_package(rows), [('graphql', 150), ('django', 30)])
+
+
+class ChangeFeedTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.bob = User.objects.create_user(username='bob', password='password123')
+        self.client.login(username='tom', password='password123')
+        self.cursor = self.client.get('/invoices/api/changes/').data['cursor']
+
+    def changes(self, after=None, **params):
+        params['after'] = self.cursor if after is None else after
+        response = self.client.get('/invoices/api/changes/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_records_saves_deletes_and_bulk_paths(self):
+        product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+        invoice = Invoice.objects.create(user=self.tom, status='SENT', created_by=self.tom)
+        item = InvoiceItem.objects.create(invoice=invoice, product=product, quantity=1, price=Decimal("10.00"))
+        bulk = Invoice.objects.bulk_create([Invoice(user=self.tom, status='SENT', created_by=self.tom)])[0]
+        self.client.post('/invoices/api/invoices/transition/', {'status': 'PAID', 'ids': [invoice.id]}, format='json')
+        item_id = item.id
+        item.delete()
+
+        data = self.changes()
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['cursor'], data['results'][-1]['cursor'])
+        self.assertEqual(
+            [(entry['model'], entry['id'], entry['action']) for entry in data['results']],
+            [('product', product.id, 'create'), ('invoice', invoice.id, 'create'),
+             ('invoiceitem', item_id, 'create'), ('invoice', bulk.id, 'create'),
+             ('invoice', invoice.id, 'update'), ('invoiceitem', item_id, 'delete')],
+        )
+        self.assertEqual(data['results'][-1]['invoice'], invoice.id)
+        self.assertEqual(self.changes(after=data['cursor'])['results'], [])
+
+    def test_scoped_batched_and_archived(self):
+        from .archive import archive_paid_invoices, restore_invoices
+        mine = Invoice.objects.create(user=self.tom, status='PAID', created_by=self.tom)
+        Invoice.objects.create(user=self.bob, status='NEW', created_by=self.bob)
+        product = Product.objects.create(name="Mysz", price=50, category="ELEC")
+        Invoice.objects.for_user(self.tom).filter(pk=mine.pk).update(date=date(2020, 1, 15))
+        archive_paid_invoices(date(2021, 1, 1))
+        restore_invoices([mine.id])
+
+        first = self.changes(limit=2)
+        self.assertTrue(first['has_more'])
+        rest = self.changes(after=first['cursor'], models='invoice')
+        self.assertEqual(
+            [(entry['model'], entry['id'], entry['action']) for entry in first['results'] + rest['results']],
+            [('invoice', mine.id, 'create'), ('product', product.id, 'create'),
+             ('invoice', mine.id, 'archive'), ('invoice', mine.id, 'restore')],
+        )
+        self.client.logout()
+        self.client.login(username='bob', password='password123')
+        self.assertEqual(len(self.changes()['results']), 2)
+        response = self.client.get('/invoices/api/changes/', {'after': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/invoices/api/changes/', {'after': 0, 'models': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compaction(self):
+        from django.core.management import call_command
+        from .models import ChangeLogEntry
+        invoice = Invoice.objects.create(user=self.tom, status='NEW', created_by=self.tom)
+        for new_status in ('SENT', 'PAID'):
+            invoice.status = new_status
+            invoice.save()
+        gone = Invoice.objects.create(user=self.tom, created_by=self.tom).pk
+        Invoice.objects.for_user(self.tom).filter(pk=gone).delete()
+        product = Product.objects.create(name="Mysz", price=50, category="ELEC")
+        self.assertEqual(ChangeLogEntry.objects.count(), 6)
+
+        call_command('compact_changes', days=0, tombstone_days=30, stdout=io.StringIO())
+        self.assertEqual(
+            list(ChangeLogEntry.objects.values_list('object_id', 'action')),
+            [(invoice.id, 'update'), (gone, 'delete'), (product.id, 'create')],
+        )
+        self.assertEqual(len(self.changes()['results']), 3)
+
+        call_command('compact_changes', days=0, tombstone_days=0, stdout=io.StringIO())
+        response = self.client.get('/invoices/api/changes/', {'after': self.cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.changes(after=response.data['cursor'])['results'], [])
+
+
+class InvoiceEventsTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.bob = User.objects.create_user(username='bob', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=2000, category="ELEC")
+
+    def create_invoice(self, user, status='NEW'):
+        invoice = Invoice.objects.create(user=user, status=status, created_by=user)
+        InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, price=Decimal("10.00"))
+        return invoice
+
+    def test_one_event_per_invoice_with_current_state(self):
+        from .events import invoice_events
+        from .models import ChangeLogEntry
+        invoice = self.create_invoice(self.tom)
+        invoice.status = 'SENT'
+        invoice.save()
+        gone = self.create_invoice(self.bob)
+        gone_id = gone.id
+        gone.delete()
+
+        events = invoice_events(list(ChangeLogEntry.objects.order_by('pk')))
+        self.assertEqual([(event['id'], event['action']) for event in events],
+                         [(invoice.id, 'create'), (gone_id, 'delete')])
+        self.assertEqual(events[0]['status'], 'SENT')
+        self.assertEqual(events[0]['total_value'], Decimal("20.00"))
+        self.assertEqual(events[0]['owner'], self.tom.id)
+
+    def test_set_based_writes_are_published(self):
+        from .events import broker
+        from .transitions import bulk_transition
+        invoice = self.create_invoice(self.tom, 'SENT')
+        with mock.patch.object(broker, 'has_subscribers', return_value=True), \
+                mock.patch.object(broker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            bulk_transition(Invoice.objects.across_shards(), 'PAID', self.tom)
+        [events] = publish.call_args.args
+        self.assertEqual([(event['id'], event['status']) for event in events], [(invoice.id, 'PAID')])
+
+    def test_wsgi_is_rejected(self):
+        self.client.force_login(self.tom)
+        response = self.client.get('/invoices/events/')
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+    async def read(self, content):
+        return await asyncio.wait_for(content.__anext__(), 5)
+
+    async def test_stream_pushes_owned_changes_and_replays(self):
+        from asgiref.sync import sync_to_async
+        response = await self.async_client.get('/invoices/events/')
+        self.assertEqual(response.status_code, 401)
+
+        await self.async_client.aforce_login(self.tom)
+        response = await self.async_client.get('/invoices/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertTrue((await self.read(content)).startswith(b'retry:'))
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_invoice(self.bob)
+                return self.create_invoice(self.tom)
+        invoice = await sync_to_async(write)()
+        chunk = (await self.read(content)).decode()
+        await content.aclose()
+        self.assertIn('event: invoice\n', chunk)
+        data = json.loads(chunk.split('data: ')[1])
+        self.assertEqual((data['id'], data['action'], data['status']), (invoice.id, 'create', 'NEW'))
+
+        response = await self.async_client.get('/invoices/events/', headers={'Last-Event-ID': '0'})
+        content = response.streaming_content
+        await self.read(content)
+        replayed = (await self.read(content)).decode()
+        await content.aclose()
+        self.assertEqual(json.loads(replayed.split('data: ')[1])['id'], invoice.id)
+
+    @override_settings(CHANGE_FEED={'PAGE_SIZE': 2})
+    async def test_replay_reads_log_page_by_page(self):
+        from asgiref.sync import sync_to_async
+        from . import changes
+        from .events import _replay
+        invoices = await sync_to_async(lambda: [self.create_invoice(self.tom) for _ in range(3)])()
+        with mock.patch.object(changes, 'feed', wraps=changes.feed) as feed:
+            replay = _replay(self.tom, 0)
+            first = await replay.__anext__()
+            # faktura i jej pozycja to jedna strona - reszta dziennika nieprzeczytana
+            self.assertEqual(feed.call_count, 1)
+            rest = [event async for event in replay]
+        self.assertEqual([event['id'] for event in [first] + rest], [invoice.id for invoice in invoices])
+        self.assertEqual([call.args[1] for call in feed.call_args_list],
+                         [0] + [event['cursor'] for event in [first] + rest[:-1]])
+
+    @override_settings(INVOICE_EVENTS={'BACKEND': 'changelog', 'POLL_INTERVAL': 0.05})
+    async def test_changelog_backend_polls_log(self):
+        from asgiref.sync import sync_to_async
+        await self.async_client.aforce_login(self.bob)
+        content = (await self.async_client.get('/invoices/events/')).streaming_content
+        await self.read(content)
+        await asyncio.sleep(0.1)  # poller zapamiętuje kursor startowy
+        invoice = await sync_to_async(self.create_invoice)(self.bob, 'SENT')
+        chunk = (await self.read(content)).decode()
+        await content.aclose()
+        data = json.loads(chunk.split('data: ')[1])
+        self.assertEqual((data['id'], data['status'], data['total_value']), (invoice.id, 'SENT', '20.00'))
+
+
+class GraphQLBulkMutationTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.client.force_login(self.tom)
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("2000.00"), category="ELEC")
+        self.mouse = Product.objects.create(name="Mysz", price=Decimal("50.00"), category="ELEC")
+
+    def query(self, query):
+        return self.client.post('/graphql', {'query': query}, format='json').json()
+
+    def test_create_products_in_one_insert(self):
+        query = '''mutation { createProducts(products: [
+            {name: "Książka", price: "39.90", category: "BOOK"},
+            {name: "Kawa", price: "25.00", category: "FOOD", desc: "Ziarnista"}
+        ]) { ok results { index errors { field } product { name createdBy { username } } } } }'''
+        with CaptureQueriesContext(connection) as queries:
+            data = self.query(query)['data']['createProducts']
+        self.assertTrue(data['ok'])
+        self.assertEqual([result['product']['name'] for result in data['results']], ["Książka", "Kawa"])
+        self.assertEqual(data['results'][1]['product']['createdBy']['username'], 'tom')
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "invoices_product"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_invalid_input_saves_nothing(self):
+        query = '''mutation { createProducts(products: [
+            {name: "Dobry", price: "1.00"}, {name: "Zły", price: "1.00", category: "XXXX"}
+        ]) { ok results { index errors { field message } product { id } } } }'''
+        data = self.query(query)['data']['createProducts']
+        self.assertFalse(data['ok'])
+        self.assertEqual(data['results'][0]['errors'], [])
+        self.assertEqual([error['field'] for error in data['results'][1]['errors']], ['category'])
+        self.assertFalse(Product.objects.filter(name="Dobry").exists())
+
+    def test_create_invoices(self):
+        query = '''mutation { createInvoices(invoices: [
+            {items: [{productId: %d, quantity: 2}, {productId: %d, quantity: 1, price: "45.00"}]},
+            {items: [{productId: %d, quantity: 3}]}
+        ]) { ok results { errors { field } invoice { id status user { username } items { price } } } } }''' % (
+            self.laptop.id, self.mouse.id, self.mouse.id)
+        data = self.query(query)['data']['createInvoices']
+        self.assertTrue(data['ok'])
+        first = data['results'][0]['invoice']
+        self.assertEqual((first['status'], first['user']['username']), ('NEW', 'tom'))
+        self.assertEqual([item['price'] for item in first['items']], ['2000.00', '45.00'])
+        self.assertEqual(Invoice.objects.across_shards().filter(created_by=self.tom).count(), 2)
+        self.assertEqual(InvoiceItem.objects.across_shards().count(), 3)
+
+        query = '''mutation { createInvoices(invoices: [{items: [{productId: 999999, quantity: 1}]}, {items: []}])
+            { ok results { errors { field } } } }'''
+        data = self.query(query)['data']['createInvoices']
+        self.assertFalse(data['ok'])
+        self.assertEqual([[e['field'] for e in result['errors']] for result in data['results']],
+                         [['items.0.product_id'], ['items']])
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.query('mutation { createProduct(name: "X", price: "1.00") { product { id } } }')
+        self.assertIn('errors', response)
+        self.assertFalse(Product.objects.filter(name="X").exists())
+
+
+class SparseFieldsTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.client.force_authenticate(self.tom)
+        self.product = Product.objects.create(name="Laptop", price=Decimal("2000.00"), category="ELEC", desc="Opis")
+        self.invoice = Invoice.objects.create(user=self.tom, status='SENT', created_by=self.tom)
+        InvoiceItem.objects.create(invoice=self.invoice, product=self.product, quantity=2, price=Decimal("10.00"))
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.json(), ' '.join(q['sql'] for q in queries.captured_queries)
+
+    def test_invoice_list_without_items_skips_join(self):
+        data, sql = self.get('/invoices/api/invoices/?fields=id,date,status')
+        self.assertEqual(list(data['results'][0]), ['id', 'date', 'status'])
+        self.assertNotIn('invoices_invoiceitem', sql)
+
+        data, sql = self.get('/invoices/api/invoices/?fields=id,status,total_value')
+        self.assertEqual(data['results'][0]['total_value'], '20.00')
+
+        data, _ = self.get('/invoices/api/invoices/?expand=items')
+        invoice = data['results'][0]
+        self.assertEqual(invoice['items'][0]['quantity'], 2)
+        self.assertNotIn('total_value', invoice)
+        self.assertIn('created_by', invoice)
+
+    def test_detail_and_product_columns(self):
+        data, sql = self.get(f'/invoices/api/invoices/{self.invoice.id}/?fields=id,status')
+        self.assertEqual(data, {'id': self.invoice.id, 'status': 'SENT'})
+        self.assertNotIn('invoices_invoiceitem', sql)
+
+        data, sql = self.get('/invoices/api/products/?fields=id,name')
+        self.assertEqual(data['results'], [{'id': self.product.id, 'name': "Laptop"}])
+        self.assertNotIn('"desc"', sql)
+        data, sql = self.get(f'/invoices/api/products/{self.product.id}/?fields=name')
+        self.assertEqual(data, {'name': "Laptop"})
+        self.assertNotIn('"desc"', sql)
+
+    def test_full_representation_and_validation(self):
+        data, _ = self.get('/invoices/api/invoices/')
+        self.assertIn('items', data['results'][0])
+        self.assertIn('total_value', data['results'][0])
+        for url in ('/invoices/api/invoices/?fields=id,nope', '/invoices/api/invoices/?expand=user',
+                    '/invoices/api/products/?fields='):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DeletionTestCase(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        from .models import ChangeLogEntry, DeletionJob
+        self.ChangeLogEntry, self.DeletionJob = ChangeLogEntry, DeletionJob
+        self.admin = User.objects.create_superuser(username='admin', password='password123')
+        self.tom = User.objects.create_user(username='tom', password='password123')
+        self.product = Product.objects.create(name="Laptop", price=Decimal("2000.00"), created_by=self.tom)
+        self.invoices = [Invoice.objects.create(user=self.tom, created_by=self.tom) for _ in range(5)]
+        for invoice in self.invoices:
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=1, price=Decimal("10.00"))
+        self.other = Invoice.objects.create(user=self.admin, created_by=self.tom)
+
+    def purge(self, batch_size=2, **options):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('purge_deletions', batch_size=batch_size, stdout=out, stderr=out, **options)
+        return out.getvalue()
+
+    def test_user_delete_is_soft_then_purged(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.delete(f'/invoices/api/users/{self.tom.id}/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        self.tom.refresh_from_db()
+        self.assertFalse(self.tom.is_active)
+        usernames = [user['username'] for user in self.client.get('/invoices/api/users/').data['results']]
+        self.assertNotIn('tom', usernames)
+        # faktury znikają od razu, zanim purge usunie wiersze
+        self.assertFalse(Invoice.objects.across_shards().filter(user=self.tom).exists())
+        self.assertEqual(Invoice.all_objects.across_shards().filter(user=self.tom).count(), 5)
+        listed = [invoice['id'] for invoice in self.client.get('/invoices/api/invoices/').data['results']]
+        self.assertEqual(listed, [self.other.id])
+        self.assertNotIn('tom', [user['username'] for user in
+                                 self.client.get('/invoices/api/users-with-invoices/').data['results']])
+
+        output = self.purge()
+        self.assertIn('invoices 2', output)
+        self.assertFalse(User.objects.filter(pk=self.tom.pk).exists())
+        self.assertFalse(ClientProfile.objects.filter(user_id=self.tom.pk).exists())
+        self.assertEqual(list(Invoice.objects.across_shards()), [self.other])
+        self.assertEqual(InvoiceItem.objects.across_shards().count(), 0)
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertIsNone(self.product.created_by)
+        self.assertIsNone(self.other.created_by)
+
+        job = self.client.get(f"/invoices/api/deletions/{response.data['id']}/").data
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['progress']['invoices'], 5)
+        self.assertEqual(job['progress']['user'], 1)
+        self.assertIsNotNone(job['finished_at'])
+        deleted = self.ChangeLogEntry.objects.filter(model='invoice', action='delete')
+        self.assertEqual({entry.object_id for entry in deleted}, {invoice.id for invoice in self.invoices})
+
+    def test_bulk_invoice_delete(self):
+        self.client.force_authenticate(self.tom)
+        ids = [invoice.id for invoice in self.invoices[:3]]
+        response = self.client.post('/invoices/api/invoices/delete/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['deleted'], 3)
+        listed = [invoice['id'] for invoice in self.client.get('/invoices/api/invoices/').data['results']]
+        self.assertFalse(set(ids) & set(listed))
+        self.assertEqual(self.client.get(f'/invoices/api/invoices/{ids[0]}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Invoice.all_objects.across_shards().filter(pk__in=ids).count(), 3)
+        self.assertEqual(self.ChangeLogEntry.objects.filter(model='invoice', action='delete').count(), 3)
+
+        self.purge()
+        self.assertFalse(Invoice.all_objects.across_shards().filter(pk__in=ids).exists())
+        self.assertEqual(InvoiceItem.objects.across_shards().count(), 2)
+        job = self.client.get(f"/invoices/api/deletions/{response.data['job']['id']}/").data
+        self.assertEqual((job['status'], job['progress']), ('done', {'soft_deleted': 3, 'invoices': 3}))
+
+        # nic do usunięcia - bez zadania; cudze zadania niewidoczne
+        response = self.client.post('/invoices/api/invoices/delete/', {'ids': ids}, format='json')
+        self.assertEqual((response.data['deleted'], response.data['job']), (0, None))
+        job = self.DeletionJob.objects.create(kind='invoices', requested_by=self.admin)
+        self.assertEqual(self.client.get(f'/invoices/api/deletions/{job.id}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_delete_requires_explicit_selection(self):
+        self.client.force_authenticate(self.admin)
+        for body in ({'filter': {}}, {}, {'all': False}, {'ids': [self.other.id], 'all': True}):
+            response = self.client.post('/invoices/api/invoices/delete/', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.assertEqual(Invoice.objects.across_shards().count(), 6)
+        response = self.client.post('/invoices/api/invoices/delete/', {'all': True}, format='json')
+        self.assertEqual(response.data['deleted'], 6)
+        self.assertFalse(Invoice.objects.across_shards().exists())
+
+    def test_failed_job_does_not_stop_worker_and_can_be_retried(self):
+        from . import deletion
+        user_job = deletion.soft_delete_user(self.tom, self.admin)
+        _, invoice_job = deletion.soft_delete_invoices(Invoice.objects.across_shards().filter(pk=self.other.pk))
+        with mock.patch('invoices.deletion._delete_keys', side_effect=RuntimeError("boom")):
+            output = self.purge()
+        self.assertIn(f"#{user_job.pk} przerwane: boom", output)
+        user_job.refresh_from_db()
+        invoice_job.refresh_from_db()
+        self.assertEqual((user_job.status, user_job.error), ('failed', "boom"))
+        self.assertEqual(invoice_job.status, 'done')
+        self.assertTrue(User.objects.filter(pk=self.tom.pk).exists())
+
+        self.purge(retry_failed=True)
+        user_job.refresh_from_db()
+        self.assertEqual((user_job.status, user_job.error), ('done', ''))
+        self.assertFalse(User.objects.filter(pk=self.tom.pk).exists())
+
+    def test_archived_invoices_of_deleted_user_are_hidden(self):
+        from . import deletion
+        from .archive import archive_paid_invoices
+        from .models import ArchivedInvoice
+        Invoice.objects.for_user(self.tom).filter(pk=self.invoices[0].pk).update(status='PAID', date=date(2020, 1, 1))
+        archive_paid_invoices(date(2021, 1, 1))
+        self.client.force_authenticate(self.admin)
+        url = '/invoices/api/invoices/?include_archived=1'
+        self.assertEqual(self.client.get(url).data['count'], 6)
+
+        deletion.soft_delete_user(self.tom, self.admin)
+        self.assertEqual([invoice['id'] for invoice in self.client.get(url).data['results']], [self.other.id])
+        self.purge()
+        self.assertFalse(ArchivedInvoice.objects.for_user(self.tom).exists())
+        self.assertEqual(self.client.get(url).data['count'], 1)
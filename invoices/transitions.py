@@ -0,0 +1,90 @@
+"""
+Zbiorcze zmiany statusu faktur (NEW -> SENT -> PAID) jednym UPDATE na partię id.
+"""
+from django.db import transaction
+
+from invoices import changes
+from invoices.models import Invoice
+from invoices.sharding import per_shard
+
+# status docelowy -> status, z którego wolno do niego przejść
+TRANSITIONS = {
+    'SENT': 'NEW',
+    'PAID': 'SENT',
+}
+
+ID_CHUNK_SIZE = 500  # limit zmiennych w zapytaniu SQLite
+
+
+class TransitionError(ValueError):
+    pass
+
+
+def filter_invoices(queryset, status=None, date_from=None, date_to=None):
+    if status:
+        queryset = queryset.filter(status=status)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset
+
+
+def _update(queryset, source, target, user):
+    """
+    Jeden UPDATE faktur w statusie source; wpisy w kanale zmian zapisujemy
+    wcześniej, w tej samej transakcji, z tego samego zapytania.
+    """
+    queryset = queryset.filter(status=source)
+    changes.record_query(queryset, 'update')
+    return queryset.update(status=target, updated_by=user)
+
+
+def bulk_transition(queryset, target, user, ids=None):
+    """
+    Przestawia status faktur z queryset (zawężonych do ids, jeśli podano)
+    na target. Faktury w statusie, z którego nie ma przejścia, są pomijane.
+    Zwraca {'updated': ..., 'skipped': ..., 'not_found': ...}.
+    """
+    if target not in TRANSITIONS:
+        raise TransitionError(f"Nie można zbiorczo ustawić statusu {target}.")
+    source = TRANSITIONS[target]
+
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+    matched = updated = 0
+    # przy wielu shardach - osobna transakcja w każdym z nich
+    for shard_queryset in per_shard(queryset):
+        with transaction.atomic(using=shard_queryset.db):
+            if ids is None:
+                matched += shard_queryset.count()
+                updated += _update(shard_queryset, source, target, user)
+                continue
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                chunk = shard_queryset.filter(pk__in=ids[start:start + ID_CHUNK_SIZE])
+                matched += chunk.count()
+                updated += _update(chunk, source, target, user)
+
+    return {
+        'updated': updated,
+        'skipped': matched - updated,
+        'not_found': 0 if ids is None else len(ids) - matched,
+    }
+
+
+def invoices_for_user(user):
+    """
+    Faktury widoczne dla użytkownika (tak jak IsOwnerOrAdmin: admin -
+    wszystkie, pozostali - utworzone przez siebie).
+    """
+    queryset = Invoice.objects.all()
+    if user.is_staff:
+        return queryset.across_shards()
+    return queryset.for_user(user).filter(created_by=user)
+
+
+def transition_for_user(user, target, ids=None, **filters):
+    """
+    bulk_transition ograniczone do faktur widocznych dla użytkownika.
+    """
+    return bulk_transition(filter_invoices(invoices_for_user(user), **filters), target, user, ids)
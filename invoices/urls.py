@@ -1,5 +1,8 @@
 from django.urls import path, include
 
+from invoices.views import invoice_events_view
+
 urlpatterns = [
     path('api/', include('invoices.api.urls')),
+    path('events/', invoice_events_view, name='invoice-events'),
 ]
@@ -1,3 +1,212 @@
-from django.shortcuts import render
+import hmac
+import ipaddress
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_GET, require_safe
+
+from invoices import events, metrics
+from invoices.storage import content_hash
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+
+def _may_read_metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    if settings.DEBUG or request.user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in getattr(settings, 'METRICS_ALLOWED_NETWORKS', ()))
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Metryki dla Prometheusa. Poza DEBUG dostępne z nagłówkiem
+    Authorization: Bearer <METRICS_TOKEN>, dla administratora albo z adresów
+    METRICS_ALLOWED_NETWORKS (domyślnie tylko localhost).
+    """
+    if not _may_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _authenticated_user(request):
+    # nie request.auser(): backend graphql_jwt nie ma wersji asynchronicznej
+    if request.user.is_authenticated:
+        return request.user
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@require_GET
+async def invoice_events_view(request):
+    """
+    Strumień SSE zmian faktur użytkownika (zob. invoices.events). Sesja
+    albo Authorization: Bearer <token JWT>; Last-Event-ID wznawia strumień.
+    """
+    if not isinstance(request, ASGIRequest):
+        # pod WSGI Django czyta asynchroniczny iterator synchronicznie -
+        # nieskończony strumień zawiesiłby żądanie i zajął wątek na zawsze
+        return JsonResponse({'detail': 'Strumień zdarzeń wymaga serwera ASGI (invoice_manager.asgi).'},
+                            status=501)
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Wymagane uwierzytelnienie.'}, status=401)
+    response = StreamingHttpResponse(
+        events.stream(user, request.headers.get('Last-Event-ID')), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx nie buforuje strumienia
+    return response
+
+
+def parse_range(header, size):
+    """
+    Zakres z nagłówka Range jako (start, koniec włącznie), None gdy nagłówek
+    pomijamy (brak, inna jednostka, kilka zakresów - wtedy cały plik),
+    albo False gdy zakres jest niespełnialny (416).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # bytes=-N: ostatnie N bajtów
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    modified = parse_http_date_safe(value)
+    return modified is not None and modified == int(mtime)
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+@require_safe
+def media_view(request, path):
+    """
+    Pliki z MEDIA_ROOT z obsługą Range, ETag i nagłówków cache. Pliki
+    adresowane treścią (invoices.storage) dostają Cache-Control immutable.
+    Przy MEDIA_SENDFILE = 'x-sendfile' / 'x-accel-redirect' samo wysłanie
+    pliku (razem z Range) zostawiamy serwerowi przed aplikacją.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    # pliki i katalogi ukryte (np. .tmp/ z niedokończonymi zapisami) nie są publiczne
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    stat = os.stat(fullpath)
+    digest = content_hash(path)
+    etag = f'"{digest}"' if digest else f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    if digest:
+        cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    def finish(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Accept-Ranges'] = 'bytes'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return finish(HttpResponseNotModified())
+
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', None)
+    if sendfile == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Sendfile'] = fullpath
+        return finish(response)
+    if sendfile == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path)
+        return finish(response)
+
+    size = stat.st_size
+    byte_range = None
+    if _if_range_matches(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+    if byte_range is None:
+        return finish(FileResponse(open(fullpath, 'rb'), content_type=content_type))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(fullpath, start, length), status=206, content_type=content_type)
+    response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.headers['Content-Length'] = str(length)
+    return finish(response)